@@ -0,0 +1,70 @@
+"""
+已下载文件集合的内存对比：Python set、CompactStringSet 和限制为 32 MB 的 CompactStringSet
+每种结构在独立子进程中构建，比较构建前后的常驻内存（RSS）增量
+
+用法: python benchmarks/bench_memory.py [元素数量，默认 1000000]
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import sys, time
+sys.path.insert(0, {root!r})
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+from pippi_index import CompactStringSet
+
+n = {n}
+before = rss_kb()
+start = time.perf_counter()
+if {kind!r} == "set":
+    s = set()
+elif {kind!r} == "bounded":
+    # 表满后的元素由 fallback 负责，这里只测内存，fallback 一律返回 False
+    s = CompactStringSet(max_bytes=32 * 1024 * 1024, fallback=lambda item: False)
+else:
+    s = CompactStringSet()
+for i in range(n):
+    # 模拟典型文件名，如 12345678_p0 / img_0001_a3f7c2
+    s.add(f"{{i * 2654435761 % 10**9:09d}}_p{{i % 50}}_img_{{i:08x}}")
+elapsed = time.perf_counter() - start
+hits = sum(1 for i in range(0, n, 997) if f"{{i * 2654435761 % 10**9:09d}}_p{{i % 50}}_img_{{i:08x}}" in s)
+print(rss_kb() - before, elapsed, hits)
+"""
+
+
+def run(kind, n):
+    code = CHILD.format(root=ROOT, n=n, kind=kind)
+    out = subprocess.check_output([sys.executable, "-c", code], text=True)
+    rss_kb, elapsed, hits = out.split()
+    return int(rss_kb), float(elapsed), int(hits)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"元素数量: {n:,}")
+    print(f"{'结构':<30}{'RSS 增量':>12}{'每元素':>10}{'构建耗时':>10}")
+    names = {
+        "set": "set[str]",
+        "compact": "CompactStringSet",
+        "bounded": "CompactStringSet(32 MB 上限)",
+    }
+    for kind, name in names.items():
+        rss_kb, elapsed, _ = run(kind, n)
+        per_item = rss_kb * 1024 / n
+        print(f"{name:<30}{rss_kb / 1024:>10.1f}MB{per_item:>9.1f}B{elapsed:>9.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+# 检查结果
+OK = "ok"
+EMPTY = "empty"  # 0 字节
+TRUNCATED = "truncated"  # 数据不完整
+CORRUPT = "corrupt"  # 结构错误
+MISMATCH = "mismatch"  # 图片完好，但扩展名与实际格式不符
+UNKNOWN = "unknown"  # 不是可识别的图片格式
+
+STATUS_LABELS = {
+    OK: "正常",
+    EMPTY: "空文件",
+    TRUNCATED: "不完整",
+    CORRUPT: "已损坏",
+    MISMATCH: "扩展名不符",
+    UNKNOWN: "不是图片",
+}
+
+# 每种格式对应的扩展名，第一个为改名时使用的扩展名
+FORMAT_EXTENSIONS = {
+    "jpeg": (".jpg", ".jpeg"),
+    "png": (".png",),
+    "gif": (".gif",),
+    "webp": (".webp",),
+    "avif": (".avif",),
+    "bmp": (".bmp",),
+    "tiff": (".tiff", ".tif"),
+}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def detect_format(head):
+    """根据文件头识别图片格式，无法识别时返回 None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(PNG_SIGNATURE):
+        return "png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis", b"mif1", b"msf1"):
+        return "avif"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head.startswith((b"II*\x00", b"MM\x00*")):
+        return "tiff"
+    return None
+
+
+def _find_jpeg_eoi(data):
+    """
+    按标记段结构查找 JPEG 的 EOI 标记，返回其位置，找不到时返回 None
+    SOS 之后是压缩数据，其中的 FF00（转义）和 FFD0-FFD7（RST）不是标记
+    """
+    pos = 2
+    size = len(data)
+    while pos + 1 < size:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # 标记前的填充字节
+            pos += 1
+            continue
+        if marker == 0xD9:
+            return pos
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            pos += 2
+            continue
+        if pos + 4 > size:
+            return None
+        pos += 2 + struct.unpack(">H", data[pos + 2 : pos + 4])[0]
+        if marker != 0xDA:
+            continue
+        # 跳过压缩数据，直到下一个真正的标记
+        while True:
+            pos = data.find(b"\xff", pos)
+            if pos < 0 or pos + 1 >= size:
+                return None
+            following = data[pos + 1]
+            if following == 0x00 or 0xD0 <= following <= 0xD7:
+                pos += 2
+            elif following == 0xFF:
+                pos += 1
+            else:
+                break
+    return None
+
+
+def _check_jpeg(f, size):
+    # 结尾应为 EOI 标记 FFD9，部分软件会在后面补 0
+    f.seek(max(0, size - 1024))
+    tail = f.read().rstrip(b"\x00")
+    if tail.endswith(b"\xff\xd9"):
+        return OK, None
+    # 动态照片、增益图等会在 EOI 之后附加数据，按标记段结构查找 EOI
+    f.seek(0)
+    if _find_jpeg_eoi(f.read()) is None:
+        return TRUNCATED, "缺少 JPEG 结束标记"
+    return OK, None
+
+
+def _check_png(f, size):
+    # 逐个数据块校验 CRC，直到 IEND
+    f.seek(len(PNG_SIGNATURE))
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return TRUNCATED, "缺少 IEND 数据块"
+        length, chunk_type = struct.unpack(">I4s", header)
+        data = f.read(length)
+        crc = f.read(4)
+        if len(data) < length or len(crc) < 4:
+            return TRUNCATED, f"{chunk_type.decode('latin-1')} 数据块不完整"
+        if zlib.crc32(chunk_type + data) != struct.unpack(">I", crc)[0]:
+            return CORRUPT, f"{chunk_type.decode('latin-1')} 数据块 CRC 错误"
+        if chunk_type == b"IEND":
+            return OK, None
+
+
+def _check_gif(f, size):
+    f.seek(size - 1)
+    if f.read(1) != b"\x3b":
+        return TRUNCATED, "缺少 GIF 结束标记"
+    return OK, None
+
+
+def _check_webp(f, size):
+    # RIFF 头中记录了文件长度
+    f.seek(4)
+    declared = struct.unpack("<I", f.read(4))[0] + 8
+    if size < declared:
+        return TRUNCATED, f"应为 {declared} 字节，实际 {size} 字节"
+    return OK, None
+
+
+def _check_avif(f, size):
+    # 顶层 box 的长度之和应等于文件长度
+    offset = 0
+    while offset < size:
+        f.seek(offset)
+        header = f.read(16)
+        if len(header) < 8:
+            return TRUNCATED, "box 头不完整"
+        box_size = struct.unpack(">I", header[:4])[0]
+        if box_size == 1:
+            box_size = struct.unpack(">Q", header[8:16])[0]
+        elif box_size == 0:
+            # 最后一个 box 延伸到文件末尾
+            return OK, None
+        if box_size < 8:
+            return CORRUPT, "box 长度错误"
+        offset += box_size
+    if offset > size:
+        return TRUNCATED, f"应为 {offset} 字节，实际 {size} 字节"
+    return OK, None
+
+
+CHECKERS = {
+    "jpeg": _check_jpeg,
+    "png": _check_png,
+    "gif": _check_gif,
+    "webp": _check_webp,
+    "avif": _check_avif,
+}
+
+
+def check_image(path):
+    """
+    检查一个图片文件，返回 (路径, 结果, 说明, 实际格式)
+    结构完好但扩展名不符时结果为 MISMATCH，说明为应使用的扩展名
+    """
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return path, EMPTY, "0 字节", None
+        with open(path, "rb") as f:
+            fmt = detect_format(f.read(16))
+            if fmt is None:
+                return path, UNKNOWN, "无法识别的文件格式", None
+            checker = CHECKERS.get(fmt)
+            status, detail = checker(f, size) if checker else (OK, None)
+    except (OSError, struct.error) as e:
+        return path, CORRUPT, str(e)[:100], None
+
+    if status == OK:
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in FORMAT_EXTENSIONS[fmt]:
+            return path, MISMATCH, FORMAT_EXTENSIONS[fmt][0], fmt
+    return path, status, detail, fmt
+
+
+def scan_files(folder, extensions):
+    """列出目录中的图片文件（不含以 . 开头的文件）"""
+    with os.scandir(folder) as entries:
+        return [
+            entry.path
+            for entry in entries
+            if entry.is_file()
+            and not entry.name.startswith(".")
+            and os.path.splitext(entry.name)[1].lower() in extensions
+        ]
+
+
+def audit_files(paths, workers=None, progress_callback=None):
+    """
+    用多进程并行检查文件，返回有问题的文件 [(路径, 结果, 说明, 实际格式)]
+    progress_callback(current, total): 每检查完一批文件调用一次
+    """
+    total = len(paths)
+    problems = []
+    if not total:
+        return problems
+
+    workers = workers or os.cpu_count() or 1
+    # 每个进程一次处理一批文件，减少进程间通信
+    chunksize = max(1, min(256, total // (workers * 4)))
+    started = time.monotonic()
+    last_report = started
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, result in enumerate(
+            pool.map(check_image, paths, chunksize=chunksize), 1
+        ):
+            if result[1] != OK:
+                problems.append(result)
+            now = time.monotonic()
+            if done == total or now - last_report >= 1:
+                last_report = now
+                rate = done / max(now - started, 1e-6)
+                print(f"🔍 已检查 {done}/{total}，{rate:.0f} 个/秒")
+                if progress_callback:
+                    progress_callback(done, total)
+    return problems
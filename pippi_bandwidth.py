@@ -0,0 +1,95 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    令牌桶限速（字节/秒）
+    每次读取前预约 n 个字节，返回需要等待的秒数；预约按到达顺序排队，
+    多个传输交替预约小块数据，带宽在它们之间平均分配
+    rate 为 0 表示不限速，可随时通过 set_rate 调整
+    """
+
+    def __init__(self, rate=0, burst=1.0):
+        self.rate = rate
+        # 空闲时最多积累 burst 秒的流量
+        self.burst = burst
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = max(0, rate)
+            self._next = time.monotonic()
+
+    def reserve(self, n):
+        with self._lock:
+            if self.rate <= 0:
+                return 0
+            now = time.monotonic()
+            self._next = max(self._next, now - self.burst) + n / self.rate
+            return max(0.0, self._next - now)
+
+
+class BandwidthLimiter:
+    """
+    全局限速加可选的按域名限速
+    下载循环每读到一块数据调用 throttle，等待由取消令牌负责，停止时立即返回
+    """
+
+    def __init__(self, global_rate=0, host_rates=None):
+        self.global_bucket = TokenBucket(global_rate)
+        self.host_buckets = {}
+        self._lock = threading.Lock()
+        for host, rate in (host_rates or {}).items():
+            self.set_host_rate(host, rate)
+
+    @property
+    def global_rate(self):
+        return self.global_bucket.rate
+
+    def set_global_rate(self, rate):
+        """设置全局限速（字节/秒），0 为不限速"""
+        self.global_bucket.set_rate(rate)
+
+    def set_host_rate(self, host, rate):
+        """设置某个域名的限速（字节/秒），0 为取消该域名的限速"""
+        host = host.lower()
+        with self._lock:
+            if rate > 0:
+                bucket = self.host_buckets.setdefault(host, TokenBucket())
+                bucket.set_rate(rate)
+            else:
+                self.host_buckets.pop(host, None)
+
+    def delay_for(self, host, n):
+        """为 n 个字节预约带宽，返回需要等待的秒数"""
+        wait = self.global_bucket.reserve(n)
+        bucket = self.host_buckets.get(host)
+        if bucket:
+            wait = max(wait, bucket.reserve(n))
+        return wait
+
+    def throttle(self, host, n, token):
+        """等待直到可以继续读取，token 为取消令牌"""
+        wait = self.delay_for(host, n)
+        if wait > 0:
+            token.sleep(wait)
+
+
+SIZE_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+def parse_size(text, default_unit="K"):
+    """解析字节数，如 500、500K、2M、1G，不带单位时按 default_unit 计算"""
+    text = str(text).strip().upper().rstrip("B/S").rstrip("/")
+    if not text:
+        return 0
+    if text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(float(text) * SIZE_UNITS[default_unit])
+
+
+def parse_rate(text):
+    """解析限速值，如 500、500K、2M，返回字节/秒，不带单位时按 KB/s"""
+    return parse_size(text, "K")
@@ -0,0 +1,110 @@
+import itertools
+import socket
+import threading
+from contextlib import contextmanager
+
+
+class DownloadCancelled(Exception):
+    """下载被用户取消"""
+
+
+class CancelToken:
+    """
+    取消令牌
+    在爬虫各处传递，所有等待都用 Event.wait 代替 time.sleep，取消后立即唤醒；
+    正在传输的响应注册到令牌上，取消时直接断开连接，不必等读取超时
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._ids = itertools.count()
+        self._depth = 0
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def reset(self):
+        """开始新的任务前清除取消状态"""
+        with self._lock:
+            self._event.clear()
+            self._callbacks.clear()
+
+    @contextmanager
+    def running(self):
+        """
+        一次运行的范围，爬取入口用 with token.running() 包住
+        最外层开始时清除上一次 cancel() 的状态，停止后同一个爬虫还能开始新的爬取；
+        嵌套的运行（如图集中的单页爬取、关注模式中的图集爬取）不清除，不会吞掉正在进行的停止
+        """
+        with self._lock:
+            if self._depth == 0:
+                self._event.clear()
+                self._callbacks.clear()
+            self._depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._depth -= 1
+
+    def check(self):
+        """已取消时抛出 DownloadCancelled"""
+        if self._event.is_set():
+            raise DownloadCancelled()
+
+    def sleep(self, seconds):
+        """可中断的等待，被取消时抛出 DownloadCancelled"""
+        if seconds > 0 and self._event.wait(seconds):
+            raise DownloadCancelled()
+        self.check()
+
+    def register(self, callback):
+        """注册取消时调用的函数，返回用于 unregister 的编号；已取消时立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                handle = next(self._ids)
+                self._callbacks[handle] = callback
+                return handle
+        callback()
+        return None
+
+    def unregister(self, handle):
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+
+def abort_response(response):
+    """
+    立即断开正在读取的响应
+    只调用 close() 时另一个线程阻塞在 recv 上不会被唤醒，需要先 shutdown 套接字
+    """
+    try:
+        connection = getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is None:
+            fp = getattr(response.raw, "_fp", None)
+            sock = getattr(getattr(getattr(fp, "fp", None), "raw", None), "_sock", None)
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except Exception:
+        pass
+    try:
+        response.close()
+    except Exception:
+        pass
@@ -0,0 +1,360 @@
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+from pippi_bandwidth import parse_rate, parse_size
+from pippi_core import RobustImageSpider
+from pippi_dist import DistributedWorker, submit_targets
+from pippi_pack import PackStore
+from pippi_queue import GLOBAL, open_queue
+from pippi_watch import Watcher, Watchlist, format_interval, parse_interval
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="pippi_cli.py", description="皮皮蛛命令行版：下载网页或图集中的图片"
+    )
+    parser.add_argument("urls", nargs="*", help="目标链接，可以输入多个")
+    parser.add_argument("-o", "--folder", default="pippi_images", help="保存目录")
+    parser.add_argument(
+        "--follow-pages", action="store_true", help="跟随分页爬取整个图集"
+    )
+    parser.add_argument("--max-pages", type=int, default=50, help="最多爬取的页数")
+    parser.add_argument("--workers", type=int, default=4, help="同时下载的线程数")
+    parser.add_argument(
+        "--priority",
+        default="fifo",
+        choices=["fifo", "original", "small", "newest"],
+        help="下载顺序",
+    )
+    parser.add_argument("--limit", help="全局限速，如 500（KB/s）、2M，0 为不限速")
+    parser.add_argument(
+        "--host-limit",
+        action="append",
+        default=[],
+        metavar="HOST=RATE",
+        help="按域名限速，如 i.pximg.net=1M，可以重复",
+    )
+    parser.add_argument(
+        "--connect-timeout", type=float, default=10, help="连接超时（秒），默认 10"
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=20,
+        help="读取超时（秒）：超过这么久收不到任何数据时中止，默认 20",
+    )
+    parser.add_argument(
+        "--total-timeout",
+        type=float,
+        default=300,
+        help="单张图片的传输总时限（秒，不含限速等待），0 为不限，默认 300",
+    )
+    parser.add_argument(
+        "--min-speed",
+        default="4",
+        help="最低速度，如 4（KB/s）、1M：连续 10 秒低于该速度时中止并稍后重试，0 为不检测",
+    )
+    parser.add_argument(
+        "--hedge",
+        type=float,
+        default=0,
+        metavar="PERCENTILE",
+        help="备用请求：耗时超过最近下载耗时的该分位数（如 95）时再请求一次，先完成的胜出，默认关闭",
+    )
+    parser.add_argument(
+        "--replay-failed", action="store_true", help="重新下载上次导出的失败图片"
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="分包输出：按图集写入 tar 分包，而不是单独的文件",
+    )
+    parser.add_argument(
+        "--pack-size",
+        default="512M",
+        help="每个分包的最大大小，如 512M、2G，不带单位时按 MB，默认 512M",
+    )
+    parser.add_argument(
+        "--unpack", metavar="DEST", help="把保存目录中的分包解包到 DEST 后退出"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="试运行：只解析页面并生成下载计划（文件名、已存在、预计大小），不下载图片",
+    )
+    parser.add_argument(
+        "--watch-add", action="store_true", help="把目标链接加入关注列表后退出"
+    )
+    parser.add_argument(
+        "--watch-remove", action="store_true", help="把目标链接从关注列表中删除后退出"
+    )
+    parser.add_argument("--watch-list", action="store_true", help="显示关注列表后退出")
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="关注模式：按计划检查关注列表，只下载新图片，直到按 Ctrl+C",
+    )
+    parser.add_argument(
+        "--watch-once",
+        action="store_true",
+        help="检查一次关注列表中到期的来源后退出（适合用 cron 定时运行）",
+    )
+    parser.add_argument(
+        "--interval",
+        default="1h",
+        help="关注来源的检查间隔，如 30m、2h、1d，默认 1h",
+    )
+    parser.add_argument(
+        "--audit", action="store_true", help="检查保存目录中的图片是否完整后退出"
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="检查并修复：改正扩展名，隔离损坏的图片并加入失败列表，之后用 --replay-failed 重新下载",
+    )
+    parser.add_argument(
+        "--audit-workers", type=int, help="检查图片使用的进程数，默认为 CPU 核数"
+    )
+    parser.add_argument(
+        "--no-journal", action="store_true", help="不使用任务日志（不支持断点恢复）"
+    )
+    parser.add_argument(
+        "--queue",
+        metavar="SPEC",
+        help="分布式队列：sqlite:///path/queue.db（单机多进程）或 redis://host:6379/0（多机），"
+        "带目标链接时把链接加入队列",
+    )
+    parser.add_argument(
+        "--worker", action="store_true", help="作为工作节点从分布式队列领取任务下载"
+    )
+    parser.add_argument(
+        "--wait", action="store_true", help="工作节点在队列清空后继续等待新任务"
+    )
+    parser.add_argument(
+        "--lease", type=int, default=60, help="工作节点领取任务的租约秒数，默认 60"
+    )
+    parser.add_argument(
+        "--queue-status", action="store_true", help="显示分布式队列的任务统计后退出"
+    )
+    return parser
+
+
+def parse_host_limits(items):
+    rates = {}
+    for item in items:
+        host, _, rate = item.partition("=")
+        if not host or not rate:
+            raise ValueError(f"按域名限速格式应为 HOST=RATE: {item}")
+        rates[host.strip()] = parse_rate(rate)
+    return rates
+
+
+def watch_commands(spider):
+    """
+    运行中从标准输入读取命令调整限速：
+      limit 500          全局限速 500 KB/s（0 为不限速）
+      limit HOST 1M      某个域名限速
+      stop               停止下载
+    """
+    for line in sys.stdin:
+        parts = line.split()
+        try:
+            if parts[:1] == ["limit"] and len(parts) == 2:
+                spider.bandwidth.set_global_rate(parse_rate(parts[1]))
+                print(f"⚙️ 全局限速已调整为 {parts[1]}")
+            elif parts[:1] == ["limit"] and len(parts) == 3:
+                spider.bandwidth.set_host_rate(parts[1], parse_rate(parts[2]))
+                print(f"⚙️ {parts[1]} 限速已调整为 {parts[2]}")
+            elif parts[:1] == ["stop"]:
+                spider.stop()
+                return
+        except ValueError as e:
+            print(f"⚠️ 无效的命令: {e}")
+
+
+def apply_timeouts(spider, args):
+    spider.connect_timeout = args.connect_timeout
+    spider.read_timeout = args.read_timeout
+    spider.total_timeout = args.total_timeout
+    spider.min_speed = parse_rate(args.min_speed)
+    spider.hedge_percentile = args.hedge
+
+
+def open_watchlist(folder):
+    return Watchlist(Path(folder) / ".pippi_watch.db")
+
+
+def edit_watchlist(parser, args):
+    watchlist = open_watchlist(args.folder)
+    try:
+        if args.watch_add:
+            if not args.urls:
+                parser.error("请输入要关注的链接")
+            try:
+                interval = parse_interval(args.interval)
+            except ValueError:
+                parser.error(f"无效的检查间隔: {args.interval}")
+            for url in args.urls:
+                watchlist.add(url, interval, args.follow_pages, args.max_pages)
+            print(f"👀 已关注 {len(args.urls)} 个来源，每 {args.interval} 检查一次")
+        if args.watch_remove:
+            removed = sum(watchlist.remove(url) for url in args.urls)
+            print(f"🗑️ 已取消关注 {removed} 个来源")
+        if args.watch_list:
+            now = time.time()
+            for s in watchlist.sources():
+                due = max(0, s["next_check"] - now)
+                status = f"⚠️ {s['last_error'][:30]}" if s["last_error"] else ""
+                print(
+                    f"{s['url']}  每 {format_interval(s['interval'])}，"
+                    f"{format_interval(int(due) // 60 * 60)} 后检查，累计新图片 {s['new_total']} {status}"
+                )
+    finally:
+        watchlist.close()
+    return 0
+
+
+def run_watch(args):
+    spider = RobustImageSpider(
+        args.folder,
+        use_journal=not args.no_journal,
+        max_workers=args.workers,
+        priority=args.priority,
+        bandwidth_limit=parse_rate(args.limit or 0),
+        host_bandwidth=parse_host_limits(args.host_limit),
+    )
+    apply_timeouts(spider, args)
+    watchlist = open_watchlist(args.folder)
+    watcher = Watcher(spider, watchlist)
+    try:
+        if args.watch_once:
+            watcher.poll()
+        else:
+            watcher.run()
+    except KeyboardInterrupt:
+        spider.stop()
+        print("⏹️ 已停止关注")
+        return 130
+    finally:
+        watchlist.close()
+    return 0
+
+
+def run_queue(parser, args):
+    """分布式模式：加入目标链接、查看队列或作为工作节点运行"""
+    try:
+        work_queue = open_queue(args.queue)
+        # 指定的限速写入队列，所有节点共享
+        if args.limit is not None:
+            work_queue.set_rate(GLOBAL, parse_rate(args.limit))
+        for host, rate in parse_host_limits(args.host_limit).items():
+            work_queue.set_rate(host, rate)
+    except (RuntimeError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.urls:
+        submit_targets(work_queue, args.urls, args.follow_pages, args.max_pages)
+    if args.queue_status:
+        counts = work_queue.stats()
+        print(
+            f"📊 待执行 {counts['pending']}, 执行中 {counts['leased']}, "
+            f"已完成 {counts['done']}, 失败 {counts['failed']}"
+        )
+    if not args.worker:
+        return 0
+    if args.pack or args.replay_failed:
+        parser.error("工作节点暂不支持 --pack 和 --replay-failed")
+
+    spider = RobustImageSpider(
+        args.folder,
+        use_journal=not args.no_journal,
+        max_workers=args.workers,
+        priority=args.priority,
+    )
+    apply_timeouts(spider, args)
+    worker = DistributedWorker(spider, work_queue, lease=args.lease)
+    if sys.stdin and sys.stdin.isatty():
+        threading.Thread(target=watch_commands, args=(spider,), daemon=True).start()
+    try:
+        worker.run(wait=args.wait)
+    except KeyboardInterrupt:
+        worker.stop()
+        print("⏹️ 已停止，未完成的任务会在租约到期后由其他节点接手")
+        return 130
+    finally:
+        work_queue.close()
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not 0 <= args.hedge < 100:
+        parser.error("--hedge 应在 0 到 100 之间")
+    if args.unpack:
+        store = PackStore(Path(args.folder) / "packs")
+        count = store.export(args.unpack)
+        store.close()
+        print(f"📦 已解包 {count} 张图片到: {args.unpack}")
+        return 0
+
+    if args.watch_add or args.watch_remove or args.watch_list:
+        return edit_watchlist(parser, args)
+
+    if args.audit or args.repair:
+        spider = RobustImageSpider(args.folder, use_journal=not args.no_journal)
+        problems = spider.audit_library(repair=args.repair, workers=args.audit_workers)
+        return 1 if problems and not args.repair else 0
+
+    if args.queue:
+        return run_queue(parser, args)
+    if args.worker or args.queue_status:
+        parser.error("--worker 和 --queue-status 需要同时指定 --queue")
+
+    if args.watch or args.watch_once:
+        return run_watch(args)
+
+    if not args.urls and not args.replay_failed:
+        parser.error("请输入目标链接")
+
+    try:
+        spider = RobustImageSpider(
+            args.folder,
+            use_journal=not args.no_journal,
+            max_workers=args.workers,
+            priority=args.priority,
+            bandwidth_limit=parse_rate(args.limit or 0),
+            host_bandwidth=parse_host_limits(args.host_limit),
+            output="pack" if args.pack else "files",
+            pack_size=parse_size(args.pack_size, "M"),
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    spider.dry_run = args.dry_run
+    apply_timeouts(spider, args)
+
+    if sys.stdin and sys.stdin.isatty():
+        threading.Thread(target=watch_commands, args=(spider,), daemon=True).start()
+
+    try:
+        if args.replay_failed:
+            spider.replay_failed()
+        for url in args.urls:
+            if spider.cancel_token.cancelled:
+                break
+            if args.follow_pages:
+                spider.crawl_gallery(url, max_pages=args.max_pages)
+            else:
+                spider.crawl(url)
+    except KeyboardInterrupt:
+        spider.stop()
+        print("⏹️ 已停止，进度已保存到任务日志")
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,68 @@
 import requests
 from bs4 import BeautifulSoup
+import os
 import re
 import time
 import random
 import hashlib
-from urllib.parse import urlparse, unquote
+import queue
+import threading
+from collections import Counter
+from urllib.parse import urlparse, unquote, urljoin
 from pathlib import Path
 
+from pippi_journal import CrawlJournal
+from pippi_frontier import CrawlFrontier
+from pippi_index import CompactStringSet
+from pippi_scheduler import HostScheduler
+from pippi_bandwidth import BandwidthLimiter
+from pippi_pack import FileSink, PackStore
+from pippi_cancel import CancelToken, DownloadCancelled, abort_response
+from pippi_latency import HedgedRequest, LatencyTracker, StallDetector, StalledError
+from pippi_audit import MISMATCH, STATUS_LABELS, audit_files, scan_files
+from pippi_plan import (
+    EXISTS,
+    FINISHED,
+    NEW,
+    DownloadPlan,
+    PlanItem,
+    format_size,
+    resolve_collisions,
+)
+from pippi_retry import (
+    CircuitBreaker,
+    FATAL,
+    RETRY,
+    backoff_delay,
+    classify_error,
+    retry_after,
+)
+
+# "下一页"链接常见的文字
+NEXT_PAGE_TEXTS = ("下一页", "下页", "后页", "next", "next page", "›", "»", ">")
+
 
 class RobustImageSpider:
-    def __init__(self, download_folder="pippi_images"):
+    # 已下载文件索引的内存上限，约可保存 2200 万个文件名
+    INDEX_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(
+        self,
+        download_folder="pippi_images",
+        use_journal=True,
+        max_workers=4,
+        priority="fifo",
+        per_host_limit=1,
+        bandwidth_limit=0,
+        host_bandwidth=None,
+        output="files",
+        pack_size=512 * 1024 * 1024,
+        session=None,
+        existing_files=None,
+    ):
         self.download_folder = Path(download_folder)
-        self.session = requests.Session()
+        # 多个任务并行时共享同一个会话（连接池）和已下载文件索引
+        self.session = session or requests.Session()
 
         self.user_agents = [
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -37,6 +88,7 @@ class RobustImageSpider:
         self.downloaded_count = 0
         self.skipped_count = 0
         self.failed_count = 0
+        self.bytes_downloaded = 0
         self.image_extensions = (
             ".jpg",
             ".jpeg",
@@ -45,18 +97,99 @@ class RobustImageSpider:
             ".gif",
             ".bmp",
             ".tiff",
+            ".avif",
         )
-        self.existing_files = self._load_existing_files()
+        # 分包输出：图片按图集流式写入 tar 分包，适合海量小文件的网络存储
+        self.pack = None
+        if output == "pack":
+            self.pack = PackStore(self.download_folder / "packs", pack_size)
+        if existing_files is None:
+            existing_files = self._load_existing_files()
+        self.existing_files = existing_files
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+        # 下载调度：不同域名的图片并行下载，同一域名同时只下载 per_host_limit 张
+        # priority 可选 fifo/original/small/newest，见 pippi_scheduler.PRIORITY_RULES
+        self.max_workers = max_workers
+        self.priority = priority
+        self.per_host_limit = per_host_limit
+        # 多个任务并行时共享的域名并发名额（pippi_scheduler.HostSlots），None 为不共享
+        self.host_slots = None
+
+        # 失败重试：可重试的错误进入延迟队列，连续失败的域名熔断暂停
+        self.retries = 3
+        self.breaker = CircuitBreaker()
+        self.failed_urls = []
+
+        # 取消令牌：stop() 后所有等待立即结束，正在传输的连接直接断开
+        self.cancel_token = CancelToken()
+
+        # 带宽限制（字节/秒）：全局上限和按域名上限，运行中可通过 self.bandwidth 调整
+        self.bandwidth = BandwidthLimiter(bandwidth_limit, host_bandwidth)
+
+        # 超时（秒）：连接超时、读取超时（两次收到数据的最长间隔）、单张图片的传输总时限（0 为不限）
+        # 卡顿检测：每 stall_window 秒的平均速度低于 min_speed（字节/秒）时中止并稍后重试
+        # 备用请求：hedge_percentile 为 0 时关闭，否则耗时超过最近下载耗时的该分位数时再请求一次
+        self.connect_timeout = 10
+        self.read_timeout = 20
+        self.total_timeout = 300
+        self.min_speed = 4 * 1024
+        self.stall_window = 10
+        self.hedge_percentile = 0
+        self.latency = LatencyTracker()
+
+        # 试运行：只解析页面、生成下载计划（文件名、是否已存在、预计大小），不下载图片
+        self.dry_run = False
+        self.plan_counts = Counter()
+        self.plan_bytes = 0
+
+        # 任务日志：记录提取结果和每张图片的状态，中断后可从断点继续
+        self.journal = None
+        if use_journal:
+            self.journal = CrawlJournal(self.download_folder / ".pippi_journal.db")
 
     def _load_existing_files(self):
-        existing = set()
+        # 只保存文件名的哈希，最多占用 INDEX_MAX_BYTES；命中由磁盘确认，表满后未命中也查磁盘
+        existing = CompactStringSet(
+            max_bytes=self.INDEX_MAX_BYTES, fallback=self._on_disk
+        )
+        count = 0
         if self.download_folder.exists():
-            for f in self.download_folder.iterdir():
-                if f.is_file():
-                    existing.add(f.stem)
-        print(f"📂 发现 {len(existing)} 个已下载的文件，将自动跳过")
+            with os.scandir(self.download_folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.startswith("."):
+                        existing.add(os.path.splitext(entry.name)[0])
+                        count += 1
+        if self.pack:
+            for stem in self.pack.stems():
+                existing.add(stem)
+                count += 1
+        print(f"📂 发现 {count} 个已下载的文件，将自动跳过")
         return existing
 
+    @property
+    def last_error(self):
+        """当前线程最近一次下载失败的原因"""
+        return getattr(self._local, "last_error", None)
+
+    @last_error.setter
+    def last_error(self, value):
+        self._local.last_error = value
+
+    def _incr(self, name, amount=1):
+        # 多个下载线程共享计数器
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def stop(self):
+        """立即停止：中断等待和正在进行的下载，删除未完成的文件"""
+        self.cancel_token.cancel()
+
+    def _sleep(self, seconds):
+        # 可中断的等待，停止时抛出 DownloadCancelled
+        self.cancel_token.sleep(seconds)
+
     def _get_random_delay(self, min_sec=1.5, max_sec=3.5):
         return random.uniform(min_sec, max_sec)
 
@@ -127,17 +260,31 @@ class RobustImageSpider:
         return headers
 
     def get_page(self, url, retries=3):
+        token = self.cancel_token
         for attempt in range(retries):
             try:
-                time.sleep(self._get_random_delay(0.5, 1.5))
+                self._sleep(self._get_random_delay(0.5, 1.5))
                 headers = self._get_headers_for_url(url, is_image=False)
-                r = self.session.get(url, headers=headers, timeout=15)
-                r.raise_for_status()
-                return r.text
+                r = self.session.get(url, headers=headers, timeout=15, stream=True)
+                handle = token.register(lambda: abort_response(r))
+                try:
+                    r.raise_for_status()
+                    return r.text
+                finally:
+                    token.unregister(handle)
+                    r.close()
             except Exception as e:
+                if token.cancelled:
+                    return None
                 print(f"  ⚠️ 获取失败 (尝试 {attempt + 1}/{retries}): {str(e)[:50]}")
+                if classify_error(e) == FATAL:
+                    # 404/403 等错误重试也不会成功
+                    break
                 if attempt < retries - 1:
-                    time.sleep(2**attempt)
+                    try:
+                        self._sleep(retry_after(e) or backoff_delay(attempt))
+                    except DownloadCancelled:
+                        return None
         return None
 
     def extract_images(self, html, base_url=None):
@@ -212,13 +359,7 @@ class RobustImageSpider:
             if images:
                 print(f"  ✓ Photos18.com 解析找到 {len(images)} 张图片")
                 # 去重后返回
-                seen = set()
-                cleaned = []
-                for url in images:
-                    if url and url not in seen:
-                        seen.add(url)
-                        cleaned.append(url)
-                return cleaned
+                return self._dedup(images)
 
         # === FoamGirl.net 特殊处理 ===
         if "foamgirl.net" in base_url.lower():
@@ -284,13 +425,7 @@ class RobustImageSpider:
             if images:
                 print(f"  ✓ FoamGirl.net 解析找到 {len(images)} 张图片")
                 # 去重后返回
-                seen = set()
-                cleaned = []
-                for url in images:
-                    if url and url not in seen:
-                        seen.add(url)
-                        cleaned.append(url)
-                return cleaned
+                return self._dedup(images)
         if self._is_pixiv_url(base_url):
             illust_id = None
             match = re.search(r"artworks/(\d+)", base_url)
@@ -376,14 +511,11 @@ class RobustImageSpider:
                 print(f"  ✓ 通用解析找到 {len(images)} 张图片")
 
         # 去重
-        seen = set()
-        cleaned = []
-        for url in images:
-            if url and url not in seen:
-                seen.add(url)
-                cleaned.append(url)
+        return self._dedup(images)
 
-        return cleaned
+    def _dedup(self, images):
+        """保持顺序去重（dict 保留插入顺序），去掉空链接"""
+        return [url for url in dict.fromkeys(images) if url]
 
     def _is_direct_image_url(self, url):
         """检查URL是否是直接的图片链接"""
@@ -396,7 +528,7 @@ class RobustImageSpider:
                 return True
 
             # 检查URL路径中是否包含图片格式
-            if any(ext in path for ext in self.image_extensions + (".avif",)):
+            if any(ext in path for ext in self.image_extensions):
                 return True
 
             return False
@@ -416,10 +548,6 @@ class RobustImageSpider:
                 name = Path(clean_name).stem[:50]
                 ext = Path(clean_name).suffix.lower()
 
-                # 处理avif格式，转换为jpg
-                if ext == ".avif":
-                    ext = ".jpg"
-
                 if ext not in self.image_extensions:
                     ext = ".jpg"
 
@@ -432,116 +560,916 @@ class RobustImageSpider:
         url_hash = hashlib.md5(url.encode()).hexdigest()[:6]
         return f"img_{index:04d}_{url_hash}", ".jpg"
 
+    def _in_folder(self, filename_stem):
+        return any(
+            (self.download_folder / f"{filename_stem}{ext}").exists()
+            for ext in self.image_extensions
+        )
+
+    def _on_disk(self, filename_stem):
+        """在分包索引和保存目录中确认文件是否存在，分包模式下先查分包索引"""
+        if self.pack and self.pack.contains(filename_stem):
+            return True
+        return self._in_folder(filename_stem)
+
     def _is_exists(self, filename_stem):
         if filename_stem in self.existing_files:
             return True
-        for ext in self.image_extensions:
-            if (self.download_folder / f"{filename_stem}{ext}").exists():
-                return True
-        return False
-
-    def download_image(self, url, index, retries=3):
-        filename_stem, ext = self._get_filename(url, index)
+        # 未命中时仍要检查：可能是启动后其他任务保存的文件；
+        # 分包模式下图片只写入分包，只查一次分包索引，不再逐个扩展名检查目录
+        if self.pack:
+            return self.pack.contains(filename_stem)
+        return self._in_folder(filename_stem)
+
+    def _open_output(self, filename, group):
+        """打开图片的输出位置：普通文件或所在图集的分包"""
+        if self.pack:
+            return self.pack.open_entry(PackStore.group_key(group or ""), filename)
+        return FileSink(self.download_folder / filename)
+
+    def _attempt_download(self, url, index, group=None, filename=None):
+        """
+        下载一次，不重试，group 为分包输出时所属的图集链接
+        filename 为下载计划中的 (文件名, 扩展名)，计划阶段已检查过文件是否存在
+        返回 (结果, 异常)，结果为 "done"/"skipped"/"cancelled"/RETRY/FATAL
+        """
+        if filename:
+            filename_stem, ext = filename
+            exists = filename_stem in self.existing_files
+        else:
+            filename_stem, ext = self._get_filename(url, index)
+            exists = self._is_exists(filename_stem)
 
-        if self._is_exists(filename_stem):
-            self.skipped_count += 1
+        if exists:
+            self._incr("skipped_count")
             print(f"  ⏭️  [{index}] {filename_stem}{ext} (已存在)")
-            return True
+            return "skipped", None
 
-        for attempt in range(retries):
+        token = self.cancel_token
+        sink = None
+        try:
+            delay = min(1.5 + self.downloaded_count * 0.03, 5)
+            self._sleep(random.uniform(delay, delay + 1.5))
+
+            # 使用URL特定的请求头（Pixiv会添加Referer）
+            headers = self._get_headers_for_url(url, is_image=True)
+
+            # 针对Pixiv的特殊处理：可能需要禁用SSL验证
+            verify_ssl = True
+            if self._is_pixiv_url(url):
+                # Pixiv有时会有SSL证书问题，可以选择禁用验证
+                # 注意：生产环境建议保持True，除非确实遇到证书错误
+                pass  # 保持True，如果遇到问题可以改为False
+
+            started = time.monotonic()
+            r = self.session.get(
+                url,
+                headers=headers,
+                timeout=(self.connect_timeout, self.read_timeout),
+                stream=True,
+                verify=verify_ssl,
+            )
+            # 停止时直接断开连接，不必等到读取超时
+            handle = token.register(lambda: abort_response(r))
+            hedge = None
             try:
-                delay = min(1.5 + self.downloaded_count * 0.03, 5)
-                time.sleep(random.uniform(delay, delay + 1.5))
-
-                # 使用URL特定的请求头（Pixiv会添加Referer）
-                headers = self._get_headers_for_url(url, is_image=True)
-
-                # 针对Pixiv的特殊处理：可能需要禁用SSL验证
-                verify_ssl = True
-                if self._is_pixiv_url(url):
-                    # Pixiv有时会有SSL证书问题，可以选择禁用验证
-                    # 注意：生产环境建议保持True，除非确实遇到证书错误
-                    pass  # 保持True，如果遇到问题可以改为False
-
-                r = self.session.get(
-                    url, headers=headers, timeout=20, stream=True, verify=verify_ssl
-                )
                 r.raise_for_status()
+                host = HostScheduler.host_of(url)
+                sink = self._open_output(f"{filename_stem}{ext}", group or url)
+                hedge = self._start_hedge(url, headers, r, started)
+                total_size = self._receive(r, sink, host, hedge)
+            finally:
+                token.unregister(handle)
+                r.close()
+                if hedge:
+                    hedge.cancel()
+                    if hedge.launched:
+                        self.latency.incr("hedged")
+
+            if total_size < 1024:
+                raise ValueError("文件过小")
+            sink.commit()
+            self.latency.record(time.monotonic() - started)
+
+            self.existing_files.add(filename_stem)
+            self._incr("downloaded_count")
+            if self.journal:
+                self.journal.record_sizes({url: total_size})
+
+            size_kb = total_size / 1024
+            print(f"  ✓ [{index}] {filename_stem}{ext} ({size_kb:.1f} KB)")
+            return "done", None
+
+        except Exception as e:
+            # 不保留不完整的文件
+            if sink:
+                sink.abort()
+            if token.cancelled:
+                return "cancelled", None
+            return classify_error(e), e
+
+    def _new_stall_detector(self):
+        return StallDetector(self.min_speed, self.stall_window, self.total_timeout)
+
+    def _count_chunk(self, host, n, stall):
+        """统计并限速收到的一块数据，限速等待的时间不计入卡顿检测"""
+        self._incr("bytes_downloaded", n)
+        self._throttle_chunk(host, n, stall)
+
+    def _throttle_chunk(self, host, n, stall):
+        """
+        只限速不统计：备用请求的数据可能与主请求重叠或最终落选，
+        胜出后由 _receive 按实际写入的字节数统计
+        """
+        stall.pause()
+        try:
+            self.bandwidth.throttle(host, n, self.cancel_token)
+        finally:
+            stall.resume()
+
+    def _start_hedge(self, url, headers, primary, started):
+        """开启备用请求，在耗时达到最近下载耗时的 hedge_percentile 分位数时发出"""
+        if not self.hedge_percentile:
+            return None
+        delay = self.latency.hedge_delay(self.hedge_percentile)
+        if delay is None:
+            return None
+        host = HostScheduler.host_of(url)
+        hedge = HedgedRequest(
+            self.session,
+            url,
+            headers,
+            (self.connect_timeout, self.read_timeout),
+            primary,
+            max(0.0, delay - (time.monotonic() - started)),
+            lambda n, stall: self._throttle_chunk(host, n, stall),
+            self._new_stall_detector,
+        )
+        hedge.begin()
+        return hedge
 
-                filepath = self.download_folder / f"{filename_stem}{ext}"
-                total_size = 0
-
-                with open(filepath, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            total_size += len(chunk)
-
-                if total_size < 1024:
-                    filepath.unlink()
-                    raise ValueError("文件过小")
-
-                self.existing_files.add(filename_stem)
-                self.downloaded_count += 1
+    def _receive(self, r, sink, host, hedge=None):
+        """
+        读取响应写入 sink，返回文件大小
+        速度过慢或超过总时限时抛出 StalledError；有备用请求时，先完成的一方胜出
+        """
+        token = self.cancel_token
+        stall = self._new_stall_detector()
+        stall.watch(r)
+        written = 0
+        try:
+            for chunk in r.iter_content(chunk_size=8192):
+                token.check()
+                if hedge and hedge.won:
+                    break
+                if chunk:
+                    sink.write(chunk)
+                    written += len(chunk)
+                    if hedge:
+                        hedge.offset = written
+                    stall.update(len(chunk))
+                    self._count_chunk(host, len(chunk), stall)
+            # 连接被断开时读取可能直接结束而不抛出异常
+            token.check()
+            stall.check()
+        except DownloadCancelled:
+            raise
+        except Exception as e:
+            error = stall.error or e
+            if isinstance(error, StalledError):
+                self.latency.incr("stalls")
+            if not hedge or not hedge.launched:
+                raise error
+            # 主请求失败或被备用请求断开，等待备用请求的结果
+            hedge.wait(token)
+            if not hedge.won:
+                raise error
+        finally:
+            stall.close()
+        if hedge and not hedge.cancel():
+            self.latency.incr("hedge_wins")
+            size = hedge.write_rest(sink, written)
+            self._incr("bytes_downloaded", size - written)
+            return size
+        return written
 
-                size_kb = total_size / 1024
-                print(f"  ✓ [{index}] {filename_stem}{ext} ({size_kb:.1f} KB)")
+    def download_image(self, url, index, retries=3):
+        """
+        下载单张图片，失败时在当前线程中退避重试
+        批量下载走 _download_job，失败的图片进入延迟重试队列，不会阻塞其他图片
+        """
+        self.last_error = None
+        for attempt in range(retries):
+            result, error = self._attempt_download(url, index)
+            if result in ("done", "skipped"):
                 return True
+            if result == "cancelled":
+                return False
 
-            except Exception as e:
-                if attempt < retries - 1:
-                    time.sleep(2**attempt + random.uniform(0, 1))
-                else:
-                    self.failed_count += 1
-                    print(f"  ❌ [{index}] 失败: {str(e)[:40]}")
+            if result == FATAL or attempt == retries - 1:
+                self._incr("failed_count")
+                self.last_error = str(error)[:200]
+                print(f"  ❌ [{index}] 失败: {str(error)[:40]}")
+                return False
+
+            try:
+                self._sleep(retry_after(error) or backoff_delay(attempt))
+            except DownloadCancelled:
+                return False
 
         return False
 
-    def crawl(self, target_url):
-        print(f"\n{'=' * 60}")
-        print(f"🚀 爬取: {target_url}")
-        print(f"📁 目录: {self.download_folder.absolute()}")
-        print(f"{'=' * 60}\n")
+    def _load_job_images(self, target_url):
+        """
+        获取任务的图片列表
+        任务日志中有未完成的记录时直接复用，不再重新获取和解析页面
+        """
+        if self.journal:
+            images = self.journal.load_images(target_url)
+            if images:
+                print(f"📒 从任务日志恢复 {len(images)} 张图片，继续上次的进度")
+                return images
 
         # 检查是否是直接的图片链接
         if self._is_direct_image_url(target_url):
             print("🎯 检测到直接图片链接，开始下载...")
-            self.download_image(target_url, 1)
-            total = self.downloaded_count + self.skipped_count + self.failed_count
-            print(f"\n{'=' * 60}")
+            images = [target_url]
+        else:
+            # 原有逻辑：从HTML页面提取图片链接
+            html = self.get_page(target_url)
+            if not html:
+                print("❌ 获取页面失败")
+                return None
+
+            images = self.extract_images(html, base_url=target_url)
+            if not images:
+                print("❌ 未找到任何图片")
+                return None
+
+        if self.journal:
+            self.journal.record_images(target_url, images)
+        return images
+
+    def find_next_pages(self, html, base_url):
+        """
+        从页面中找出同一图集的其他分页链接
+        依次使用 rel=next、站点特定规则、"下一页"文字和分页容器中的页码
+        """
+        if self._is_pixiv_url(base_url):
+            # Pixiv API 一次返回作品的全部分页
+            return []
+
+        soup = BeautifulSoup(html, "html.parser")
+        base = urlparse(base_url)
+        host = base.netloc.lower()
+        links = []
+
+        def add(href):
+            if not href or href.startswith(("javascript:", "#", "mailto:")):
+                return
+            url = urljoin(base_url, href).split("#")[0]
+            if urlparse(url).netloc.lower() != host:
+                return
+            if self._is_direct_image_url(url) or url == base_url:
+                return
+            if url not in links:
+                links.append(url)
+
+        # 方法1: rel="next"
+        for tag in soup.find_all(["link", "a"], rel=True):
+            if "next" in [r.lower() for r in tag.get("rel")]:
+                add(tag.get("href"))
+
+        # 方法2: 站点特定规则
+        if self._is_foamgirl_url(base_url):
+            # FoamGirl 图集分页形如 /12345.html -> /12345_2.html
+            match = re.search(r"/(\d+)(?:_\d+)?\.html$", base.path)
+            if match:
+                pattern = re.compile(rf"/{match.group(1)}_\d+\.html$")
+                for a in soup.find_all("a", href=True):
+                    if pattern.search(urlparse(urljoin(base_url, a["href"])).path):
+                        add(a["href"])
+        elif self._is_photos18_url(base_url):
+            # Photos18 图集分页形如 ?page=2，路径不变
+            for a in soup.find_all("a", href=True):
+                url = urljoin(base_url, a["href"])
+                if urlparse(url).path == base.path and re.search(r"[?&]page=\d+", url):
+                    add(url)
+
+        # 方法3: 通用规则
+        for a in soup.find_all("a", href=True):
+            text = a.get_text(strip=True).lower()
+            if text in NEXT_PAGE_TEXTS:
+                add(a["href"])
+            elif text.isdigit():
+                # 只认分页容器中的页码，避免把正文中的数字链接当成分页
+                for depth, parent in enumerate(a.parents):
+                    if depth >= 3:
+                        break
+                    attrs = " ".join(parent.get("class") or []) + " "
+                    attrs += parent.get("id") or ""
+                    if re.search(r"pag|pager|nav-links", attrs, re.IGNORECASE):
+                        add(a["href"])
+                        break
+
+        return links
+
+    def _load_page_job(self, page_url, refresh=False):
+        """
+        获取分页页面的图片列表和分页链接
+        任务日志中有记录时（包括已完成的页面）直接复用，不再获取页面；refresh 为 True 时重新获取
+        返回 (images, links)，获取失败时 images 为 None
+        """
+        if self.journal and not refresh:
+            images = self.journal.load_images(page_url, include_done=True)
+            if images is not None:
+                return images, self.journal.load_links(page_url)
+
+        html = self.get_page(page_url)
+        if not html:
+            return None, []
+
+        images = self.extract_images(html, base_url=page_url)
+        links = self.find_next_pages(html, page_url)
+        if self.journal:
+            # 先记录链接再记录图片，保证任务进入可恢复状态时链接已经写入
+            self.journal.record_links(page_url, links)
+            self.journal.record_images(page_url, images)
+        return images, links
+
+    def _print_summary(self):
+        print(f"\n{'=' * 60}")
+        if self.dry_run:
+            counts = self.plan_counts
             print(
-                f"✅ 完成: 新下载 {self.downloaded_count}, 跳过 {self.skipped_count}, 失败 {self.failed_count}"
+                f"📋 试运行: 需要下载 {counts[NEW]}, 已存在 {counts[EXISTS]}, "
+                f"日志中已完成 {counts[FINISHED]}, 预计 {format_size(self.plan_bytes)}"
             )
+            if counts:
+                print(f"📝 计划已写入: {self.download_folder / '.pippi_plan.tsv'}")
+            else:
+                print("📝 没有找到图片，未生成计划文件")
             print(f"{'=' * 60}")
-            return self.downloaded_count
+            return
+        print(
+            f"✅ 完成: 新下载 {self.downloaded_count}, 跳过 {self.skipped_count}, 失败 {self.failed_count}"
+        )
+        latency = self.latency.summary()
+        if latency:
+            print(latency)
+        print(f"{'=' * 60}")
 
-        # 原有逻辑：从HTML页面提取图片链接
-        html = self.get_page(target_url)
-        if not html:
-            print("❌ 获取页面失败")
-            return 0
+    def crawl(self, target_url, progress_callback=None):
+        """
+        爬取目标链接
+        progress_callback(current, total): 每处理完一张图片调用一次
+        调用 stop() 可随时停止，任务日志保留进度，下次可继续
+        """
+        with self.cancel_token.running():
+            print(f"\n{'=' * 60}")
+            print(f"🚀 爬取: {target_url}")
+            print(f"📁 目录: {self.download_folder.absolute()}")
+            print(f"{'=' * 60}\n")
 
-        images = self.extract_images(html, base_url=target_url)
+            images = self._load_job_images(target_url)
+            if not images:
+                return 0
+
+            self._download_job(target_url, images, progress_callback)
+            self._print_summary()
+            self.export_failed()
+
+            return self.downloaded_count
+
+    def _download_job(self, target_url, images, progress_callback=None, group=None):
+        """
+        下载一个任务的全部图片，并把每张图片的状态写入任务日志
+        被用户停止时返回 True
+        """
         total = len(images)
+        plan = self.plan_job(target_url, images, estimate=self.dry_run)
+        print(plan.summary())
+        if self.dry_run:
+            plan.write(self.download_folder / ".pippi_plan.tsv", bool(self.plan_counts))
+            self.plan_counts.update(plan.counts())
+            self.plan_bytes += plan.estimated_bytes()[0] or 0
+            return False
+
+        if total > 1:
+            print(f"🎯 共 {total} 张图片，开始下载...\n")
 
-        if not images:
-            print("❌ 未找到任何图片")
-            return 0
+        # 日志中已完成和已存在的图片直接跳过，不再逐张检查
+        pending = plan.pending()
+        self._incr("skipped_count", total - len(pending))
+        exists = [item.index for item in plan.items if item.state == EXISTS]
+        if self.journal and exists:
+            self.journal.mark_images(target_url, exists, CrawlJournal.DONE)
 
-        print(f"🎯 共 {total} 张图片，开始下载...\n")
+        tasks = [(item.index, item.url) for item in pending]
+        names = {item.index: (item.stem, item.ext) for item in pending}
+        stopped = self._run_tasks(
+            target_url, tasks, total, progress_callback, group, names
+        )
+        if self.journal and not stopped:
+            self.journal.finish_job(target_url)
+
+        return stopped
+
+    def plan_job(self, target_url, images, estimate=False):
+        """
+        下载前为任务生成计划，不发出图片请求
+        一次算出所有文件名并处理重名，对保存目录和分包索引做一次批量存在检查；
+        大小取自任务日志中记录的大小，estimate 为 True 时对其余需要下载的图片发 HEAD 请求
+        """
+        states = self.journal.image_states(target_url) if self.journal else {}
+        names, renamed = self._planned_names(images)
+        present = self._bulk_exists({stem for stem, _ in names.values()})
+        sizes = self.journal.load_sizes(images) if self.journal else {}
 
+        items = []
         for i, url in enumerate(images, 1):
-            self.download_image(url, i)
+            stem, ext = names[i]
+            if states.get(i, (None, 0))[0] == CrawlJournal.DONE:
+                state = FINISHED
+            elif stem in present:
+                state = EXISTS
+            else:
+                state = NEW
+            items.append(
+                PlanItem(i, url, stem, ext, state, sizes.get(url), i in renamed)
+            )
 
-            if i % 10 == 0 and i < total:
-                rest = random.uniform(3, 6)
-                print(f"💤 休息 {rest:.1f} 秒...")
-                time.sleep(rest)
+        plan = DownloadPlan(target_url, items)
+        if estimate:
+            self._head_sizes([item for item in plan.pending() if item.size is None])
+        return plan
 
-        print(f"\n{'=' * 60}")
+    def _planned_names(self, images):
+        """返回 ({序号: (文件名, 扩展名)}, 因重名改名的序号集合)"""
+        return resolve_collisions(
+            [(i, url, *self._get_filename(url, i)) for i, url in enumerate(images, 1)]
+        )
+
+    def _bulk_exists(self, stems):
+        """
+        返回 stems 中已下载的文件名集合，全部在磁盘上确认
+        索引命中需要确认，未命中的也可能是启动后其他任务保存的文件，所以不经过索引直接检查；
+        逐个检查每种扩展名比扫描一次目录慢时改为扫描目录
+        """
+        if self.pack:
+            # 分包模式下先批量查分包索引，其余的只有命中已下载文件索引时
+            # （切换到分包模式前保存的单独文件）才检查目录
+            found = self.pack.contains_many(stems)
+            found.update(stem for stem in stems - found if stem in self.existing_files)
+            return found
+
+        found = set()
+        if len(stems) * len(self.image_extensions) >= len(self.existing_files):
+            with os.scandir(self.download_folder) as entries:
+                for entry in entries:
+                    stem = os.path.splitext(entry.name)[0]
+                    if stem in stems and entry.is_file():
+                        found.add(stem)
+        else:
+            found.update(stem for stem in stems if self._in_folder(stem))
+        return found
+
+    def _head_sizes(self, items):
+        """
+        用 HEAD 请求获取图片大小，结果记入任务日志
+        与下载一样按域名调度：同一域名同时只发 per_host_limit 个请求，每个请求前随机等待，
+        失败计入域名熔断，熔断中的域名不再请求（大小按其他图片的平均值估算）
+        """
+        if not items:
+            return
+        print(f"📏 获取 {len(items)} 张图片的大小...")
+        token = self.cancel_token
+        scheduler = HostScheduler(per_host_limit=self.per_host_limit)
+        for i, item in enumerate(items):
+            scheduler.put(i, item.url)
+        scheduler.close()
+        wake = token.register(scheduler.cancel)
+
+        def head(item, host):
+            if self.breaker.remaining(host):
+                return
+            self._sleep(self._get_random_delay(0.5, 1.5))
+            try:
+                r = self.session.head(
+                    item.url,
+                    headers=self._get_headers_for_url(item.url, is_image=True),
+                    timeout=(self.connect_timeout, self.read_timeout),
+                    allow_redirects=True,
+                )
+                r.raise_for_status()
+            except requests.RequestException as e:
+                if classify_error(e) == RETRY:
+                    self.breaker.failure(host)
+                return
+            self.breaker.success(host)
+            length = r.headers.get("Content-Length", "")
+            if length.isdigit() and not r.headers.get("Content-Encoding"):
+                item.size = int(length)
+
+        def worker():
+            while True:
+                task = scheduler.get()
+                if task is None:
+                    break
+                i, url = task
+                host = scheduler.host_of(url)
+                slots = self.host_slots
+                if slots and not slots.acquire(host, token):
+                    scheduler.done(url)
+                    break
+                try:
+                    head(items[i], host)
+                except DownloadCancelled:
+                    break
+                finally:
+                    scheduler.done(url)
+                    if slots:
+                        slots.release(host)
+
+        workers = min(self.max_workers, len(scheduler.hosts) * self.per_host_limit)
+        threads = [
+            threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        token.unregister(wake)
+
+        if self.journal:
+            self.journal.record_sizes(
+                {item.url: item.size for item in items if item.size is not None}
+            )
+
+    def _run_tasks(
+        self,
+        target_url,
+        tasks,
+        total=None,
+        progress_callback=None,
+        group=None,
+        names=None,
+    ):
+        """
+        按域名调度下载 [(序号, 图片链接)]，names 为下载计划中的 {序号: (文件名, 扩展名)}
+        可重试的失败（超时、5xx、429）进入延迟队列，到期后重新排队，期间继续下载其他图片；
+        404/403 等错误或重试次数用尽时记为失败；被用户停止时返回 True
+        """
+        total = total or len(tasks)
+
+        # 按域名分队列，慢域名不会阻塞其他域名的图片
+        scheduler = HostScheduler(
+            priority=self.priority, per_host_limit=self.per_host_limit
+        )
+        for i, url in tasks:
+            scheduler.put(i, url)
+        scheduler.close()
+        # 熔断状态在任务之间共享，之前的任务触发的暂停在新的调度器中继续生效
+        for host in scheduler.hosts:
+            pause = self.breaker.remaining(host)
+            if pause:
+                scheduler.hold(host, pause)
+
+        attempts = {}
+        progress = {"done": total - len(tasks)}
+        progress_lock = threading.Lock()
+        token = self.cancel_token
+        # 停止时唤醒正在等待任务的线程
+        wake = token.register(scheduler.cancel)
+        if progress_callback:
+            progress_callback(progress["done"], total)
+
+        def finish(i, url, state, error=None):
+            if self.journal:
+                self.journal.mark_image(target_url, i, state, error)
+            if state != CrawlJournal.FAILED:
+                return
+            self._incr("failed_count")
+            with self._stats_lock:
+                self.failed_urls.append((target_url, i, url, attempts.get(i, 1), error))
+
+        def worker():
+            while not token.cancelled:
+                task = scheduler.get()
+                if task is None:
+                    break
+                if task is False:
+                    continue
+
+                i, url = task
+                host = scheduler.host_of(url)
+                slots = self.host_slots
+                if slots and not slots.acquire(host, token):
+                    scheduler.done(url)
+                    break
+                try:
+                    result, exc = self._attempt_download(
+                        url, i, group or target_url, names.get(i) if names else None
+                    )
+                    attempts[i] = attempts.get(i, 0) + 1
+                    error = str(exc)[:200] if exc else None
+
+                    if result == "cancelled":
+                        # 保持待下载状态，下次继续
+                        break
+                    if result in ("done", "skipped"):
+                        self.breaker.success(host)
+                        finish(i, url, CrawlJournal.DONE)
+                    elif result == RETRY and attempts[i] < self.retries:
+                        pause = self.breaker.failure(host)
+                        if pause:
+                            print(f"  🔌 {host} 连续失败，暂停 {pause:.0f} 秒")
+                            scheduler.hold(host, pause)
+                            if slots:
+                                slots.hold(host, pause)
+                        delay = retry_after(exc) or backoff_delay(attempts[i] - 1)
+                        print(f"  🔁 [{i}] {delay:.1f} 秒后重试: {error[:40]}")
+                        if self.journal:
+                            self.journal.mark_image(
+                                target_url, i, CrawlJournal.PENDING, error
+                            )
+                        scheduler.put(i, url, delay=delay)
+                        continue
+                    else:
+                        if result == RETRY:
+                            self.breaker.failure(host)
+                        print(f"  ❌ [{i}] 失败: {error[:40]}")
+                        finish(i, url, CrawlJournal.FAILED, error)
+                finally:
+                    scheduler.done(url)
+                    if slots:
+                        slots.release(host)
+
+                with progress_lock:
+                    progress["done"] += 1
+                    done = progress["done"]
+                if progress_callback:
+                    progress_callback(done, total)
+
+                if done % 10 == 0 and done < total:
+                    rest = random.uniform(3, 6)
+                    print(f"💤 已下载 {done}/{total}，休息 {rest:.1f} 秒...")
+                    try:
+                        self._sleep(rest)
+                    except DownloadCancelled:
+                        break
+
+        # 每个域名同时只下载 per_host_limit 张，线程数不超过可并行的域名数
+        workers = min(self.max_workers, len(scheduler.hosts) * self.per_host_limit)
+        if workers <= 1:
+            worker()
+        else:
+            threads = [
+                threading.Thread(target=worker, daemon=True) for _ in range(workers)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                while t.is_alive() and not token.cancelled:
+                    t.join(0.2)
+            # 停止后最多再等 0.5 秒，仍在建立连接的线程会自行退出
+            deadline = time.time() + 0.5
+            for t in threads:
+                t.join(max(0, deadline - time.time()))
+
+        token.unregister(wake)
+        stopped = token.cancelled
+        if stopped:
+            print("⏹️ 用户取消下载，进度已保存到任务日志")
+        return stopped
+
+    def export_failed(self, path=None):
+        """
+        导出最终失败的图片，便于稍后用 replay_failed 重新下载
+        每行: 任务链接<TAB>序号<TAB>图片链接<TAB>尝试次数<TAB>错误信息
+        有任务日志时导出日志中所有失败记录，否则导出本次运行的失败记录；
+        没有失败记录时删除旧的导出文件，避免 replay_failed 重复下载已经成功的图片
+        """
+        path = Path(path) if path else self.download_folder / ".pippi_failed.tsv"
+        rows = self.journal.failed_images() if self.journal else self.failed_urls
+        if not rows:
+            if path.exists():
+                path.unlink()
+                print(f"🧹 没有失败的图片，已删除旧的失败列表: {path}")
+            return None
+
+        with open(path, "w", encoding="utf-8") as f:
+            for job_url, index, url, attempts, error in rows:
+                error = (error or "").replace("\t", " ").replace("\n", " ")
+                f.write(f"{job_url}\t{index}\t{url}\t{attempts}\t{error}\n")
+        print(f"📝 {len(rows)} 个失败链接已导出到: {path}")
+        return path
+
+    def replay_failed(self, path=None, progress_callback=None):
+        """重新下载 export_failed 导出的失败图片，任务日志中的原记录会同步更新"""
+        with self.cancel_token.running():
+            path = Path(path) if path else self.download_folder / ".pippi_failed.tsv"
+            if not path.exists():
+                # 上次没有失败的图片时 export_failed 会删除失败列表
+                print(f"✅ 没有失败的图片需要重新下载: {path}")
+                return 0
+            jobs = {}
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) >= 3:
+                        jobs.setdefault(parts[0], []).append((int(parts[1]), parts[2]))
+
+            print(f"🔁 重新下载 {sum(len(t) for t in jobs.values())} 张失败的图片")
+            for job_url, tasks in jobs.items():
+                # 按任务的完整图片列表计算文件名，与重名改名后的名字一致
+                images = (
+                    self.journal.load_images(job_url, True) if self.journal else None
+                )
+                names = self._planned_names(images)[0] if images else None
+                if self._run_tasks(
+                    job_url, tasks, None, progress_callback, None, names
+                ):
+                    break
+
+            self._print_summary()
+            # 没有任务日志时只知道本次尝试过的图片，中途停止时保留原文件
+            if self.journal or not self.cancel_token.cancelled:
+                self.export_failed(path)
+            return self.downloaded_count
+
+    def audit_library(self, repair=False, workers=None, progress_callback=None):
+        """
+        用多进程并行检查保存目录中的图片：0 字节、不完整或损坏（JPEG 结束标记、PNG CRC、
+        WebP/AVIF 长度）、不是图片、扩展名与实际格式不符（如 AVIF 保存为 .jpg）
+        repair 为 True 时修复：扩展名不符的改名，其余移到 .pippi_quarantine 目录并记为失败，
+        之后用 replay_failed 重新下载；返回有问题的文件 [(路径, 结果, 说明, 实际格式)]
+        """
+        paths = scan_files(self.download_folder, self.image_extensions)
+        print(f"\n🩺 检查 {len(paths)} 个文件: {self.download_folder.absolute()}")
+        problems = audit_files(paths, workers, progress_callback)
+
+        for path, status, detail, fmt in problems:
+            print(f"  ⚠️ {Path(path).name}: {STATUS_LABELS[status]} ({detail})")
+        counts = Counter(status for _, status, _, _ in problems)
+        summary = ", ".join(f"{STATUS_LABELS[s]} {n}" for s, n in counts.items())
         print(
-            f"✅ 完成: 新下载 {self.downloaded_count}, 跳过 {self.skipped_count}, 失败 {self.failed_count}"
+            f"🩺 检查完成: 正常 {len(paths) - len(problems)}"
+            + (f", {summary}" if summary else "")
         )
-        print(f"{'=' * 60}")
 
-        return self.downloaded_count
+        if repair and problems:
+            self._repair_files(problems)
+        return problems
+
+    def _repair_files(self, problems):
+        # 由任务日志中的图片链接反查文件名，找到损坏文件的来源
+        sources = {}
+        if self.journal:
+            jobs = {}
+            for job_url, idx, url in self.journal.all_images():
+                jobs.setdefault(job_url, []).append(url)
+            for job_url, images in jobs.items():
+                names = self._planned_names(images)[0]
+                for idx, url in enumerate(images, 1):
+                    stem, ext = names[idx]
+                    sources.setdefault(f"{stem}{ext}", (job_url, idx, url))
+
+        quarantine = self.download_folder / ".pippi_quarantine"
+        renamed = queued = 0
+        for path, status, detail, fmt in problems:
+            path = Path(path)
+            if status == MISMATCH:
+                target = path.with_suffix(detail)
+                if not target.exists():
+                    path.rename(target)
+                    renamed += 1
+                continue
+
+            quarantine.mkdir(exist_ok=True)
+            # 多次检查可能隔离同名文件，已有同名文件时加序号，不覆盖之前隔离的文件
+            target = quarantine / path.name
+            n = 1
+            while target.exists():
+                target = quarantine / f"{path.stem}.{n}{path.suffix}"
+                n += 1
+            os.replace(path, target)
+            source = sources.get(path.name)
+            if not source:
+                print(f"  ⚠️ {path.name}: 任务日志中找不到来源链接，已隔离")
+                continue
+            job_url, idx, url = source
+            error = f"{STATUS_LABELS[status]}: {detail}"
+            if self.journal:
+                self.journal.mark_image(job_url, idx, CrawlJournal.FAILED, error)
+            self.failed_urls.append((job_url, idx, url, 1, error))
+            queued += 1
+
+        # 隔离的文件不再算作已下载
+        self.existing_files = self._load_existing_files()
+        print(f"🔧 已改正 {renamed} 个扩展名，{queued} 个文件等待重新下载")
+        if queued:
+            self.export_failed()
+
+    def crawl_gallery(
+        self,
+        start_url,
+        max_pages=50,
+        max_depth=None,
+        prefetch=2,
+        progress_callback=None,
+        refresh=False,
+    ):
+        """
+        跟随分页爬取整个图集
+        待爬页面按规范化URL去重，max_pages/max_depth 限制页数和跟随深度；
+        后台线程提前获取并解析后续 prefetch 个页面，下载图片时无需等待页面；
+        任务日志中已记录的页面直接复用图片和分页链接，refresh 为 True 时全部重新获取
+        """
+        with self.cancel_token.running():
+            if self._is_direct_image_url(start_url) or self._is_pixiv_url(start_url):
+                # 直接图片链接和 Pixiv 作品没有分页
+                return self.crawl(start_url, progress_callback)
+
+            print(f"\n{'=' * 60}")
+            print(f"🚀 爬取图集: {start_url}")
+            print(f"📁 目录: {self.download_folder.absolute()}")
+            print(
+                f"📚 最多 {max_pages} 页" + (f"，深度 {max_depth}" if max_depth else "")
+            )
+            print(f"{'=' * 60}\n")
+
+            frontier = CrawlFrontier(max_pages=max_pages, max_depth=max_depth)
+            frontier.add(start_url)
+            pages = queue.Queue(maxsize=max(1, prefetch))
+            halt = threading.Event()
+            token = self.cancel_token
+
+            def offer(item):
+                # 队列满时等待，但停止后立即放弃
+                while not halt.is_set() and not token.cancelled:
+                    try:
+                        pages.put(item, timeout=0.5)
+                        return
+                    except queue.Full:
+                        continue
+
+            def fetch_pages():
+                try:
+                    while not halt.is_set() and not token.cancelled:
+                        item = frontier.pop()
+                        if item is None:
+                            break
+                        page_url, depth = item
+                        try:
+                            images, links = self._load_page_job(page_url, refresh)
+                        except Exception as e:
+                            print(f"  ⚠️ 解析页面失败: {str(e)[:50]}")
+                            images, links = None, []
+                        for link in links:
+                            frontier.add(link, depth + 1)
+                        offer((page_url, images))
+                finally:
+                    offer(None)
+
+            fetcher = threading.Thread(target=fetch_pages, daemon=True)
+            fetcher.start()
+
+            page_no = 0
+            try:
+                while True:
+                    if token.cancelled:
+                        print("⏹️ 用户取消下载，进度已保存到任务日志")
+                        break
+                    try:
+                        item = pages.get(timeout=0.2)
+                    except queue.Empty:
+                        continue
+                    if item is None:
+                        break
+
+                    page_url, images = item
+                    page_no += 1
+                    print(f"\n📄 第 {page_no} 页: {page_url}")
+                    if images is None:
+                        print("❌ 获取页面失败")
+                        continue
+                    if not images:
+                        print("❌ 未找到任何图片")
+                        if self.journal:
+                            self.journal.finish_job(page_url)
+                        continue
+
+                    # 同一图集的所有分页写入同一组分包
+                    if self._download_job(
+                        page_url, images, progress_callback, start_url
+                    ):
+                        break
+            finally:
+                halt.set()
+
+            print(f"\n📚 共处理 {page_no} 页")
+            self._print_summary()
+            self.export_failed()
+
+            return self.downloaded_count
@@ -0,0 +1,303 @@
+import os
+import socket
+import threading
+import time
+
+from pippi_cancel import DownloadCancelled
+from pippi_queue import GLOBAL, IMAGE, PAGE
+from pippi_retry import RETRY, backoff_delay, retry_after
+from pippi_scheduler import HostScheduler, HostSlots
+
+
+def submit_targets(work_queue, urls, follow_pages=False, max_pages=50):
+    """协调端：把目标链接加入分布式队列，返回新加入的数量"""
+    count = 0
+    for url in urls:
+        if work_queue.submit(
+            PAGE,
+            url,
+            group=url,
+            follow=follow_pages,
+            max_pages=max_pages if follow_pages else 0,
+        ):
+            count += 1
+    print(f"📮 已加入 {count} 个目标链接到分布式队列")
+    return count
+
+
+class SharedIndex:
+    """
+    已下载文件索引：先查本机索引，再查队列中所有节点共享的索引
+    替换 spider.existing_files 使用
+    """
+
+    def __init__(self, work_queue, local):
+        self.work_queue = work_queue
+        self.local = local
+
+    def __contains__(self, stem):
+        if stem in self.local:
+            return True
+        if self.work_queue.index_contains(stem):
+            self.local.add(stem)
+            return True
+        return False
+
+    def __len__(self):
+        return len(self.local)
+
+    def add(self, stem):
+        self.local.add(stem)
+        self.work_queue.index_add(stem)
+
+    def update(self, stems):
+        for stem in stems:
+            self.add(stem)
+
+
+class SharedBandwidth:
+    """
+    所有节点共享的限速，替换 spider.bandwidth 使用，接口与 BandwidthLimiter 相同
+    限速设置保存在队列中，任何节点修改后其他节点 refresh 秒内生效；
+    每次向队列预约 block 字节的带宽，本机用完后再预约，避免每读一块数据都访问队列
+    """
+
+    def __init__(self, work_queue, block=256 * 1024, refresh=5):
+        self.work_queue = work_queue
+        self.block = block
+        self.refresh = refresh
+        self._rates = {}
+        self._loaded_at = 0
+        self._credit = {}
+        self._lock = threading.Lock()
+
+    def _current_rates(self):
+        now = time.monotonic()
+        if now - self._loaded_at > self.refresh:
+            self._rates = self.work_queue.rates()
+            self._loaded_at = now
+        return self._rates
+
+    @property
+    def global_rate(self):
+        return self._current_rates().get(GLOBAL, 0)
+
+    def set_global_rate(self, rate):
+        self.set_host_rate(GLOBAL, rate)
+
+    def set_host_rate(self, host, rate):
+        self.work_queue.set_rate(host, rate)
+        self._loaded_at = 0
+
+    def delay_for(self, host, n):
+        rates = self._current_rates()
+        wait = 0.0
+        for key in (GLOBAL, host.lower()):
+            rate = rates.get(key, 0)
+            if rate <= 0:
+                continue
+            with self._lock:
+                credit = self._credit.get(key, 0) - n
+                if credit < 0:
+                    # 限速较低时按更小的块预约，避免一次等待过久
+                    grant = max(n, min(self.block, rate // 4))
+                    wait = max(wait, self.work_queue.reserve(key, grant, rate))
+                    credit += grant
+                self._credit[key] = credit
+        return wait
+
+    def throttle(self, host, n, token):
+        wait = self.delay_for(host, n)
+        if wait > 0:
+            token.sleep(wait)
+
+
+class DistributedWorker:
+    """
+    工作节点：从分布式队列领取任务执行
+    页面任务解析出图片和分页链接后加入队列，图片任务下载后报告结果；
+    领取的任务带租约，后台线程定期续约，节点崩溃后租约到期，任务由其他节点接手；
+    已下载文件索引和限速在所有节点之间共享；
+    同一域名的并发下载数和熔断暂停在本节点内生效（per_host_limit），与单机爬取相同
+    """
+
+    def __init__(self, spider, work_queue, worker_id=None, lease=60):
+        self.spider = spider
+        self.work_queue = work_queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease = lease
+        self.held = {}
+        self._lock = threading.Lock()
+        # 本节点所有线程共享的域名并发名额
+        self.slots = spider.host_slots or HostSlots(spider.per_host_limit)
+
+        spider.existing_files = SharedIndex(work_queue, spider.existing_files)
+        spider.bandwidth = SharedBandwidth(work_queue)
+
+    def run(self, wait=False, progress_callback=None):
+        """
+        开始领取任务，队列清空后返回；wait 为 True 时一直等待新任务，直到 stop()
+        progress_callback(current, total): 每完成一个图片任务调用一次，total 为队列中的任务总数
+        """
+        with self.spider.cancel_token.running():
+            spider = self.spider
+            token = spider.cancel_token
+            print(f"\n{'=' * 60}")
+            print(f"🛰️ 工作节点 {self.worker_id} 开始领取任务")
+            print(f"📁 目录: {spider.download_folder.absolute()}")
+            print(f"{'=' * 60}\n")
+
+            self._progress = progress_callback
+            heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+            heartbeat.start()
+            threads = [
+                threading.Thread(target=self._work, args=(wait,), daemon=True)
+                for _ in range(max(1, spider.max_workers))
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                while t.is_alive() and not token.cancelled:
+                    t.join(0.2)
+            deadline = time.time() + 0.5
+            for t in threads:
+                t.join(max(0, deadline - time.time()))
+
+            if token.cancelled:
+                print("⏹️ 用户取消下载，未完成的任务已放回队列")
+            spider._print_summary()
+            return spider.downloaded_count
+
+    def stop(self):
+        self.spider.stop()
+
+    def _heartbeat(self):
+        token = self.spider.cancel_token
+        while not token.cancelled:
+            try:
+                token.sleep(self.lease / 3)
+            except DownloadCancelled:
+                break
+            with self._lock:
+                tasks = list(self.held.values())
+            for task in tasks:
+                if not self.work_queue.renew(task, self.worker_id, self.lease):
+                    print(f"  ⚠️ 任务 {task['id']} 的租约已失效，可能被其他节点接手")
+
+    def _work(self, wait):
+        token = self.spider.cancel_token
+        while not token.cancelled:
+            task = self.work_queue.claim(self.worker_id, self.lease)
+            if task is None:
+                if not wait and self.work_queue.is_drained():
+                    break
+                # 其他节点的任务还在执行，可能还会产生新任务
+                try:
+                    token.sleep(1)
+                except DownloadCancelled:
+                    break
+                continue
+
+            with self._lock:
+                self.held[task["id"]] = task
+            try:
+                if task["kind"] == PAGE:
+                    self._run_page(task)
+                else:
+                    self._run_image(task)
+            except Exception as e:
+                print(f"  ⚠️ 任务出错: {str(e)[:50]}")
+                self._fail(task, str(e)[:200])
+            finally:
+                with self._lock:
+                    self.held.pop(task["id"], None)
+
+    def _fail(self, task, error):
+        # 没有用完重试次数时延迟后重新排队
+        delay = None
+        if task["attempts"] + 1 < self.spider.retries:
+            delay = backoff_delay(task["attempts"])
+        self.work_queue.fail(task, self.worker_id, error, delay)
+
+    def _run_page(self, task):
+        spider = self.spider
+        url = task["url"]
+        print(f"\n📄 解析页面: {url}")
+        if task["follow"]:
+            images, links = spider._load_page_job(url)
+        else:
+            images, links = spider._load_job_images(url), []
+
+        if spider.cancel_token.cancelled:
+            self.work_queue.release(task, self.worker_id)
+            return
+        if images is None:
+            self._fail(task, "获取页面失败")
+            return
+
+        # 与单机爬取一样先算出所有文件名，同一页面中重名的图片改名后再分发
+        names = spider._planned_names(images)[0]
+        added = 0
+        for i, image in enumerate(images, 1):
+            stem, ext = names[i]
+            added += self.work_queue.submit(
+                IMAGE, image, job=url, idx=i, group=task["group"], stem=stem, ext=ext
+            )
+        for link in links:
+            self.work_queue.submit(
+                PAGE,
+                link,
+                group=task["group"],
+                depth=task["depth"] + 1,
+                follow=True,
+                max_pages=task["max_pages"],
+            )
+        print(f"🎯 {url} 共 {len(images)} 张图片，新加入 {added} 个下载任务")
+        self.work_queue.complete(task, self.worker_id)
+
+    def _run_image(self, task):
+        spider = self.spider
+        url = task["url"]
+        host = HostScheduler.host_of(url)
+        if not self.slots.acquire(host, spider.cancel_token):
+            self.work_queue.release(task, self.worker_id)
+            return
+        try:
+            # 旧版本加入的任务没有计划文件名，按链接计算
+            filename = (task["stem"], task["ext"]) if task["stem"] else None
+            result, exc = spider._attempt_download(
+                url, task["idx"], task["group"], filename
+            )
+        finally:
+            self.slots.release(host)
+        error = str(exc)[:200] if exc else None
+
+        if result == "cancelled":
+            self.work_queue.release(task, self.worker_id)
+            return
+        if result in ("done", "skipped"):
+            spider.breaker.success(host)
+            self.work_queue.complete(task, self.worker_id)
+        elif result == RETRY and task["attempts"] + 1 < spider.retries:
+            pause = spider.breaker.failure(host)
+            if pause:
+                print(f"  🔌 {host} 连续失败，暂停 {pause:.0f} 秒")
+                self.slots.hold(host, pause)
+            delay = retry_after(exc) or backoff_delay(task["attempts"])
+            print(f"  🔁 [{task['idx']}] {delay:.1f} 秒后重试: {error[:40]}")
+            self.work_queue.fail(task, self.worker_id, error, delay)
+            return
+        else:
+            if result == RETRY:
+                spider.breaker.failure(host)
+            print(f"  ❌ [{task['idx']}] 失败: {error[:40]}")
+            spider._incr("failed_count")
+            with spider._stats_lock:
+                spider.failed_urls.append(
+                    (task["job"], task["idx"], url, task["attempts"] + 1, error)
+                )
+            self.work_queue.fail(task, self.worker_id, error)
+
+        if self._progress:
+            counts = self.work_queue.stats()
+            self._progress(counts["done"] + counts["failed"], sum(counts.values()))
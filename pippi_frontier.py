@@ -0,0 +1,79 @@
+from collections import deque
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+from pippi_index import CompactStringSet
+
+# 不影响页面内容的跟踪参数，规范化时去掉
+TRACKING_PARAMS = (
+    "utm_source",
+    "utm_medium",
+    "utm_campaign",
+    "utm_term",
+    "utm_content",
+    "spm",
+    "from",
+)
+
+
+def canonicalize_url(url):
+    """
+    规范化URL，用于待爬队列去重
+    协议和域名转小写、去掉默认端口和锚点、查询参数排序并去掉跟踪参数
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (
+        scheme == "https" and netloc.endswith(":443")
+    ):
+        netloc = netloc.rsplit(":", 1)[0]
+
+    path = parsed.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/")
+
+    query = [
+        (k, v)
+        for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS
+    ]
+    query.sort()
+    return urlunparse((scheme, netloc, path, "", urlencode(query), ""))
+
+
+class CrawlFrontier:
+    """
+    待爬页面队列
+    按规范化URL去重，记录每个页面的跟随深度，并限制最大页数和深度
+    """
+
+    def __init__(self, max_pages=50, max_depth=None):
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.queue = deque()
+        # 长时间运行时已见页面可能很多，只保存规范化URL的哈希
+        self.seen = CompactStringSet()
+
+    def add(self, url, depth=0):
+        """加入待爬页面，重复、超出深度或页数限制时返回 False"""
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        if self.max_pages and len(self.seen) >= self.max_pages:
+            return False
+
+        key = canonicalize_url(url)
+        if key in self.seen:
+            return False
+
+        self.seen.add(key)
+        self.queue.append((url, depth))
+        return True
+
+    def pop(self):
+        """取出下一个待爬页面 (url, depth)，队列为空时返回 None"""
+        if self.queue:
+            return self.queue.popleft()
+        return None
+
+    def __len__(self):
+        return len(self.queue)
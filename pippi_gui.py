@@ -1,113 +1,35 @@
+import builtins
+import queue
 import sys
 import os
+import time
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 from pathlib import Path
-import threading
 
-# 导入核心爬虫类
-from pippi_core import RobustImageSpider
+# 导入下载任务队列
+from pippi_jobs import JobManager, QUEUED, RUNNING
 
+# 日志最多保留的行数
+MAX_LOG_LINES = 2000
+# 界面刷新间隔（毫秒）
+POLL_INTERVAL = 200
 
-class SpiderThread(threading.Thread):
-    """后台线程"""
 
-    def __init__(self, url, folder, gui):
-        super().__init__()
-        self.url = url
-        self.folder = folder
-        self.gui = gui
-        self.spider = None
-        self.is_running = True
-
-    def run(self):
-        try:
-            import builtins
-
-            original_print = builtins.print
-
-            def gui_print(*args, **kwargs):
-                msg = " ".join(map(str, args))
-                self.gui.log(msg)
-
-            builtins.print = gui_print
-
-            self.spider = RobustImageSpider(self.folder)
-
-            # Monkey patch crawl 方法添加进度
-            original_crawl = self.spider.crawl
-
-            def crawl_with_progress(url):
-                self.gui.log(f"🚀 开始爬取: {url}")
-
-                # 检查是否是直接的图片链接
-                if self.spider._is_direct_image_url(url):
-                    self.gui.log("🎯 检测到直接图片链接，开始下载...")
-                    self.gui.set_progress(0, 1)
-                    self.spider.download_image(url, 1)
-                    self.gui.set_progress(1, 1)
-                    success = self.spider.downloaded_count
-                    skipped = self.spider.skipped_count
-                    failed = self.spider.failed_count
-                    self.gui.log(
-                        f"✅ 下载完成！成功: {success}, 跳过: {skipped}, 失败: {failed}"
-                    )
-                    return success
-
-                # 原有逻辑：从HTML页面提取图片链接
-                html = self.spider.get_page(url)
-                if not html:
-                    self.gui.log("❌ 获取页面失败")
-                    return 0
-
-                images = self.spider.extract_images(html, base_url=url)
-                total = len(images)
-
-                if not images:
-                    self.gui.log("❌ 未找到任何图片")
-                    return 0
-
-                self.gui.log(f"🎯 共发现 {total} 张图片")
-                self.gui.set_progress(0, total)
-
-                for i, img_url in enumerate(images, 1):
-                    if not self.is_running:
-                        self.gui.log("⏹️ 用户取消下载")
-                        break
-
-                    self.spider.download_image(img_url, i)
-                    self.gui.set_progress(i, total)
-
-                    if i % 10 == 0 and i < total:
-                        self.gui.log(f"💤 已下载 {i}/{total}，休息中...")
-
-                success = self.spider.downloaded_count
-                skipped = self.spider.skipped_count
-                failed = self.spider.failed_count
-                self.gui.log(
-                    f"✅ 下载完成！成功: {success}, 跳过: {skipped}, 失败: {failed}"
-                )
-                return success
-
-            self.spider.crawl = crawl_with_progress
-            result = self.spider.crawl(self.url)
-
-            builtins.print = original_print
-            self.gui.download_finished(True, f"下载完成，共 {result} 张新图片")
-
-        except Exception as e:
-            self.gui.log(f"❌ 错误: {str(e)}")
-            self.gui.download_finished(False, str(e))
-
-    def stop(self):
-        self.is_running = False
+def format_eta(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
 
 
 class PippiGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("皮皮蛛 PippiSpider 1.4.1")
-        self.root.geometry("700x650")
+        self.root.geometry("800x780")
         self.root.minsize(600, 500)
 
         # 先隐藏窗口，避免闪烁
@@ -217,13 +139,13 @@ class PippiGUI:
         )
         input_frame.pack(fill=tk.X, pady=(0, 10))
 
-        # URL输入
+        # URL输入，每行一个链接，可一次粘贴多个
         tk.Label(input_frame, text="目标链接:", bg=self.bg_color).grid(
-            row=0, column=0, sticky=tk.W, pady=5
+            row=0, column=0, sticky=tk.NW, pady=5
         )
-        self.url_entry = tk.Entry(input_frame, width=50, font=("Consolas", 10))
-        self.url_entry.grid(row=0, column=1, sticky=tk.EW, padx=5)
-        self.url_entry.insert(0, "https://bing.fullpx.com/")
+        self.url_text = tk.Text(input_frame, width=50, height=3, font=("Consolas", 10))
+        self.url_text.grid(row=0, column=1, sticky=tk.EW, padx=5, pady=5)
+        self.url_text.insert("1.0", "https://bing.fullpx.com/")
 
         # 文件夹选择
         tk.Label(input_frame, text="保存目录:", bg=self.bg_color).grid(
@@ -238,6 +160,51 @@ class PippiGUI:
         )
         self.browse_btn.grid(row=1, column=2, padx=5)
 
+        # 分页设置
+        page_frame = tk.Frame(input_frame, bg=self.bg_color)
+        page_frame.grid(row=2, column=1, sticky=tk.W, padx=5, pady=(0, 5))
+
+        self.follow_pages_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            page_frame,
+            text="跟随分页爬取整个图集",
+            variable=self.follow_pages_var,
+            bg=self.bg_color,
+        ).pack(side=tk.LEFT)
+
+        tk.Label(page_frame, text="最多页数:", bg=self.bg_color).pack(
+            side=tk.LEFT, padx=(10, 0)
+        )
+        self.max_pages_var = tk.IntVar(value=50)
+        tk.Spinbox(
+            page_frame, from_=1, to=1000, width=5, textvariable=self.max_pages_var
+        ).pack(side=tk.LEFT, padx=5)
+
+        # 限速，下载过程中修改立即生效
+        tk.Label(page_frame, text="限速(KB/s):", bg=self.bg_color).pack(
+            side=tk.LEFT, padx=(10, 0)
+        )
+        self.bandwidth_var = tk.IntVar(value=0)
+        tk.Spinbox(
+            page_frame,
+            from_=0,
+            to=1000000,
+            increment=100,
+            width=7,
+            textvariable=self.bandwidth_var,
+        ).pack(side=tk.LEFT, padx=5)
+        self.bandwidth_var.trace_add("write", lambda *args: self.apply_bandwidth())
+
+        # 同时运行的任务数，下载过程中修改立即生效
+        tk.Label(page_frame, text="并行任务:", bg=self.bg_color).pack(
+            side=tk.LEFT, padx=(10, 0)
+        )
+        self.parallel_var = tk.IntVar(value=2)
+        tk.Spinbox(
+            page_frame, from_=1, to=10, width=3, textvariable=self.parallel_var
+        ).pack(side=tk.LEFT, padx=5)
+        self.parallel_var.trace_add("write", lambda *args: self.apply_parallel())
+
         input_frame.columnconfigure(1, weight=1)
 
         # === 控制按钮 ===
@@ -246,7 +213,7 @@ class PippiGUI:
 
         self.start_btn = tk.Button(
             btn_frame,
-            text="🚀 开始下载",
+            text="🚀 加入队列",
             command=self.start_download,
             bg=self.accent_color,
             fg="white",
@@ -259,7 +226,7 @@ class PippiGUI:
 
         self.stop_btn = tk.Button(
             btn_frame,
-            text="⏹️ 停止",
+            text="⏹️ 全部停止",
             command=self.stop_download,
             bg="#f44336",
             fg="white",
@@ -269,7 +236,50 @@ class PippiGUI:
             state=tk.DISABLED,
             cursor="hand2",
         )
-        self.stop_btn.pack(side=tk.LEFT)
+        self.stop_btn.pack(side=tk.LEFT, padx=(0, 10))
+
+        self.clear_btn = tk.Button(
+            btn_frame,
+            text="🧹 清除已结束",
+            command=self.clear_finished,
+            bg="#e0e0e0",
+            font=("Microsoft YaHei", 10),
+            padx=10,
+            pady=5,
+            cursor="hand2",
+        )
+        self.clear_btn.pack(side=tk.LEFT)
+
+        # === 任务列表 ===
+        jobs_frame = tk.LabelFrame(
+            main_frame,
+            text=" 下载任务 ",
+            bg=self.bg_color,
+            font=("Microsoft YaHei", 10, "bold"),
+        )
+        jobs_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 5))
+
+        columns = {
+            "url": ("链接", 220),
+            "state": ("状态", 60),
+            "progress": ("进度", 80),
+            "speed": ("速度(MB/s)", 80),
+            "eta": ("剩余时间", 70),
+            "done": ("成功", 50),
+            "skipped": ("跳过", 50),
+            "failed": ("失败", 50),
+        }
+        self.job_tree = ttk.Treeview(
+            jobs_frame, columns=list(columns), show="headings", height=5
+        )
+        for key, (heading, width) in columns.items():
+            self.job_tree.heading(key, text=heading)
+            self.job_tree.column(
+                key, width=width, anchor=tk.W if key == "url" else tk.CENTER
+            )
+        self.job_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        # 每行上次显示的内容，没有变化时不刷新
+        self.job_rows = {}
 
         # === 进度条 ===
         self.progress_var = tk.DoubleVar()
@@ -325,7 +335,18 @@ class PippiGUI:
         )
         version_label.pack(side=tk.LEFT, padx=(5, 0))
 
-        self.thread = None
+        # 下载线程只往队列里放日志，由界面线程定时取出显示
+        self.log_queue = queue.Queue()
+        self.original_print = builtins.print
+        builtins.print = self.gui_print
+
+        self.manager = JobManager(
+            max_parallel=self.get_parallel(),
+            bandwidth_limit=self.get_bandwidth_limit(),
+            on_finished=self.on_queue_finished,
+        )
+        self.queue_finished = False
+        self.root.after(POLL_INTERVAL, self.poll)
 
     def browse_folder(self):
         folder = filedialog.askdirectory()
@@ -333,28 +354,107 @@ class PippiGUI:
             self.folder_entry.delete(0, tk.END)
             self.folder_entry.insert(0, folder)
 
+    def gui_print(self, *args, **kwargs):
+        if kwargs.get("file") not in (None, sys.stdout):
+            self.original_print(*args, **kwargs)
+            return
+        self.log(kwargs.get("sep", " ").join(map(str, args)))
+
     def log(self, message):
-        """添加日志"""
+        """添加日志，任何线程都可以调用"""
+        self.log_queue.put(message)
+
+    def flush_log(self):
+        """把队列中的日志一次性写入日志框，超过行数上限时删除最早的日志"""
+        lines = []
+        try:
+            while True:
+                lines.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not lines:
+            return
         self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, message + "\n")
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        count = int(self.log_text.index("end-1c").split(".")[0])
+        if count > MAX_LOG_LINES:
+            self.log_text.delete("1.0", f"{count - MAX_LOG_LINES}.0")
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
 
-    def set_progress(self, current, total):
-        """更新进度"""
-        if total > 0:
+    def poll(self):
+        """定时刷新日志、任务列表和总进度"""
+        try:
+            self.flush_log()
+            self.refresh_jobs()
+            if self.queue_finished:
+                self.queue_finished = False
+                self.download_finished()
+        finally:
+            self.root.after(POLL_INTERVAL, self.poll)
+
+    def refresh_jobs(self):
+        now = time.time()
+        current = total = 0
+        active = False
+        for job in list(self.manager.jobs):
+            speed = job.sample_speed(now) if job.state == RUNNING else 0
+            done, skipped, failed = job.stats()
+            progress = f"{job.current}/{job.total}" if job.total else "-"
+            row = (
+                job.url,
+                job.state,
+                progress,
+                f"{speed / 1024 / 1024:.2f}" if job.state == RUNNING else "-",
+                format_eta(job.eta(now)),
+                done,
+                skipped,
+                failed,
+            )
+            iid = str(job.id)
+            if iid not in self.job_rows:
+                self.job_tree.insert("", tk.END, iid=iid, values=row)
+            elif self.job_rows[iid] != row:
+                self.job_tree.item(iid, values=row)
+            self.job_rows[iid] = row
+            current += job.current
+            total += job.total
+            active = active or job.state in (QUEUED, RUNNING)
+
+        if active and total > 0:
             percentage = (current / total) * 100
             self.progress_var.set(percentage)
             self.progress_label.config(
                 text=f"{current}/{total} ({percentage:.1f}%)", fg="blue"
             )
-            self.root.update_idletasks()
+        self.stop_btn.config(state=tk.NORMAL if active else tk.DISABLED)
+
+    def get_bandwidth_limit(self):
+        """返回限速（字节/秒），0 为不限速"""
+        try:
+            return max(0, int(self.bandwidth_var.get())) * 1024
+        except (tk.TclError, ValueError):
+            return 0
+
+    def get_parallel(self):
+        try:
+            return max(1, int(self.parallel_var.get()))
+        except (tk.TclError, ValueError):
+            return 1
+
+    def apply_bandwidth(self):
+        if hasattr(self, "manager"):
+            self.manager.bandwidth.set_global_rate(self.get_bandwidth_limit())
+
+    def apply_parallel(self):
+        if hasattr(self, "manager"):
+            self.manager.set_parallel(self.get_parallel())
 
     def start_download(self):
-        url = self.url_entry.get().strip()
+        urls = self.url_text.get("1.0", tk.END).split()
         folder = self.folder_entry.get().strip()
 
-        if not url:
+        if not urls:
             messagebox.showwarning("警告", "请输入目标链接！")
             return
 
@@ -362,42 +462,66 @@ class PippiGUI:
             folder = "pippi_images"
             self.folder_entry.insert(0, folder)
 
-        if not url.startswith(("http://", "https://")):
-            messagebox.showwarning("警告", "链接必须以 http:// 或 https:// 开头！")
+        invalid = [u for u in urls if not u.startswith(("http://", "https://"))]
+        if invalid:
+            messagebox.showwarning(
+                "警告", f"链接必须以 http:// 或 https:// 开头！\n{invalid[0]}"
+            )
             return
 
-        # 更新UI
-        self.start_btn.config(state=tk.DISABLED)
+        try:
+            max_pages = max(1, int(self.max_pages_var.get()))
+        except (tk.TclError, ValueError):
+            max_pages = 50
+
+        # 加入下载队列，按顺序自动开始
+        for url in urls:
+            self.manager.add(
+                url,
+                folder,
+                follow_pages=self.follow_pages_var.get(),
+                max_pages=max_pages,
+            )
+        self.log(f"📥 已加入 {len(urls)} 个任务")
+        self.url_text.delete("1.0", tk.END)
         self.stop_btn.config(state=tk.NORMAL)
-        self.progress_var.set(0)
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.delete(1.0, tk.END)
-        self.log_text.config(state=tk.DISABLED)
         self.progress_label.config(text="正在下载...", fg="blue")
 
-        # 启动线程
-        self.thread = SpiderThread(url, folder, self)
-        self.thread.daemon = True
-        self.thread.start()
-
     def stop_download(self):
-        if self.thread:
-            self.thread.stop()
-            self.log("⏹️ 正在停止...")
-            self.stop_btn.config(state=tk.DISABLED)
-
-    def download_finished(self, success, message):
-        self.start_btn.config(state=tk.NORMAL)
+        self.manager.stop()
+        self.log("⏹️ 正在停止...")
         self.stop_btn.config(state=tk.DISABLED)
 
+    def clear_finished(self):
+        self.manager.remove_finished()
+        keep = {str(job.id) for job in self.manager.jobs}
+        for iid in list(self.job_rows):
+            if iid not in keep:
+                self.job_tree.delete(iid)
+                del self.job_rows[iid]
+
+    def on_queue_finished(self):
+        # 在下载线程中调用，只设置标记，由界面线程处理
+        self.queue_finished = True
+
+    def download_finished(self):
         # 重置进度条和状态标签
         self.progress_var.set(0)
         self.progress_label.config(text="就绪", fg="gray")
+        self.stop_btn.config(state=tk.DISABLED)
+        if not self.manager.is_idle():
+            return
 
-        if success:
-            messagebox.showinfo("完成", message)
+        done = skipped = failed = 0
+        for job in self.manager.jobs:
+            d, s, f = job.stats()
+            done, skipped, failed = done + d, skipped + s, failed + f
+        self.log(f"✅ 队列完成！成功: {done}, 跳过: {skipped}, 失败: {failed}")
+        errors = [job for job in self.manager.jobs if job.error]
+        if errors:
+            messagebox.showerror("错误", f"{len(errors)} 个任务出错：{errors[0].error}")
         else:
-            messagebox.showerror("错误", message)
+            messagebox.showinfo("完成", f"下载完成，共 {done} 张新图片")
 
 
 def main():
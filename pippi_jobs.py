@@ -0,0 +1,192 @@
+import itertools
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pippi_bandwidth import BandwidthLimiter
+from pippi_core import RobustImageSpider
+from pippi_retry import CircuitBreaker
+from pippi_scheduler import HostSlots
+
+# 任务状态
+QUEUED = "排队中"
+RUNNING = "下载中"
+DONE = "已完成"
+STOPPED = "已停止"
+ERROR = "出错"
+
+
+class DownloadJob:
+    """一个下载任务（一个目标链接）及其进度"""
+
+    def __init__(self, job_id, url, folder, follow_pages=False, max_pages=50):
+        self.id = job_id
+        self.url = url
+        self.folder = folder
+        self.follow_pages = follow_pages
+        self.max_pages = max_pages
+        self.state = QUEUED
+        self.spider = None
+        self.current = 0
+        self.total = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.stop_requested = False
+        # 计算速度用的上一次采样 (时间, 字节数)
+        self._sample = None
+        self.speed = 0.0
+
+    def set_progress(self, current, total):
+        # 下载线程中调用，只更新字段，界面定时读取
+        self.current = current
+        self.total = total
+
+    def stats(self):
+        """返回 (成功, 跳过, 失败)"""
+        if not self.spider:
+            return 0, 0, 0
+        return (
+            self.spider.downloaded_count,
+            self.spider.skipped_count,
+            self.spider.failed_count,
+        )
+
+    def sample_speed(self, now):
+        """根据两次采样之间下载的字节数计算速度（字节/秒），平滑处理"""
+        downloaded = self.spider.bytes_downloaded if self.spider else 0
+        if self._sample:
+            last_time, last_bytes = self._sample
+            if now > last_time:
+                instant = (downloaded - last_bytes) / (now - last_time)
+                self.speed = self.speed * 0.7 + instant * 0.3
+        self._sample = (now, downloaded)
+        return self.speed
+
+    def eta(self, now):
+        """按已完成图片的平均耗时估算剩余秒数，无法估算时返回 None"""
+        if self.state != RUNNING or not self.started_at or not self.current:
+            return None
+        remaining = self.total - self.current
+        if remaining <= 0:
+            return 0
+        return (now - self.started_at) / self.current * remaining
+
+
+class JobManager:
+    """
+    多任务下载队列
+    任务按加入顺序排队，最多同时运行 max_parallel 个；所有任务共享一个 HTTP 连接池、
+    同一个带宽限制、域名熔断状态和域名并发名额，同一保存目录的任务共享已下载文件索引
+    每个任务仍有自己的调度器和下载线程（停止、进度按任务计算），但同一域名的并发下载
+    由共享的 HostSlots 限制，所有任务合计不超过 per_host_limit
+    """
+
+    def __init__(
+        self, max_parallel=2, bandwidth_limit=0, on_finished=None, per_host_limit=1
+    ):
+        self.max_parallel = max_parallel
+        self.on_finished = on_finished
+        self.jobs = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.bandwidth = BandwidthLimiter(bandwidth_limit)
+        self.breaker = CircuitBreaker()
+        self.host_slots = HostSlots(per_host_limit)
+        self._existing = {}
+        self._spider_lock = threading.Lock()
+
+    def add(self, url, folder, follow_pages=False, max_pages=50):
+        job = DownloadJob(next(self._ids), url, folder, follow_pages, max_pages)
+        with self._lock:
+            self.jobs.append(job)
+        self._dispatch()
+        return job
+
+    def set_parallel(self, n):
+        self.max_parallel = max(1, n)
+        self._dispatch()
+
+    def running(self):
+        with self._lock:
+            return [j for j in self.jobs if j.state == RUNNING]
+
+    def is_idle(self):
+        with self._lock:
+            return not any(j.state in (QUEUED, RUNNING) for j in self.jobs)
+
+    def stop(self, job=None):
+        """停止指定任务，不指定时停止全部任务（包括排队中的）"""
+        with self._lock:
+            targets = [job] if job else list(self.jobs)
+            for j in targets:
+                if j.state == QUEUED:
+                    j.state = STOPPED
+                elif j.state == RUNNING:
+                    j.stop_requested = True
+                    if j.spider:
+                        j.spider.stop()
+
+    def remove_finished(self):
+        with self._lock:
+            self.jobs = [j for j in self.jobs if j.state in (QUEUED, RUNNING)]
+
+    def _dispatch(self):
+        with self._lock:
+            running = sum(1 for j in self.jobs if j.state == RUNNING)
+            for job in self.jobs:
+                if running >= self.max_parallel:
+                    break
+                if job.state == QUEUED:
+                    job.state = RUNNING
+                    job.started_at = time.time()
+                    running += 1
+                    threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _make_spider(self, folder):
+        # 同一目录只扫描一次已下载文件
+        with self._spider_lock:
+            spider = RobustImageSpider(
+                folder, session=self.session, existing_files=self._existing.get(folder)
+            )
+            self._existing.setdefault(folder, spider.existing_files)
+        spider.bandwidth = self.bandwidth
+        spider.breaker = self.breaker
+        spider.host_slots = self.host_slots
+        return spider
+
+    def _run(self, job):
+        try:
+            job.spider = self._make_spider(job.folder)
+            if job.stop_requested:
+                # 开始前已被停止；爬取入口会清除上一次的停止状态，不能先 stop() 再爬取
+                job.state = STOPPED
+                return
+            if job.follow_pages:
+                job.spider.crawl_gallery(
+                    job.url, max_pages=job.max_pages, progress_callback=job.set_progress
+                )
+            else:
+                job.spider.crawl(job.url, progress_callback=job.set_progress)
+            job.state = STOPPED if job.spider.cancel_token.cancelled else DONE
+            done, skipped, failed = job.stats()
+            print(
+                f"✅ {job.url} {job.state}！成功: {done}, 跳过: {skipped}, "
+                f"失败: {failed}"
+            )
+        except Exception as e:
+            job.error = str(e)
+            job.state = ERROR
+            print(f"❌ 错误: {job.error}")
+        finally:
+            job.finished_at = time.time()
+            self._dispatch()
+            if self.on_finished and self.is_idle():
+                self.on_finished()
@@ -0,0 +1,252 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class CrawlJournal:
+    """
+    爬取任务日志（预写式）
+    基于 SQLite WAL 模式，记录目标链接、提取到的图片列表以及每张图片的状态，
+    进程崩溃或用户停止后重新运行可以从中断处继续，无需重新获取和解析页面
+    """
+
+    # 图片状态
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+
+    # 任务状态
+    JOB_EXTRACTED = "extracted"
+    JOB_DONE = "done"
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # GUI 在后台线程中使用，允许跨线程访问，由 _lock 保证串行
+        self.conn = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 已能保证进程崩溃后数据不丢失
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    url TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS images (
+                    job_url TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    url TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_url, idx)
+                );
+                CREATE TABLE IF NOT EXISTS job_links (
+                    job_url TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    PRIMARY KEY (job_url, url)
+                );
+                CREATE TABLE IF NOT EXISTS image_sizes (
+                    url TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL
+                );
+                """
+            )
+
+    def load_images(self, job_url, include_done=False):
+        """
+        返回未完成任务已提取的图片列表，没有记录或任务已完成时返回 None
+        include_done 为 True 时已完成的任务也返回
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT status FROM jobs WHERE url = ?", (job_url,)
+            ).fetchone()
+            if not row or (row[0] != self.JOB_EXTRACTED and not include_done):
+                return None
+            rows = self.conn.execute(
+                "SELECT url FROM images WHERE job_url = ? ORDER BY idx", (job_url,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def record_images(self, job_url, images):
+        """
+        记录任务提取到的图片列表
+        按图片链接合并：已有记录的图片保留状态、尝试次数和错误信息（序号变化时跟随移动），
+        新图片记为待下载，列表中已不存在的图片删除
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = {
+                    idx: (url, state, attempts, error)
+                    for idx, url, state, attempts, error in self.conn.execute(
+                        "SELECT idx, url, state, attempts, error FROM images "
+                        "WHERE job_url = ?",
+                        (job_url,),
+                    )
+                }
+                by_url = {row[0]: row for row in old.values()}
+                rows = []
+                for i, url in enumerate(images, 1):
+                    if old.get(i, (None,))[0] == url:
+                        continue
+                    _, state, attempts, error = by_url.get(
+                        url, (url, self.PENDING, 0, None)
+                    )
+                    rows.append((job_url, i, url, state, attempts, error, now))
+                self.conn.executemany(
+                    "INSERT INTO images "
+                    "(job_url, idx, url, state, attempts, error, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(job_url, idx) DO UPDATE SET url = excluded.url, "
+                    "state = excluded.state, attempts = excluded.attempts, "
+                    "error = excluded.error, updated_at = excluded.updated_at",
+                    rows,
+                )
+                self.conn.execute(
+                    "DELETE FROM images WHERE job_url = ? AND idx > ?",
+                    (job_url, len(images)),
+                )
+                self.conn.execute(
+                    "INSERT INTO jobs (url, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(url) DO UPDATE SET status = excluded.status, "
+                    "updated_at = excluded.updated_at",
+                    (job_url, self.JOB_EXTRACTED, now, now),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def record_links(self, job_url, links):
+        """记录页面中发现的分页链接，恢复时无需重新获取页面"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM job_links WHERE job_url = ?", (job_url,))
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO job_links (job_url, url) VALUES (?, ?)",
+                    [(job_url, url) for url in links],
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def load_links(self, job_url):
+        """返回页面已记录的分页链接"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT url FROM job_links WHERE job_url = ?", (job_url,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def image_states(self, job_url):
+        """返回 {序号: (状态, 尝试次数)}"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT idx, state, attempts FROM images WHERE job_url = ?",
+                (job_url,),
+            ).fetchall()
+        return {idx: (state, attempts) for idx, state, attempts in rows}
+
+    def mark_image(self, job_url, index, state, error=None):
+        """更新单张图片状态，每次调用计为一次尝试"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE images SET state = ?, error = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE job_url = ? AND idx = ?",
+                (state, error, time.time(), job_url, index),
+            )
+
+    def mark_images(self, job_url, indexes, state):
+        """批量更新图片状态"""
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE images SET state = ?, updated_at = ? "
+                "WHERE job_url = ? AND idx = ?",
+                [(state, now, job_url, i) for i in indexes],
+            )
+
+    def record_sizes(self, sizes):
+        """记录图片大小 {图片链接: 字节数}，用于估算下载量"""
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO image_sizes (url, size) VALUES (?, ?)",
+                sizes.items(),
+            )
+
+    def load_sizes(self, urls):
+        """返回已记录的图片大小 {图片链接: 字节数}"""
+        urls = list(urls)
+        sizes = {}
+        with self._lock:
+            for start in range(0, len(urls), 500):
+                batch = urls[start : start + 500]
+                rows = self.conn.execute(
+                    "SELECT url, size FROM image_sizes WHERE url IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                sizes.update(rows)
+        return sizes
+
+    def finish_job(self, job_url):
+        """
+        所有图片都已处理完毕时标记任务完成，返回是否已标记
+        还有失败的图片时任务保持未完成，下次运行直接复用图片列表，只重试失败的图片
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE url = ? "
+                "AND NOT EXISTS (SELECT 1 FROM images WHERE job_url = ? AND state = ?)",
+                (self.JOB_DONE, now, job_url, job_url, self.FAILED),
+            )
+        return cursor.rowcount > 0
+
+    def all_images(self):
+        """返回所有任务的图片 [(任务链接, 序号, 图片链接)]"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT job_url, idx, url FROM images ORDER BY job_url, idx"
+            ).fetchall()
+
+    def failed_images(self, job_url=None):
+        """返回失败的图片 [(任务链接, 序号, 图片链接, 尝试次数, 错误信息)]"""
+        sql = "SELECT job_url, idx, url, attempts, error FROM images WHERE state = ?"
+        params = [self.FAILED]
+        if job_url:
+            sql += " AND job_url = ?"
+            params.append(job_url)
+        with self._lock:
+            return self.conn.execute(sql + " ORDER BY job_url, idx", params).fetchall()
+
+    def summary(self, job_url):
+        """返回任务中各状态的图片数量"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) FROM images WHERE job_url = ? GROUP BY state",
+                (job_url,),
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
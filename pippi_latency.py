@@ -0,0 +1,292 @@
+import io
+import math
+import re
+import threading
+import time
+from array import array
+from collections import deque
+
+import requests
+
+from pippi_cancel import abort_response
+
+CONTENT_RANGE_PATTERN = re.compile(r"bytes\s+(\d+)-\d+/(\d+|\*)")
+
+
+class StalledError(requests.exceptions.Timeout):
+    """传输速度过慢或超过总时限，按超时处理，可以重试"""
+
+
+class StallDetector:
+    """
+    传输卡顿检测：每 window 秒检查一次这段时间的平均速度，低于 min_speed（字节/秒）时中止；
+    传输时间超过 total 秒时中止；限速等待的时间不计入
+    iter_content 凑满一块数据才返回，慢速传输在读取循环里可能很久才有机会检查，
+    所以由后台的监视线程每秒检查一次，卡顿时直接断开连接，读取循环随后抛出 StalledError
+    """
+
+    def __init__(self, min_speed=0, window=10, total=0):
+        self.min_speed = min_speed
+        self.window = window
+        self.total = total
+        self.started = self.mark = time.monotonic()
+        self.received = self.mark_received = 0
+        self.paused = self.mark_paused = 0.0
+        self.pause_started = None
+        self.error = None
+
+    def watch(self, response):
+        """开始监视响应，结束后需要调用 close"""
+        _watchdog.add(self, response)
+
+    def close(self):
+        _watchdog.remove(self)
+
+    def update(self, n):
+        self.received += n
+        self.check()
+
+    def check(self):
+        if self.error:
+            raise self.error
+
+    def pause(self):
+        self.pause_started = time.monotonic()
+
+    def resume(self):
+        self.paused += time.monotonic() - self.pause_started
+        self.pause_started = None
+
+    def poll(self):
+        """由监视线程调用，发现卡顿时记录错误并返回 True"""
+        now = time.monotonic()
+        paused = self.paused
+        pause_started = self.pause_started
+        if pause_started is not None:
+            paused += now - pause_started
+        if self.total and now - self.started - paused > self.total:
+            self.error = StalledError(f"超过总时限 {self.total:g} 秒")
+            return True
+        elapsed = now - self.mark - (paused - self.mark_paused)
+        if elapsed < self.window:
+            return False
+        received = self.received
+        speed = (received - self.mark_received) / elapsed
+        if speed < self.min_speed:
+            self.error = StalledError(f"速度过慢 {speed / 1024:.1f} KB/s")
+            return True
+        self.mark, self.mark_received, self.mark_paused = now, received, paused
+        return False
+
+
+class StallWatchdog:
+    """所有传输共用的监视线程，每 interval 秒检查一次正在进行的传输"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._watched = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, detector, response):
+        with self._lock:
+            self._watched[id(detector)] = (detector, response)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def remove(self, detector):
+        with self._lock:
+            self._watched.pop(id(detector), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watched = list(self._watched.values())
+            for detector, response in watched:
+                if detector.error is None and detector.poll():
+                    abort_response(response)
+
+
+_watchdog = StallWatchdog()
+
+
+def percentile(values, p):
+    """已排序列表的 p 分位数（最近秩法）"""
+    rank = math.ceil(p / 100 * len(values))
+    return values[min(len(values) - 1, max(0, rank - 1))]
+
+
+class LatencyTracker:
+    """
+    记录每张图片的下载耗时（从发出请求到写完数据），统计尾延迟，并为备用请求计算触发时间
+    全部耗时用 float 数组保存，百万张图片约 4 MB；备用请求只参考最近 recent 张
+    """
+
+    def __init__(self, recent=500, min_samples=20):
+        self.samples = array("f")
+        self.recent = deque(maxlen=recent)
+        self.min_samples = min_samples
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.stalls = 0
+        self._sorted = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+            self.recent.append(seconds)
+            self._sorted = None
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def hedge_delay(self, p):
+        """最近下载耗时的 p 分位数，样本不足时返回 None"""
+        with self._lock:
+            if len(self.recent) < self.min_samples:
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self.recent)
+            return percentile(self._sorted, p)
+
+    def summary(self):
+        with self._lock:
+            values = sorted(self.samples)
+        if not values:
+            return None
+        parts = [f"p{p} {percentile(values, p):.1f}s" for p in (50, 90, 99)]
+        text = f"⏱️ 单张耗时: {' / '.join(parts)} / 最长 {values[-1]:.1f}s"
+        if self.stalls:
+            text += f"，卡顿中止 {self.stalls} 次"
+        if self.hedged:
+            text += f"，备用请求 {self.hedged} 次（先完成 {self.hedge_wins} 次）"
+        return text
+
+
+class HedgedRequest:
+    """
+    备用请求：主请求 delay 秒后还没完成时，从主请求已写入的位置用 Range 再请求一次，
+    先完成的一方胜出，另一方断开；服务器不支持 Range 时备用请求从头下载
+    备用请求的数据先放在内存中，胜出后由主线程接在已写入的数据后面
+    on_chunk(n, stall) 在每收到一块数据后调用，负责限速，字节数由调用方在胜出后按实际写入的部分统计；
+    stall_factory() 创建卡顿检测
+    """
+
+    def __init__(
+        self, session, url, headers, timeout, primary, delay, on_chunk, stall_factory
+    ):
+        self.session = session
+        self.url = url
+        self.headers = headers
+        self.timeout = timeout
+        self.primary = primary
+        self.delay = delay
+        self.on_chunk = on_chunk
+        self.stall_factory = stall_factory
+        # 主请求已写入的字节数，由主线程更新
+        self.offset = 0
+        self.start = 0
+        self.buffer = io.BytesIO()
+        self.launched = False
+        self.won = False
+        self.cancelled = False
+        self.response = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def begin(self):
+        self._thread.start()
+
+    def _run(self):
+        if self._wake.wait(self.delay):
+            return
+        with self._lock:
+            if self.cancelled:
+                return
+            self.launched = True
+            start = self.offset
+        headers = dict(self.headers)
+        if start:
+            headers["Range"] = f"bytes={start}-"
+        try:
+            r = self.session.get(
+                self.url, headers=headers, timeout=self.timeout, stream=True
+            )
+            with self._lock:
+                self.response = r
+                if self.cancelled:
+                    r.close()
+                    return
+            r.raise_for_status()
+            self.start, expected = _response_range(r)
+            if self.start > start:
+                return
+            stall = self.stall_factory()
+            stall.watch(r)
+            try:
+                for chunk in r.iter_content(chunk_size=8192):
+                    if self.cancelled:
+                        return
+                    if chunk:
+                        self.buffer.write(chunk)
+                        stall.update(len(chunk))
+                        self.on_chunk(len(chunk), stall)
+                stall.check()
+            finally:
+                stall.close()
+            if expected is not None and self.start + self.buffer.tell() != expected:
+                return
+            with self._lock:
+                if self.cancelled:
+                    return
+                self.won = True
+            abort_response(self.primary)
+        except Exception:
+            # 备用请求失败不影响主请求
+            pass
+        finally:
+            if self.response is not None:
+                self.response.close()
+
+    def wait(self, token):
+        """主请求失败后等待备用请求结束，停止时立即返回"""
+        while self._thread.is_alive() and not token.cancelled:
+            self._thread.join(0.2)
+
+    def cancel(self):
+        """主请求完成时调用，断开备用请求；备用请求已经胜出时返回 False"""
+        with self._lock:
+            if self.won:
+                return False
+            self.cancelled = True
+            response = self.response
+        self._wake.set()
+        if response is not None:
+            abort_response(response)
+        return True
+
+    def write_rest(self, sink, written):
+        """把备用请求中主请求还没写入的部分写入 sink，返回完整的文件大小"""
+        data = self.buffer.getvalue()
+        sink.write(data[written - self.start :])
+        return self.start + len(data)
+
+
+def _response_range(response):
+    """返回 (数据起始位置, 完整文件大小)，大小未知时为 None"""
+    if response.status_code == 206:
+        match = CONTENT_RANGE_PATTERN.match(response.headers.get("Content-Range", ""))
+        if not match:
+            raise ValueError("无法解析 Content-Range")
+        total = match.group(2)
+        return int(match.group(1)), None if total == "*" else int(total)
+    length = response.headers.get("Content-Length")
+    if not length or not length.isdigit() or response.headers.get("Content-Encoding"):
+        # 压缩传输时 Content-Length 是压缩后的大小
+        return 0, None
+    return 0, int(length)
@@ -0,0 +1,315 @@
+import hashlib
+import os
+import re
+import sqlite3
+import tarfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+BLOCK = tarfile.BLOCKSIZE
+# tar 归档结尾的两个空块
+END_OF_ARCHIVE = b"\0" * (BLOCK * 2)
+
+
+class FileSink:
+    """
+    普通文件输出：每张图片一个文件
+    先写入同目录下以 . 开头的临时文件，完成后再改名，进程崩溃时不会留下不完整的图片
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.temp = self.path.with_name(f".{self.path.name}.part")
+        self.f = open(self.temp, "wb")
+
+    def write(self, data):
+        self.f.write(data)
+
+    def commit(self):
+        self.f.close()
+        os.replace(self.temp, self.path)
+
+    def abort(self):
+        self.f.close()
+        self.temp.unlink(missing_ok=True)
+
+
+class PackEntry:
+    """
+    正在写入分包的一张图片
+    先写一个占位的 tar 头，数据直接流式写入分包，完成后回填真正的 tar 头并写入索引；
+    中途失败时把分包截断回写入前的位置
+    """
+
+    def __init__(self, store, shard, name, member):
+        self.store = store
+        self.shard = shard
+        self.name = name
+        self.member = member
+        self.f = shard["file"]
+        self.offset = shard["end"]
+        self.size = 0
+        self.f.seek(self.offset)
+        self.f.write(b"\0" * BLOCK)
+
+    def write(self, data):
+        self.f.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        padding = (BLOCK - self.size % BLOCK) % BLOCK
+        self.f.write(b"\0" * padding)
+        end = self.f.tell()
+        self.f.write(END_OF_ARCHIVE)
+
+        info = tarfile.TarInfo(self.member)
+        info.size = self.size
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self.f.seek(self.offset)
+        self.f.write(info.tobuf(format=tarfile.USTAR_FORMAT))
+        self.f.flush()
+
+        self.store._commit(
+            self.shard, self.name, self.member, self.offset, self.size, end
+        )
+
+    def abort(self):
+        self.f.seek(self.offset)
+        self.f.truncate()
+        self.f.write(END_OF_ARCHIVE)
+        self.f.flush()
+        self.store._release(self.shard)
+
+
+class PackStore:
+    """
+    分包输出
+    图片不再单独保存，而是按图集写入 tar 分包（每个分包不超过 max_shard_bytes），
+    避免网络文件系统和对象存储上海量小文件的元数据开销；
+    旁边的 SQLite 索引记录每张图片所在的分包和偏移，存在检查和单张读取都只需一次查询
+    """
+
+    def __init__(self, folder, max_shard_bytes=512 * 1024 * 1024):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_shard_bytes = max_shard_bytes
+        self._lock = threading.Lock()
+        self._shards = {}
+        self.conn = sqlite3.connect(
+            str(self.folder / "index.db"), check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS shards (
+                name TEXT PRIMARY KEY,
+                group_key TEXT NOT NULL,
+                end_offset INTEGER NOT NULL,
+                entries INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                name TEXT PRIMARY KEY,
+                stem TEXT NOT NULL,
+                shard TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                member TEXT
+            );
+            CREATE INDEX IF NOT EXISTS entries_stem ON entries (stem);
+            CREATE INDEX IF NOT EXISTS entries_shard ON entries (shard);
+            """)
+        # 旧版本的索引没有 member 列（tar 中的文件名，与 name 相同时为空）
+        columns = [r[1] for r in self.conn.execute("PRAGMA table_info(entries)")]
+        if "member" not in columns:
+            self.conn.execute("ALTER TABLE entries ADD COLUMN member TEXT")
+
+    @staticmethod
+    def group_key(url):
+        """由图集链接生成分包名前缀，如 foamgirl.net_12345_a1b2c3"""
+        parsed = urlparse(url)
+        slug = f"{parsed.netloc}_{Path(parsed.path).stem}".strip("_")
+        slug = re.sub(r"[^0-9A-Za-z._-]", "_", slug)[:40]
+        return f"{slug}_{hashlib.md5(url.encode()).hexdigest()[:6]}"
+
+    def _checkout(self, group):
+        """取一个该图集空闲且未写满的分包，没有时新建"""
+        with self._lock:
+            for shard in self._shards.values():
+                if (
+                    shard["group"] == group
+                    and not shard["busy"]
+                    and shard["end"] < self.max_shard_bytes
+                ):
+                    shard["busy"] = True
+                    return shard
+
+            rows = self.conn.execute(
+                "SELECT name, end_offset FROM shards WHERE group_key = ? "
+                "AND end_offset < ? ORDER BY name",
+                (group, self.max_shard_bytes),
+            ).fetchall()
+            for name, end in rows:
+                if name not in self._shards:
+                    return self._open_shard(name, group, end)
+
+            count = self.conn.execute(
+                "SELECT COUNT(*) FROM shards WHERE group_key = ?", (group,)
+            ).fetchone()[0]
+            name = f"{group}-{count + 1:04d}.tar"
+            self.conn.execute(
+                "INSERT INTO shards (name, group_key, end_offset) VALUES (?, ?, 0)",
+                (name, group),
+            )
+            return self._open_shard(name, group, 0)
+
+    def _open_shard(self, name, group, end):
+        path = self.folder / name
+        f = open(path, "r+b" if path.exists() else "w+b")
+        # 截掉上次崩溃时写了一半的数据
+        f.seek(end)
+        f.truncate()
+        f.write(END_OF_ARCHIVE)
+        shard = {"name": name, "group": group, "file": f, "end": end, "busy": True}
+        self._shards[name] = shard
+        return shard
+
+    def _commit(self, shard, name, member, offset, size, end):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO entries "
+                    "(name, stem, shard, offset, size, member) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        name,
+                        os.path.splitext(name)[0],
+                        shard["name"],
+                        offset,
+                        size,
+                        member if member != name else None,
+                    ),
+                )
+                self.conn.execute(
+                    "UPDATE shards SET end_offset = ?, entries = entries + 1 "
+                    "WHERE name = ?",
+                    (end, shard["name"]),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            shard["end"] = end
+            shard["busy"] = False
+
+    def _release(self, shard):
+        with self._lock:
+            shard["busy"] = False
+
+    def open_entry(self, group, name):
+        """
+        开始写入一张图片，返回有 write/commit/abort 的对象
+        索引按原文件名记录；tar 中的文件名超过 100 字节时缩短，只影响解包工具看到的名字
+        """
+        member = name
+        if len(name.encode("utf-8")) > 100:
+            # USTAR 头中的文件名最长 100 字节，按字节截断（中文一个字 3 字节）
+            stem, ext = os.path.splitext(name)
+            stem = stem.encode("utf-8")[:40].decode("utf-8", "ignore")
+            member = f"{stem}_{hashlib.md5(name.encode()).hexdigest()[:8]}{ext}"
+        shard = self._checkout(group)
+        try:
+            return PackEntry(self, shard, name, member)
+        except Exception:
+            self._release(shard)
+            raise
+
+    def contains(self, stem):
+        with self._lock:
+            return (
+                self.conn.execute(
+                    "SELECT 1 FROM entries WHERE stem = ? LIMIT 1", (stem,)
+                ).fetchone()
+                is not None
+            )
+
+    def contains_many(self, stems):
+        """返回 stems 中已在分包里的文件名集合，分批查询"""
+        stems = list(stems)
+        found = set()
+        with self._lock:
+            for start in range(0, len(stems), 500):
+                batch = stems[start : start + 500]
+                rows = self.conn.execute(
+                    "SELECT DISTINCT stem FROM entries WHERE stem IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update(r[0] for r in rows)
+        return found
+
+    def stems(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT stem FROM entries").fetchall()
+        return [r[0] for r in rows]
+
+    def read(self, name):
+        """读取分包中的一张图片，不存在时返回 None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT shard, offset, size FROM entries WHERE name = ?", (name,)
+            ).fetchone()
+        if not row:
+            return None
+        shard, offset, size = row
+        with open(self.folder / shard, "rb") as f:
+            f.seek(offset + BLOCK)
+            return f.read(size)
+
+    def export(self, dest, group=None):
+        """把分包中的图片解包为普通文件，返回导出的数量"""
+        dest = Path(dest)
+        dest.mkdir(parents=True, exist_ok=True)
+        sql = (
+            "SELECT e.name, e.shard, e.offset, e.size FROM entries e "
+            "JOIN shards s ON s.name = e.shard"
+        )
+        params = ()
+        if group:
+            sql += " WHERE s.group_key = ?"
+            params = (group,)
+        with self._lock:
+            rows = self.conn.execute(sql + " ORDER BY e.shard, e.offset", params)
+            rows = rows.fetchall()
+
+        count = 0
+        handles = {}
+        try:
+            for name, shard, offset, size in rows:
+                if shard not in handles:
+                    handles[shard] = open(self.folder / shard, "rb")
+                f = handles[shard]
+                f.seek(offset + BLOCK)
+                with open(dest / name, "wb") as out:
+                    remaining = size
+                    while remaining:
+                        data = f.read(min(remaining, 1024 * 1024))
+                        if not data:
+                            break
+                        out.write(data)
+                        remaining -= len(data)
+                count += 1
+        finally:
+            for f in handles.values():
+                f.close()
+        return count
+
+    def close(self):
+        with self._lock:
+            for shard in self._shards.values():
+                shard["file"].close()
+            self._shards.clear()
+            self.conn.close()
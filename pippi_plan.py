@@ -0,0 +1,107 @@
+import hashlib
+from collections import Counter
+
+# 计划中每张图片的处理方式
+NEW = "new"  # 需要下载
+EXISTS = "exists"  # 文件已存在
+FINISHED = "finished"  # 任务日志中已完成
+
+STATE_LABELS = {NEW: "需要下载", EXISTS: "已存在", FINISHED: "日志中已完成"}
+
+
+def format_size(n):
+    if n >= 1024**3:
+        return f"{n / 1024**3:.2f} GB"
+    if n >= 1024**2:
+        return f"{n / 1024**2:.1f} MB"
+    return f"{n / 1024:.1f} KB"
+
+
+def resolve_collisions(names):
+    """
+    处理同一批图片中的重名
+    names 为按顺序排列的 [(序号, 图片链接, 文件名, 扩展名)]，文件名截断到 50 个字符后不同链接可能重名，
+    第一个保留原名，之后的在文件名后加上链接的哈希；返回 ({序号: (文件名, 扩展名)}, 改名的序号集合)
+    """
+    owners = {}
+    resolved = {}
+    renamed = set()
+    for index, url, stem, ext in names:
+        owner = owners.setdefault(stem, url)
+        if owner != url:
+            stem = f"{stem[:43]}_{hashlib.md5(url.encode()).hexdigest()[:6]}"
+            owners.setdefault(stem, url)
+            renamed.add(index)
+        resolved[index] = (stem, ext)
+    return resolved, renamed
+
+
+class PlanItem:
+    def __init__(self, index, url, stem, ext, state, size=None, renamed=False):
+        self.index = index
+        self.url = url
+        self.stem = stem
+        self.ext = ext
+        self.state = state
+        self.size = size
+        self.renamed = renamed
+
+    @property
+    def filename(self):
+        return f"{self.stem}{self.ext}"
+
+
+class DownloadPlan:
+    """一个任务的下载计划：每张图片的文件名、处理方式和大小（未知时为 None）"""
+
+    def __init__(self, job_url, items):
+        self.job_url = job_url
+        self.items = items
+
+    def pending(self):
+        return [item for item in self.items if item.state == NEW]
+
+    def counts(self):
+        return Counter(item.state for item in self.items)
+
+    def renamed(self):
+        return sum(1 for item in self.items if item.renamed)
+
+    def estimated_bytes(self):
+        """
+        估算需要下载的字节数，返回 (估算值, 已知大小的图片数)
+        大小未知的图片按已知图片的平均大小计算
+        """
+        pending = self.pending()
+        sizes = [item.size for item in pending if item.size is not None]
+        if not sizes:
+            return None, 0
+        average = sum(sizes) / len(sizes)
+        return int(sum(sizes) + average * (len(pending) - len(sizes))), len(sizes)
+
+    def summary(self):
+        counts = self.counts()
+        parts = [
+            f"{STATE_LABELS[s]} {counts[s]}"
+            for s in (NEW, EXISTS, FINISHED)
+            if counts[s]
+        ]
+        text = f"📋 下载计划: 共 {len(self.items)} 张，" + ", ".join(parts)
+        if self.renamed():
+            text += f"，重名改名 {self.renamed()}"
+        estimate, known = self.estimated_bytes()
+        if estimate is not None:
+            text += f"，预计 {format_size(estimate)}"
+            if known < counts[NEW]:
+                text += f"（按 {known} 张已知大小估算）"
+        return text
+
+    def write(self, path, append=True):
+        """写入计划文件，每行: 任务链接<TAB>序号<TAB>图片链接<TAB>文件名<TAB>处理方式<TAB>大小"""
+        with open(path, "a" if append else "w", encoding="utf-8") as f:
+            for item in self.items:
+                size = "" if item.size is None else item.size
+                f.write(
+                    f"{self.job_url}\t{item.index}\t{item.url}\t{item.filename}\t"
+                    f"{item.state}\t{size}\n"
+                )
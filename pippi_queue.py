@@ -0,0 +1,716 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from pippi_frontier import canonicalize_url
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# 任务类型：page 为需要解析的页面，image 为需要下载的图片
+PAGE = "page"
+IMAGE = "image"
+
+# 任务状态
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# 限速表中表示全局限速的键
+GLOBAL = "*"
+
+# 共享限速空闲时最多积累的秒数，与 TokenBucket 的 burst 相同
+BURST = 1.0
+
+
+# 领取任务的 Lua 脚本：到期的延迟任务和租约回到队列、取出一个任务、记录领取者和租约，
+# 在服务器上一次执行完，节点在中途崩溃也不会丢失任务
+# KEYS: pending, delayed, leases, 任务哈希键名前缀；ARGV: 节点, 当前时间, 租约到期时间
+CLAIM_SCRIPT = """
+for _, key in ipairs({KEYS[2], KEYS[3]}) do
+    for _, id in ipairs(redis.call('ZRANGEBYSCORE', key, '-inf', ARGV[2])) do
+        redis.call('ZREM', key, id)
+        redis.call('HDEL', KEYS[4] .. id, 'owner')
+        redis.call('RPUSH', KEYS[1], id)
+    end
+end
+local id = redis.call('LPOP', KEYS[1])
+if not id then
+    return false
+end
+redis.call('HSET', KEYS[4] .. id, 'owner', ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[3], id)
+return id
+"""
+
+
+def _claim_local(r, keys, args):
+    """CLAIM_SCRIPT 在 LocalRedis 上的等价实现"""
+    pending, delayed, leases, task_prefix = keys
+    worker, now, lease_until = args
+    for key in (delayed, leases):
+        for task_id in r.zrangebyscore(key, "-inf", now):
+            r.zrem(key, task_id)
+            r.hdel(task_prefix + task_id, "owner")
+            r.rpush(pending, task_id)
+    task_id = r.lpop(pending)
+    if task_id is None:
+        return None
+    r.hset(task_prefix + task_id, "owner", worker)
+    r.zadd(leases, {task_id: lease_until})
+    return task_id
+
+
+def task_key(kind, url, job="", idx=0):
+    """任务去重键：页面按规范化链接，图片按所属页面和序号"""
+    if kind == PAGE:
+        return f"{PAGE}:{canonicalize_url(url)}"
+    return f"{IMAGE}:{job}#{idx}"
+
+
+def open_queue(spec):
+    """
+    按描述打开分布式任务队列
+      sqlite:///data/queue.db 或直接写路径   单机多进程，SQLite 文件
+      redis://host:6379/0                     多机，Redis 兼容服务器
+      memory://                               进程内的 Redis 替身，用于测试
+    """
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisWorkQueue.from_url(spec)
+    if spec.startswith("memory://"):
+        return RedisWorkQueue(LocalRedis())
+    if spec.startswith("sqlite://"):
+        # sqlite:///data/queue.db 为绝对路径，sqlite://queue.db 为相对路径
+        spec = spec[len("sqlite://") :]
+    return SQLiteWorkQueue(spec)
+
+
+class SQLiteWorkQueue:
+    """
+    基于 SQLite 文件的任务队列，同一台机器上的多个进程可以共享
+    工作节点领取任务时获得一个租约，租约到期未完成（节点崩溃或失联）的任务自动回到队列；
+    同时保存共享的已下载文件索引、限速设置和按域名的带宽预约
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                job TEXT NOT NULL DEFAULT '',
+                idx INTEGER NOT NULL DEFAULT 0,
+                grp TEXT NOT NULL DEFAULT '',
+                depth INTEGER NOT NULL DEFAULT 0,
+                follow INTEGER NOT NULL DEFAULT 0,
+                max_pages INTEGER NOT NULL DEFAULT 0,
+                stem TEXT NOT NULL DEFAULT '',
+                ext TEXT NOT NULL DEFAULT '',
+                state TEXT NOT NULL,
+                owner TEXT,
+                lease_until REAL NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, available_at);
+            CREATE INDEX IF NOT EXISTS tasks_group ON tasks (grp, kind);
+            CREATE TABLE IF NOT EXISTS file_index (
+                stem TEXT PRIMARY KEY
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS rates (
+                host TEXT PRIMARY KEY,
+                rate INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS budgets (
+                host TEXT PRIMARY KEY,
+                next_time REAL NOT NULL
+            );
+            """)
+        # 旧版本的队列没有计划文件名（stem、ext）列
+        columns = [r[1] for r in self.conn.execute("PRAGMA table_info(tasks)")]
+        for column in ("stem", "ext"):
+            if column not in columns:
+                self.conn.execute(
+                    f"ALTER TABLE tasks ADD COLUMN {column} TEXT NOT NULL DEFAULT ''"
+                )
+
+    def _transaction(self, fn):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+                self.conn.execute("COMMIT")
+                return result
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def submit(
+        self,
+        kind,
+        url,
+        job="",
+        idx=0,
+        group="",
+        depth=0,
+        follow=False,
+        max_pages=0,
+        stem="",
+        ext="",
+    ):
+        """
+        加入一个任务，已存在时忽略，返回是否加入
+        页面任务的 max_pages 大于 0 时，同一图集（group）最多加入 max_pages 个页面；
+        图片任务的 stem/ext 为下载计划中（处理重名后）的文件名和扩展名
+        """
+
+        def insert():
+            if kind == PAGE and max_pages > 0:
+                count = self.conn.execute(
+                    "SELECT COUNT(*) FROM tasks WHERE grp = ? AND kind = ?",
+                    (group, PAGE),
+                ).fetchone()[0]
+                if count >= max_pages:
+                    return False
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO tasks (key, kind, url, job, idx, grp, depth, "
+                "follow, max_pages, stem, ext, state) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    task_key(kind, url, job, idx),
+                    kind,
+                    url,
+                    job,
+                    idx,
+                    group,
+                    depth,
+                    int(follow),
+                    max_pages,
+                    stem,
+                    ext,
+                    PENDING,
+                ),
+            )
+            return cursor.rowcount > 0
+
+        return self._transaction(insert)
+
+    def claim(self, worker, lease=60):
+        """按加入顺序领取一个可执行的任务，返回任务字典，没有任务时返回 None"""
+
+        def take():
+            now = time.time()
+            # 租约到期的任务回到队列
+            self.conn.execute(
+                "UPDATE tasks SET state = ?, owner = NULL "
+                "WHERE state = ? AND lease_until < ?",
+                (PENDING, LEASED, now),
+            )
+            row = self.conn.execute(
+                "SELECT id, kind, url, job, idx, grp, depth, follow, max_pages, "
+                "stem, ext, attempts FROM tasks WHERE state = ? AND available_at <= ? "
+                "ORDER BY id LIMIT 1",
+                (PENDING, now),
+            ).fetchone()
+            if not row:
+                return None
+            self.conn.execute(
+                "UPDATE tasks SET state = ?, owner = ?, lease_until = ? WHERE id = ?",
+                (LEASED, worker, now + lease, row[0]),
+            )
+            return dict(
+                zip(
+                    (
+                        "id",
+                        "kind",
+                        "url",
+                        "job",
+                        "idx",
+                        "group",
+                        "depth",
+                        "follow",
+                        "max_pages",
+                        "stem",
+                        "ext",
+                        "attempts",
+                    ),
+                    row,
+                )
+            )
+
+        task = self._transaction(take)
+        if task:
+            task["follow"] = bool(task["follow"])
+        return task
+
+    def renew(self, task, worker, lease=60):
+        """延长租约，租约已经丢失（被其他节点领走）时返回 False"""
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE tasks SET lease_until = ? "
+                "WHERE id = ? AND state = ? AND owner = ?",
+                (time.time() + lease, task["id"], LEASED, worker),
+            )
+            return cursor.rowcount > 0
+
+    def complete(self, task, worker):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE tasks SET state = ?, owner = NULL, error = NULL "
+                "WHERE id = ? AND owner = ?",
+                (DONE, task["id"], worker),
+            )
+
+    def fail(self, task, worker, error=None, retry_delay=None):
+        """
+        报告任务失败，retry_delay 不为 None 时延迟后重新排队，否则记为最终失败
+        """
+        state = PENDING if retry_delay is not None else FAILED
+        with self._lock:
+            self.conn.execute(
+                "UPDATE tasks SET state = ?, owner = NULL, attempts = attempts + 1, "
+                "error = ?, available_at = ? WHERE id = ? AND owner = ?",
+                (
+                    state,
+                    error,
+                    time.time() + (retry_delay or 0),
+                    task["id"],
+                    worker,
+                ),
+            )
+
+    def release(self, task, worker):
+        """放弃租约，任务立即回到队列（节点停止时使用）"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE tasks SET state = ?, owner = NULL WHERE id = ? AND owner = ?",
+                (PENDING, task["id"], worker),
+            )
+
+    def stats(self):
+        """返回各状态的任务数"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) FROM tasks GROUP BY state"
+            ).fetchall()
+        counts = dict.fromkeys((PENDING, LEASED, DONE, FAILED), 0)
+        counts.update(rows)
+        return counts
+
+    def is_drained(self):
+        """没有待执行和执行中的任务"""
+        counts = self.stats()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def failed_tasks(self):
+        """返回最终失败的图片 [(任务链接, 序号, 图片链接, 尝试次数, 错误信息)]"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT job, idx, url, attempts, error FROM tasks "
+                "WHERE state = ? AND kind = ? ORDER BY id",
+                (FAILED, IMAGE),
+            ).fetchall()
+
+    def index_contains(self, stem):
+        with self._lock:
+            return (
+                self.conn.execute(
+                    "SELECT 1 FROM file_index WHERE stem = ?", (stem,)
+                ).fetchone()
+                is not None
+            )
+
+    def index_add(self, stem):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO file_index (stem) VALUES (?)", (stem,)
+            )
+
+    def set_rate(self, host, rate):
+        """设置共享限速（字节/秒），host 为 GLOBAL 时为全局限速，0 为不限速"""
+        with self._lock:
+            if rate > 0:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO rates (host, rate) VALUES (?, ?)",
+                    (host.lower(), int(rate)),
+                )
+            else:
+                self.conn.execute("DELETE FROM rates WHERE host = ?", (host.lower(),))
+
+    def rates(self):
+        with self._lock:
+            return dict(self.conn.execute("SELECT host, rate FROM rates").fetchall())
+
+    def reserve(self, host, n, rate):
+        """在共享令牌桶中为 n 个字节预约带宽，返回需要等待的秒数"""
+
+        def take():
+            now = time.time()
+            row = self.conn.execute(
+                "SELECT next_time FROM budgets WHERE host = ?", (host,)
+            ).fetchone()
+            next_time = max(row[0] if row else 0, now - BURST) + n / rate
+            self.conn.execute(
+                "INSERT OR REPLACE INTO budgets (host, next_time) VALUES (?, ?)",
+                (host, next_time),
+            )
+            return max(0.0, next_time - now)
+
+        return self._transaction(take)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class RedisWorkQueue:
+    """
+    基于 Redis 兼容服务器的任务队列，多台机器共享
+    数据结构（键名前缀为 prefix）：
+      task:<id>   任务字段（哈希）          keys      已加入任务的去重键（集合）
+      pending     待执行的任务编号（列表）  delayed   延迟重试的任务（有序集合，分数为可执行时间）
+      leases      执行中的任务（有序集合，分数为租约到期时间）
+      failed      最终失败的任务编号（集合）  done      已完成数（计数器）
+      index       已下载文件名（集合）      rates     限速设置（哈希）
+      budget:<域名>  共享令牌桶的下一个可用时间
+    领取任务用 Lua 脚本（CLAIM_SCRIPT）在服务器上原子执行；
+    节点间按各自的系统时间计算租约和限速，需要保持时钟同步（NTP）
+    """
+
+    def __init__(self, client, prefix="pippi"):
+        self.r = client
+        self.prefix = prefix
+        self._claim = client.register_script(CLAIM_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url, prefix="pippi"):
+        if redis is None:
+            raise RuntimeError("使用 Redis 队列需要安装 redis: pip install redis")
+        return cls(redis.Redis.from_url(url, decode_responses=True), prefix)
+
+    def _k(self, *parts):
+        return ":".join((self.prefix,) + tuple(str(p) for p in parts))
+
+    def submit(
+        self,
+        kind,
+        url,
+        job="",
+        idx=0,
+        group="",
+        depth=0,
+        follow=False,
+        max_pages=0,
+        stem="",
+        ext="",
+    ):
+        if not self.r.sadd(self._k("keys"), task_key(kind, url, job, idx)):
+            return False
+        if kind == PAGE and max_pages > 0:
+            if self.r.hincrby(self._k("pages"), group, 1) > max_pages:
+                return False
+        task_id = self.r.incr(self._k("seq"))
+        self.r.hset(
+            self._k("task", task_id),
+            mapping={
+                "kind": kind,
+                "url": url,
+                "job": job,
+                "idx": idx,
+                "group": group,
+                "depth": depth,
+                "follow": int(follow),
+                "max_pages": max_pages,
+                "stem": stem,
+                "ext": ext,
+                "attempts": 0,
+            },
+        )
+        self.r.rpush(self._k("pending"), task_id)
+        return True
+
+    def claim(self, worker, lease=60):
+        now = time.time()
+        task_id = self._claim(
+            keys=[
+                self._k("pending"),
+                self._k("delayed"),
+                self._k("leases"),
+                self._k("task", ""),
+            ],
+            args=[worker, now, now + lease],
+        )
+        if task_id is None:
+            return None
+        fields = self.r.hgetall(self._k("task", task_id))
+        return {
+            "id": int(task_id),
+            "kind": fields["kind"],
+            "url": fields["url"],
+            "job": fields["job"],
+            "idx": int(fields["idx"]),
+            "group": fields["group"],
+            "depth": int(fields["depth"]),
+            "follow": fields["follow"] == "1",
+            "max_pages": int(fields["max_pages"]),
+            "stem": fields.get("stem", ""),
+            "ext": fields.get("ext", ""),
+            "attempts": int(fields["attempts"]),
+        }
+
+    def _owned(self, task, worker):
+        return self.r.hget(self._k("task", task["id"]), "owner") == worker
+
+    def renew(self, task, worker, lease=60):
+        key = self._k("leases")
+        if not self._owned(task, worker) or self.r.zscore(key, task["id"]) is None:
+            return False
+        self.r.zadd(key, {task["id"]: time.time() + lease})
+        return True
+
+    def _finish(self, task, worker):
+        # 租约已被其他节点接手时不再处理
+        if not self._owned(task, worker):
+            return False
+        if not self.r.zrem(self._k("leases"), task["id"]):
+            return False
+        self.r.hdel(self._k("task", task["id"]), "owner")
+        return True
+
+    def complete(self, task, worker):
+        if self._finish(task, worker):
+            self.r.incr(self._k("done"))
+
+    def fail(self, task, worker, error=None, retry_delay=None):
+        if not self._finish(task, worker):
+            return
+        key = self._k("task", task["id"])
+        self.r.hincrby(key, "attempts", 1)
+        self.r.hset(key, "error", error or "")
+        if retry_delay is None:
+            self.r.sadd(self._k("failed"), task["id"])
+        else:
+            self.r.zadd(self._k("delayed"), {task["id"]: time.time() + retry_delay})
+
+    def release(self, task, worker):
+        if self._finish(task, worker):
+            self.r.rpush(self._k("pending"), task["id"])
+
+    def stats(self):
+        return {
+            PENDING: self.r.llen(self._k("pending")) + self.r.zcard(self._k("delayed")),
+            LEASED: self.r.zcard(self._k("leases")),
+            DONE: int(self.r.get(self._k("done")) or 0),
+            FAILED: self.r.scard(self._k("failed")),
+        }
+
+    def is_drained(self):
+        counts = self.stats()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def failed_tasks(self):
+        rows = []
+        for task_id in sorted(self.r.smembers(self._k("failed")), key=int):
+            fields = self.r.hgetall(self._k("task", task_id))
+            if fields.get("kind") == IMAGE:
+                rows.append(
+                    (
+                        fields["job"],
+                        int(fields["idx"]),
+                        fields["url"],
+                        int(fields["attempts"]),
+                        fields.get("error"),
+                    )
+                )
+        return rows
+
+    def index_contains(self, stem):
+        return bool(self.r.sismember(self._k("index"), stem))
+
+    def index_add(self, stem):
+        self.r.sadd(self._k("index"), stem)
+
+    def set_rate(self, host, rate):
+        if rate > 0:
+            self.r.hset(self._k("rates"), host.lower(), int(rate))
+        else:
+            self.r.hdel(self._k("rates"), host.lower())
+
+    def rates(self):
+        return {h: int(r) for h, r in self.r.hgetall(self._k("rates")).items()}
+
+    def reserve(self, host, n, rate):
+        # INCRBYFLOAT 是原子操作，多个节点同时预约也不会丢失
+        key = self._k("budget", host)
+        now = time.time()
+        next_time = float(self.r.incrbyfloat(key, n / rate))
+        if next_time < now - BURST:
+            # 空闲了一段时间，最多积累 BURST 秒的流量
+            self.r.set(key, now - BURST + n / rate)
+            return 0.0
+        return max(0.0, next_time - now)
+
+    def close(self):
+        pass
+
+
+class LocalRedis:
+    """
+    进程内的 Redis 替身，只实现 RedisWorkQueue 用到的命令（返回值与 decode_responses=True 时相同）
+    没有 Redis 服务器时用于测试和单进程运行
+    """
+
+    def __init__(self):
+        self.data = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name, factory):
+        value = self.data.get(name)
+        if value is None:
+            value = self.data[name] = factory()
+        return value
+
+    def get(self, name):
+        with self._lock:
+            value = self.data.get(name)
+            return None if value is None else str(value)
+
+    def set(self, name, value):
+        with self._lock:
+            self.data[name] = str(value)
+            return True
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            value = int(self.data.get(name, 0)) + amount
+            self.data[name] = str(value)
+            return value
+
+    def incrbyfloat(self, name, amount):
+        with self._lock:
+            value = float(self.data.get(name, 0)) + amount
+            self.data[name] = repr(value)
+            return value
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        with self._lock:
+            h = self._get(name, dict)
+            items = dict(mapping or {})
+            if key is not None:
+                items[key] = value
+            added = sum(1 for k in items if str(k) not in h)
+            h.update({str(k): str(v) for k, v in items.items()})
+            return added
+
+    def hget(self, name, key):
+        with self._lock:
+            return self.data.get(name, {}).get(str(key))
+
+    def hgetall(self, name):
+        with self._lock:
+            return dict(self.data.get(name, {}))
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            h = self.data.get(name, {})
+            return sum(1 for k in keys if h.pop(str(k), None) is not None)
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            h = self._get(name, dict)
+            value = int(h.get(str(key), 0)) + amount
+            h[str(key)] = str(value)
+            return value
+
+    def sadd(self, name, *values):
+        with self._lock:
+            s = self._get(name, set)
+            added = sum(1 for v in values if str(v) not in s)
+            s.update(str(v) for v in values)
+            return added
+
+    def sismember(self, name, value):
+        with self._lock:
+            return str(value) in self.data.get(name, set())
+
+    def smembers(self, name):
+        with self._lock:
+            return set(self.data.get(name, set()))
+
+    def scard(self, name):
+        with self._lock:
+            return len(self.data.get(name, set()))
+
+    def rpush(self, name, *values):
+        with self._lock:
+            items = self._get(name, list)
+            items.extend(str(v) for v in values)
+            return len(items)
+
+    def lpop(self, name):
+        with self._lock:
+            items = self.data.get(name)
+            return items.pop(0) if items else None
+
+    def llen(self, name):
+        with self._lock:
+            return len(self.data.get(name, []))
+
+    def zadd(self, name, mapping):
+        with self._lock:
+            z = self._get(name, dict)
+            added = sum(1 for k in mapping if str(k) not in z)
+            z.update({str(k): float(v) for k, v in mapping.items()})
+            return added
+
+    def zrem(self, name, *values):
+        with self._lock:
+            z = self.data.get(name, {})
+            return sum(1 for v in values if z.pop(str(v), None) is not None)
+
+    def zscore(self, name, value):
+        with self._lock:
+            return self.data.get(name, {}).get(str(value))
+
+    def zcard(self, name):
+        with self._lock:
+            return len(self.data.get(name, {}))
+
+    def register_script(self, script):
+        """
+        只支持本模块中的脚本：按脚本找到等价的 Python 实现，在锁内执行，与服务器上一样是原子的
+        返回的函数与 redis-py 的 Script 对象用法相同：fn(keys=[...], args=[...])
+        """
+        fn = LOCAL_SCRIPTS[script]
+
+        def run(keys=(), args=()):
+            with self._lock:
+                return fn(self, list(keys), [str(a) for a in args])
+
+        return run
+
+    def zrangebyscore(self, name, min, max):
+        low, high = float(min), float(max)
+        with self._lock:
+            items = self.data.get(name, {}).items()
+            return [
+                k for k, v in sorted(items, key=lambda kv: kv[1]) if low <= v <= high
+            ]
+
+
+# LocalRedis 能执行的脚本
+LOCAL_SCRIPTS = {CLAIM_SCRIPT: _claim_local}
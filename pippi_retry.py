@@ -0,0 +1,94 @@
+import random
+import threading
+import time
+
+import requests
+
+# 错误分类
+RETRY = "retry"
+FATAL = "fatal"
+
+# 这些状态码通常是临时问题，稍后重试可能成功
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def classify_error(exc):
+    """
+    判断错误是否值得重试
+    超时、连接错误、5xx、429 等返回 RETRY；404、403 等其他 4xx 和本地文件错误返回 FATAL
+    """
+    response = getattr(exc, "response", None)
+    if response is not None:
+        status = response.status_code
+        if status in RETRY_STATUS or status >= 500:
+            return RETRY
+        return FATAL
+
+    # requests 的异常也是 OSError 的子类，需要先判断
+    if isinstance(exc, requests.RequestException):
+        return RETRY
+    if isinstance(exc, OSError):
+        return FATAL
+    return RETRY
+
+
+def retry_after(exc):
+    """读取 429/503 响应中的 Retry-After（秒），没有时返回 None"""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After", "")
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt, base=2, cap=300):
+    """指数退避加随机抖动，attempt 从 0 开始"""
+    return min(base**attempt, cap) + random.uniform(0, 1)
+
+
+class CircuitBreaker:
+    """
+    按域名熔断
+    同一域名连续失败 threshold 次后暂停 cooldown 秒，再次熔断时暂停时间翻倍（不超过 max_cooldown），
+    暂停结束后放行请求试探，任意一次成功即恢复
+    """
+
+    def __init__(self, threshold=5, cooldown=30, max_cooldown=600):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = {}
+        self.trips = {}
+        self.open_until = {}
+        self._lock = threading.Lock()
+
+    def success(self, host):
+        with self._lock:
+            self.failures[host] = 0
+            self.trips[host] = 0
+
+    def failure(self, host):
+        """记录一次失败，触发熔断时返回暂停秒数，否则返回 0"""
+        with self._lock:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] < self.threshold:
+                return 0
+            if self.open_until.get(host, 0) > time.time():
+                # 已经熔断，暂停中的失败不重复计算
+                return 0
+
+            trips = self.trips.get(host, 0)
+            pause = min(self.cooldown * 2**trips, self.max_cooldown)
+            self.trips[host] = trips + 1
+            # 暂停结束后处于半开状态，再失败一次就重新熔断
+            self.failures[host] = self.threshold - 1
+            self.open_until[host] = time.time() + pause
+            return pause
+
+    def remaining(self, host):
+        """熔断暂停还剩的秒数，没有熔断时返回 0"""
+        with self._lock:
+            return max(0.0, self.open_until.get(host, 0) - time.time())
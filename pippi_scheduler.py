@@ -0,0 +1,216 @@
+import heapq
+import itertools
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+
+def _pixiv_artwork_id(url):
+    match = re.search(r"/(\d+)_p\d+", url)
+    return int(match.group(1)) if match else 0
+
+
+def _is_original(url):
+    lower = url.lower()
+    if "pximg.net" in lower:
+        return "img-original" in lower
+    return not any(x in lower for x in ("thumb", "small", "square", "_s.", "-s."))
+
+
+# 优先级规则：返回值越小越先下载
+PRIORITY_RULES = {
+    # 按提取顺序
+    "fifo": lambda url: 0,
+    # 原图优先，缩略图/小图靠后
+    "original": lambda url: 0 if _is_original(url) else 1,
+    # 小图优先，尽快看到结果
+    "small": lambda url: 1 if _is_original(url) else 0,
+    # 新作品优先（Pixiv 作品ID越大越新）
+    "newest": lambda url: -_pixiv_artwork_id(url),
+}
+
+
+class HostScheduler:
+    """
+    按域名分队列的下载调度器
+    每个域名一个优先队列，先取所有域名中优先级最高的一类，再在这些域名之间加权轮询；
+    每个域名同时下载的数量受 per_host_limit 限制，一个慢域名不会阻塞其他域名；
+    失败的任务可以延迟到指定时间后重新排队，熔断的域名可以暂停一段时间
+    """
+
+    def __init__(self, priority="fifo", per_host_limit=1, weights=None):
+        if callable(priority):
+            self.priority = priority
+        else:
+            self.priority = PRIORITY_RULES[priority or "fifo"]
+        self.per_host_limit = per_host_limit
+        self.weights = weights or {}
+        self.queues = {}
+        self.active = {}
+        self.hosts = deque()
+        self.credit = {}
+        self.delayed = []
+        self.paused = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._cancelled = False
+
+    @staticmethod
+    def host_of(url):
+        return urlparse(url).netloc.lower()
+
+    def put(self, index, url, delay=0):
+        """加入任务，delay 秒后才能被取出"""
+        with self._cond:
+            if delay > 0:
+                heapq.heappush(
+                    self.delayed, (time.time() + delay, next(self._seq), index, url)
+                )
+            else:
+                self._enqueue(index, url)
+            self._cond.notify_all()
+
+    def _enqueue(self, index, url):
+        host = self.host_of(url)
+        if host not in self.queues:
+            self.queues[host] = []
+            self.active[host] = 0
+            self.credit[host] = self.weights.get(host, 1)
+            self.hosts.append(host)
+        heapq.heappush(
+            self.queues[host], (self.priority(url), next(self._seq), index, url)
+        )
+
+    def close(self):
+        """不再添加新任务，队列取空后 get 返回 None"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def cancel(self):
+        """取消：正在等待和之后的 get 都立即返回 None"""
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+
+    def hold(self, host, seconds):
+        """暂停某个域名 seconds 秒，已排队的任务保留"""
+        with self._cond:
+            self.paused[host] = max(self.paused.get(host, 0), time.time() + seconds)
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return sum(len(q) for q in self.queues.values()) + len(self.delayed)
+
+    def _promote(self, now):
+        # 到期的延迟任务重新排队
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, index, url = heapq.heappop(self.delayed)
+            self._enqueue(index, url)
+
+    def _pick_host(self, now):
+        ready = [
+            h
+            for h in self.hosts
+            if self.queues[h]
+            and self.active[h] < self.per_host_limit
+            and self.paused.get(h, 0) <= now
+        ]
+        if not ready:
+            return None
+
+        best = min(self.queues[h][0][0] for h in ready)
+        # 加权轮询：当前域名用完配额后移到队尾
+        for _ in range(len(self.hosts)):
+            host = self.hosts[0]
+            if host in ready and self.queues[host][0][0] == best:
+                self.credit[host] -= 1
+                if self.credit[host] <= 0:
+                    self.credit[host] = self.weights.get(host, 1)
+                    self.hosts.rotate(-1)
+                return host
+            self.hosts.rotate(-1)
+        return None
+
+    def get(self, timeout=None):
+        """
+        取出下一个任务 (index, url)，没有可下载的任务时等待
+        所有任务（包括延迟重试和正在下载的）都完成且已 close 或已取消时返回 None，
+        等待超时返回 False
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while not self._cancelled:
+                now = time.time()
+                self._promote(now)
+                host = self._pick_host(now)
+                if host:
+                    _, _, index, url = heapq.heappop(self.queues[host])
+                    self.active[host] += 1
+                    return index, url
+
+                queued = any(self.queues.values()) or self.delayed
+                if self._closed and not queued and not any(self.active.values()):
+                    return None
+
+                # 等到下一个延迟任务到期或域名恢复
+                wake = [deadline] if deadline else []
+                if self.delayed:
+                    wake.append(self.delayed[0][0])
+                wake.extend(t for t in self.paused.values() if t > now)
+                if deadline and now >= deadline:
+                    return False
+                self._cond.wait(min(wake) - now if wake else None)
+            return None
+
+    def done(self, url):
+        """一个任务完成，释放该域名的并发名额"""
+        host = self.host_of(url)
+        with self._cond:
+            self.active[host] -= 1
+            self._cond.notify_all()
+
+
+class HostSlots:
+    """
+    跨调度器共享的域名并发名额
+    多个任务各自有 HostScheduler，同一域名的并发数只在任务内受限；
+    共享同一个 HostSlots 后，所有任务对同一域名的并发下载合计不超过 per_host_limit；
+    熔断的域名可以暂停一段时间，暂停期间 acquire 等待
+    """
+
+    def __init__(self, per_host_limit=1):
+        self.per_host_limit = per_host_limit
+        self.active = {}
+        self.paused = {}
+        self._cond = threading.Condition()
+
+    def hold(self, host, seconds):
+        """暂停某个域名 seconds 秒"""
+        with self._cond:
+            self.paused[host] = max(self.paused.get(host, 0), time.time() + seconds)
+            self._cond.notify_all()
+
+    def acquire(self, host, token=None):
+        """等待该域名的空闲名额，token 被取消时返回 False"""
+        with self._cond:
+            while True:
+                if token is not None and token.cancelled:
+                    return False
+                wait = self.paused.get(host, 0) - time.time()
+                if wait <= 0 and self.active.get(host, 0) < self.per_host_limit:
+                    break
+                self._cond.wait(0.2)
+            self.active[host] = self.active.get(host, 0) + 1
+            return True
+
+    def release(self, host):
+        with self._cond:
+            self.active[host] -= 1
+            if not self.active[host]:
+                del self.active[host]
+            self._cond.notify_all()
@@ -0,0 +1,426 @@
+import hashlib
+import random
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from pippi_cancel import DownloadCancelled, abort_response
+from pippi_journal import CrawlJournal
+from pippi_scheduler import HostScheduler
+
+# 来源类型
+PAGE = "page"
+PIXIV_USER = "pixiv_user"
+
+PIXIV_USER_PATTERN = re.compile(
+    r"pixiv\.net/(?:[a-z]{2}/)?(?:users/|member(?:_illust)?\.php\?id=)(\d+)"
+)
+
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_interval(text):
+    """解析检查间隔，如 90、30m、2h、1d，不带单位时按秒，返回秒数"""
+    text = str(text).strip().lower()
+    if text and text[-1] in INTERVAL_UNITS:
+        return int(float(text[:-1]) * INTERVAL_UNITS[text[-1]])
+    return int(float(text))
+
+
+def format_interval(seconds):
+    for unit in ("d", "h", "m"):
+        if seconds >= INTERVAL_UNITS[unit] and seconds % INTERVAL_UNITS[unit] == 0:
+            return f"{seconds // INTERVAL_UNITS[unit]}{unit}"
+    return f"{seconds}s"
+
+
+def source_kind(url):
+    return PIXIV_USER if PIXIV_USER_PATTERN.search(url) else PAGE
+
+
+def fingerprint(images):
+    """图片列表的指纹，与顺序无关"""
+    return hashlib.sha1("\n".join(sorted(images)).encode()).hexdigest()
+
+
+def _url_hash(url):
+    return int.from_bytes(hashlib.md5(url.encode()).digest()[:8], "big", signed=True)
+
+
+class Watchlist:
+    """
+    关注列表，保存在下载目录的 .pippi_watch.db 中
+    每个来源记录检查间隔、下次检查时间和增量检测所需的状态：
+    页面的 ETag/Last-Modified、图片列表指纹和已见过的图片，Pixiv 画师的最新作品ID
+    """
+
+    FIELDS = (
+        "url",
+        "kind",
+        "interval",
+        "follow_pages",
+        "max_pages",
+        "next_check",
+        "last_checked",
+        "etag",
+        "last_modified",
+        "fingerprint",
+        "newest_id",
+        "new_total",
+        "failures",
+        "last_error",
+    )
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (
+                url TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                interval INTEGER NOT NULL,
+                follow_pages INTEGER NOT NULL DEFAULT 0,
+                max_pages INTEGER NOT NULL DEFAULT 50,
+                next_check REAL NOT NULL DEFAULT 0,
+                last_checked REAL,
+                etag TEXT,
+                last_modified TEXT,
+                fingerprint TEXT,
+                newest_id INTEGER NOT NULL DEFAULT 0,
+                new_total INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS seen (
+                source TEXT NOT NULL,
+                url_hash INTEGER NOT NULL,
+                PRIMARY KEY (source, url_hash)
+            ) WITHOUT ROWID;
+            """)
+
+    def add(self, url, interval=3600, follow_pages=False, max_pages=50):
+        """加入或更新一个来源，新来源立即到期"""
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO sources (url, kind, interval, follow_pages, max_pages) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET interval = excluded.interval, "
+                "follow_pages = excluded.follow_pages, max_pages = excluded.max_pages",
+                (url, source_kind(url), interval, int(follow_pages), max_pages),
+            )
+
+    def remove(self, url):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self.conn.execute("DELETE FROM sources WHERE url = ?", (url,))
+                self.conn.execute("DELETE FROM seen WHERE source = ?", (url,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount > 0
+
+    def _select(self, where="", params=()):
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(self.FIELDS)} FROM sources {where}", params
+            ).fetchall()
+        return [dict(zip(self.FIELDS, row)) for row in rows]
+
+    def sources(self):
+        return self._select("ORDER BY url")
+
+    def due(self, now=None):
+        """返回到期需要检查的来源，最早到期的在前"""
+        return self._select(
+            "WHERE next_check <= ? ORDER BY next_check", (now or time.time(),)
+        )
+
+    def next_due(self):
+        """返回最近的下次检查时间，列表为空时返回 None"""
+        with self._lock:
+            return self.conn.execute("SELECT MIN(next_check) FROM sources").fetchone()[
+                0
+            ]
+
+    def update(self, url, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self.conn.execute(
+                f"UPDATE sources SET {assignments} WHERE url = ?",
+                (*fields.values(), url),
+            )
+
+    def unseen(self, source, images):
+        """返回 images 中该来源没有见过的图片，保持原顺序"""
+        hashes = {_url_hash(url): url for url in images}
+        seen = set()
+        keys = list(hashes)
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                rows = self.conn.execute(
+                    "SELECT url_hash FROM seen WHERE source = ? AND url_hash IN "
+                    f"({','.join('?' * len(batch))})",
+                    (source, *batch),
+                ).fetchall()
+                seen.update(r[0] for r in rows)
+        return [url for url in images if _url_hash(url) not in seen]
+
+    def mark_seen(self, source, images):
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen (source, url_hash) VALUES (?, ?)",
+                [(source, _url_hash(url)) for url in images],
+            )
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class Watcher:
+    """
+    按计划增量检查关注列表中的来源，只下载新出现的图片
+      页面/图集：带 ETag/Last-Modified 条件请求，304 时不再解析；图片列表指纹不变时跳过；
+                 有变化时只下载没有见过的图片
+      Pixiv 画师：一次请求获取作品ID列表，只下载比上次最新作品ID更新的作品
+    不同域名的来源并行检查，同一域名同时只检查一个
+    """
+
+    def __init__(self, spider, watchlist, workers=None):
+        self.spider = spider
+        self.watchlist = watchlist
+        self.workers = workers or spider.max_workers
+
+    def poll(self, force=False):
+        """检查所有到期的来源（force 为 True 时检查全部），返回新下载的图片数"""
+        with self.spider.cancel_token.running():
+            sources = self.watchlist.sources() if force else self.watchlist.due()
+            if not sources:
+                return 0
+            print(f"\n👀 检查 {len(sources)} 个关注的来源...")
+            before = self.spider.downloaded_count
+            token = self.spider.cancel_token
+
+            scheduler = HostScheduler(per_host_limit=1)
+            for i, source in enumerate(sources):
+                scheduler.put(i, source["url"])
+            scheduler.close()
+            wake = token.register(scheduler.cancel)
+
+            def worker():
+                while not token.cancelled:
+                    task = scheduler.get()
+                    if task is None:
+                        break
+                    if task is False:
+                        continue
+                    i, url = task
+                    try:
+                        self.check(sources[i])
+                    finally:
+                        scheduler.done(url)
+
+            threads = [
+                threading.Thread(target=worker, daemon=True)
+                for _ in range(max(1, min(self.workers, len(scheduler.hosts))))
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                while t.is_alive() and not token.cancelled:
+                    t.join(0.2)
+            token.unregister(wake)
+
+            new = self.spider.downloaded_count - before
+            print(f"👀 检查完成，新下载 {new} 张图片")
+            return new
+
+    def run(self):
+        """持续检查，直到 stop()"""
+        with self.spider.cancel_token.running():
+            token = self.spider.cancel_token
+            print(f"👀 开始关注 {len(self.watchlist.sources())} 个来源，按 Ctrl+C 停止")
+            while not token.cancelled:
+                self.poll()
+                next_due = self.watchlist.next_due()
+                wait = 60 if next_due is None else next_due - time.time()
+                try:
+                    self.spider._sleep(min(max(wait, 1), 60))
+                except DownloadCancelled:
+                    break
+
+    def check(self, source):
+        """检查一个来源，下载新图片，并安排下次检查"""
+        url = source["url"]
+        now = time.time()
+        try:
+            if source["kind"] == PIXIV_USER:
+                fields = self._check_pixiv_user(source)
+            else:
+                fields = self._check_page(source)
+            if self.spider.cancel_token.cancelled:
+                return
+            fields["failures"] = 0
+            fields["last_error"] = None
+            # 随机提前或推后一点，避免大量来源同时到期
+            delay = source["interval"] * random.uniform(0.9, 1.1)
+        except Exception as e:
+            if self.spider.cancel_token.cancelled:
+                return
+            print(f"  ⚠️ 检查失败 {url}: {str(e)[:50]}")
+            failures = source["failures"] + 1
+            fields = {"failures": failures, "last_error": str(e)[:200]}
+            # 出错时较快重试，连续出错逐渐放慢，不超过正常间隔
+            delay = min(source["interval"], 300 * 2 ** min(failures - 1, 6))
+        fields["last_checked"] = now
+        fields["next_check"] = now + delay
+        self.watchlist.update(url, **fields)
+
+    def _fetch(self, url, headers):
+        spider = self.spider
+        token = spider.cancel_token
+        r = spider.session.get(url, headers=headers, timeout=15, stream=True)
+        # 停止时直接断开连接
+        handle = token.register(lambda: abort_response(r))
+        try:
+            if r.status_code != 304:
+                r.raise_for_status()
+                r.content
+            return r
+        finally:
+            token.unregister(handle)
+            r.close()
+
+    def _check_page(self, source):
+        spider = self.spider
+        url = source["url"]
+        headers = spider._get_headers_for_url(url)
+        if source["etag"]:
+            headers["If-None-Match"] = source["etag"]
+        if source["last_modified"]:
+            headers["If-Modified-Since"] = source["last_modified"]
+
+        r = self._fetch(url, headers)
+        if r.status_code == 304:
+            print(f"  ✓ 无变化 (304): {url}")
+            return {}
+        fields = {
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        }
+
+        images = spider.extract_images(r.text, base_url=url)
+        print_url = url if len(url) <= 60 else url[:57] + "..."
+        if not images:
+            print(f"  ⚠️ 未找到图片: {print_url}")
+            return fields
+        fields["fingerprint"] = fingerprint(images)
+        if fields["fingerprint"] == source["fingerprint"]:
+            print(f"  ✓ 无变化: {print_url}")
+            return fields
+
+        new = self.watchlist.unseen(url, images)
+        print(f"  🆕 {print_url}: {len(new)} 张新图片")
+        start = len(spider.failed_urls)
+        if source["follow_pages"]:
+            # 图集有变化时重新跟随分页，已下载的图片在下载计划中批量跳过
+            spider.crawl_gallery(url, max_pages=source["max_pages"], refresh=True)
+        elif new:
+            self._download_new(url, images, new)
+        if spider.cancel_token.cancelled:
+            # 未下载完的图片下次继续
+            fields.pop("fingerprint")
+            fields["etag"] = fields["last_modified"] = None
+            return fields
+
+        # 失败的图片不记为已见过，下次检查时重新下载
+        failed = self._failed_since(start, url)
+        if failed:
+            fields.pop("fingerprint")
+            fields["etag"] = fields["last_modified"] = None
+        self.watchlist.mark_seen(url, [u for u in images if u not in failed])
+        fields["new_total"] = source["new_total"] + sum(
+            1 for u in new if u not in failed
+        )
+        return fields
+
+    def _failed_since(self, start, job_url):
+        """spider.failed_urls 中第 start 条之后属于 job_url 的失败图片链接"""
+        spider = self.spider
+        with spider._stats_lock:
+            rows = spider.failed_urls[start:]
+        return {url for job, _, url, _, _ in rows if job == job_url}
+
+    def _download_new(self, url, images, new):
+        """只下载新图片，序号和文件名按完整的图片列表计算，与普通爬取一致"""
+        spider = self.spider
+        if spider.journal:
+            spider.journal.record_images(url, images)
+        names = spider._planned_names(images)[0]
+        new_set = set(new)
+        tasks = [(i, u) for i, u in enumerate(images, 1) if u in new_set]
+        present = spider._bulk_exists({names[i][0] for i, _ in tasks})
+        pending = [(i, u) for i, u in tasks if names[i][0] not in present]
+        spider._incr("skipped_count", len(tasks) - len(pending))
+        if spider.journal:
+            # 旧图片和已存在的新图片都记为完成
+            waiting = {i for i, _ in pending}
+            done = [i for i in range(1, len(images) + 1) if i not in waiting]
+            spider.journal.mark_images(url, done, CrawlJournal.DONE)
+        stopped = spider._run_tasks(url, pending, len(pending), names=names)
+        if spider.journal and not stopped:
+            spider.journal.finish_job(url)
+
+    def _check_pixiv_user(self, source):
+        spider = self.spider
+        user_id = PIXIV_USER_PATTERN.search(source["url"]).group(1)
+        api_url = f"https://www.pixiv.net/ajax/user/{user_id}/profile/all?lang=zh"
+        r = self._fetch(api_url, spider._get_headers_for_url(api_url))
+        data = r.json()
+        if data.get("error"):
+            raise ValueError(data.get("message") or "Pixiv API 返回错误")
+
+        body = data.get("body") or {}
+        ids = set()
+        for key in ("illusts", "manga"):
+            # 没有作品时返回空列表而不是字典
+            ids.update(int(i) for i in (body.get(key) or {}))
+        newest = source["newest_id"]
+        new_ids = sorted(i for i in ids if i > newest)
+        if not new_ids:
+            print(f"  ✓ 无新作品: 画师 {user_id}")
+            return {}
+
+        print(f"  🆕 画师 {user_id}: {len(new_ids)} 个新作品")
+        for artwork_id in new_ids:
+            artwork_url = f"https://www.pixiv.net/artworks/{artwork_id}"
+            images = spider._load_job_images(artwork_url)
+            if spider.cancel_token.cancelled:
+                break
+            if images is None:
+                print(f"  ⚠️ 作品 {artwork_id} 获取失败，下次检查时重试")
+                break
+            start = len(spider.failed_urls)
+            if images and spider._download_job(artwork_url, images):
+                break
+            if self._failed_since(start, artwork_url):
+                print(f"  ⚠️ 作品 {artwork_id} 有图片下载失败，下次检查时重试")
+                break
+            # 按作品ID从旧到新处理，作品全部下载成功后才前进，下次从未完成的作品继续
+            newest = artwork_id
+            self.watchlist.update(source["url"], newest_id=newest)
+        return {
+            "newest_id": newest,
+            "new_total": source["new_total"] + sum(1 for i in new_ids if i <= newest),
+        }
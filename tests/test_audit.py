@@ -0,0 +1,138 @@
+import struct
+import zlib
+
+import pytest
+
+from pippi_audit import (
+    CORRUPT,
+    EMPTY,
+    MISMATCH,
+    OK,
+    TRUNCATED,
+    UNKNOWN,
+    audit_files,
+    check_image,
+)
+from pippi_core import RobustImageSpider
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 100 + b"\xff\xd9"
+# 按标记段结构组成的 JPEG：SOI、APP0、SOS 和含转义/RST 的压缩数据、EOI
+JPEG_SEGMENTS = (
+    b"\xff\xd8"
+    + b"\xff\xe0\x00\x10JFIF\x00"
+    + b"\x00" * 9
+    + b"\xff\xda\x00\x08"
+    + b"\x00" * 6
+    + b"\x12\xff\x00\x34\xff\xd0\x56"
+    + b"\xff\xd9"
+)
+# 动态照片在 EOI 之后附加的视频
+TRAILER = b"\x00\x00\x00\x18ftypmp42" + b"\x01" * 2000
+GIF = b"GIF89a" + b"\x00" * 20 + b"\x3b"
+
+
+def png_chunk(kind, data):
+    return (
+        struct.pack(">I", len(data))
+        + kind
+        + data
+        + struct.pack(">I", zlib.crc32(kind + data))
+    )
+
+
+PNG = (
+    b"\x89PNG\r\n\x1a\n"
+    + png_chunk(b"IHDR", b"\x00" * 13)
+    + png_chunk(b"IDAT", b"\x01" * 20)
+    + png_chunk(b"IEND", b"")
+)
+
+
+# ftyp box + 只有 8 字节数据的 mdat box
+AVIF = (
+    b"\x00\x00\x00\x18ftypavif\x00\x00\x00\x00avifmif1"
+    + b"\x00\x00\x00\x10mdat"
+    + b"\x00" * 8
+)
+
+
+def webp(size):
+    return b"RIFF" + struct.pack("<I", size - 8) + b"WEBP" + b"\x00" * (size - 12)
+
+
+@pytest.mark.parametrize(
+    "name, data, status",
+    [
+        ("ok.jpg", JPEG, OK),
+        ("padded.jpg", JPEG + b"\x00" * 10, OK),
+        ("cut.jpg", JPEG[:-2], TRUNCATED),
+        ("trailer.jpg", JPEG_SEGMENTS + TRAILER, OK),
+        ("cut_trailer.jpg", JPEG_SEGMENTS[:-2] + b"\x01" * 100, TRUNCATED),
+        ("ok.png", PNG, OK),
+        ("cut.png", PNG[:-12], TRUNCATED),
+        ("crc.png", PNG[:40] + b"\xff" + PNG[41:], CORRUPT),
+        ("ok.gif", GIF, OK),
+        ("cut.gif", GIF[:-1], TRUNCATED),
+        ("ok.webp", webp(64), OK),
+        ("cut.webp", webp(64)[:40], TRUNCATED),
+        ("empty.jpg", b"", EMPTY),
+        ("text.jpg", b"<html>not an image</html>", UNKNOWN),
+        ("png.jpg", PNG, MISMATCH),
+        ("ok.avif", AVIF, OK),
+        ("avif.jpg", AVIF, MISMATCH),
+    ],
+)
+def test_check_image(tmp_path, name, data, status):
+    path = tmp_path / name
+    path.write_bytes(data)
+    assert check_image(str(path))[1] == status
+
+
+def test_mismatch_suggests_extension(tmp_path):
+    path = tmp_path / "image.jpg"
+    path.write_bytes(PNG)
+    _, status, detail, fmt = check_image(str(path))
+    assert (status, detail, fmt) == (MISMATCH, ".png", "png")
+
+
+def test_audit_files_reports_problems_only(tmp_path):
+    files = {"a.jpg": JPEG, "b.png": PNG, "c.jpg": JPEG[:50], "d.gif": b""}
+    paths = []
+    for name, data in files.items():
+        path = tmp_path / name
+        path.write_bytes(data)
+        paths.append(str(path))
+    problems = audit_files(paths, workers=2)
+    assert sorted((p.rsplit("/", 1)[1], s) for p, s, _, _ in problems) == [
+        ("c.jpg", TRUNCATED),
+        ("d.gif", EMPTY),
+    ]
+
+
+def test_avif_keeps_its_extension(tmp_path):
+    spider = RobustImageSpider(tmp_path, use_journal=False)
+    assert spider._get_filename("https://photos18.com/a/photo.avif", 1) == (
+        "photo",
+        ".avif",
+    )
+    assert spider._is_direct_image_url("https://photos18.com/a/photo.avif")
+
+
+@pytest.mark.parametrize("others", [0, 50])
+def test_repaired_file_still_exists(tmp_path, others):
+    # others 控制 _bulk_exists 扫描目录还是逐个文件名检查
+    for i in range(others):
+        (tmp_path / f"other_{i}.png").write_bytes(PNG)
+    (tmp_path / "photo.jpg").write_bytes(AVIF)
+    spider = RobustImageSpider(tmp_path, use_journal=False)
+    problems = spider.audit_library(repair=True, workers=1)
+    assert [status for _, status, _, _ in problems] == [MISMATCH]
+    assert (tmp_path / "photo.avif").exists()
+
+    spider = RobustImageSpider(tmp_path, use_journal=False)
+    assert spider._is_exists("photo")
+    assert spider._bulk_exists({"photo"}) == {"photo"}
+    spider.existing_files = set()
+    assert spider._is_exists("photo")
+    assert spider._bulk_exists({"photo"}) == {"photo"}
+    assert spider.audit_library(workers=1) == []
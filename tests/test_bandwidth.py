@@ -0,0 +1,103 @@
+import pytest
+
+import pippi_bandwidth
+from pippi_bandwidth import BandwidthLimiter, TokenBucket, parse_rate, parse_size
+from pippi_cancel import CancelToken, DownloadCancelled
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pippi_bandwidth.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("500", 500 * 1024),
+        ("500K", 500 * 1024),
+        ("500kb/s", 500 * 1024),
+        ("2M", 2 * 1024**2),
+        ("1.5M", int(1.5 * 1024**2)),
+        ("1G", 1024**3),
+        (" 2m ", 2 * 1024**2),
+        ("", 0),
+        (0, 0),
+    ],
+)
+def test_parse_rate(text, expected):
+    assert parse_rate(text) == expected
+
+
+def test_parse_size_default_unit():
+    assert parse_size("3", "M") == 3 * 1024**2
+    assert parse_size("3K", "M") == 3 * 1024
+
+
+@pytest.mark.parametrize("text", ["abc", "K", "1X"])
+def test_parse_size_invalid(text):
+    with pytest.raises(ValueError):
+        parse_size(text)
+
+
+def test_unlimited_bucket_never_waits(clock):
+    bucket = TokenBucket()
+    assert bucket.reserve(10**9) == 0
+
+
+def test_bucket_delay(clock):
+    bucket = TokenBucket(1000, burst=1.0)
+    assert bucket.reserve(500) == pytest.approx(0.5)
+    assert bucket.reserve(500) == pytest.approx(1.0)
+    clock[0] += 0.5
+    assert bucket.reserve(1000) == pytest.approx(1.5)
+    # 空闲后积累了 1 秒的流量
+    clock[0] += 10
+    assert bucket.reserve(500) == 0
+    assert bucket.reserve(1000) == pytest.approx(0.5)
+
+
+def test_burst_is_capped(clock):
+    bucket = TokenBucket(1000, burst=1.0)
+    clock[0] += 60
+    assert bucket.reserve(1000) == 0
+    assert bucket.reserve(1000) == pytest.approx(1.0)
+
+
+def test_set_rate_resets_schedule(clock):
+    bucket = TokenBucket(100)
+    bucket.reserve(10000)
+    bucket.set_rate(0)
+    assert bucket.reserve(10000) == 0
+    bucket.set_rate(1000)
+    assert bucket.reserve(1000) == pytest.approx(1.0)
+
+
+def test_host_limit_only_affects_that_host(clock):
+    limiter = BandwidthLimiter(host_rates={"Slow.com": 1000})
+    assert limiter.delay_for("fast.com", 10**6) == 0
+    assert limiter.delay_for("slow.com", 1000) == pytest.approx(1.0)
+    assert limiter.delay_for("slow.com", 1000) == pytest.approx(2.0)
+    limiter.set_host_rate("slow.com", 0)
+    assert limiter.delay_for("slow.com", 10**6) == 0
+
+
+def test_global_limit_is_shared(clock):
+    limiter = BandwidthLimiter(global_rate=1000)
+    assert limiter.delay_for("a.com", 1000) == pytest.approx(1.0)
+    # 全局限速由所有域名共享
+    assert limiter.delay_for("b.com", 1000) == pytest.approx(2.0)
+    clock[0] += 2
+    limiter.set_host_rate("b.com", 100)
+    # 取两者中更长的等待
+    assert limiter.delay_for("b.com", 200) == pytest.approx(2.0)
+
+
+def test_throttle_returns_on_cancel():
+    limiter = BandwidthLimiter(global_rate=1)
+    token = CancelToken()
+    token.cancel()
+    limiter.throttle("a.com", 0, token)
+    with pytest.raises(DownloadCancelled):
+        limiter.throttle("a.com", 10**6, token)
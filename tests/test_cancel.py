@@ -0,0 +1,92 @@
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from pippi_cancel import CancelToken, DownloadCancelled, abort_response
+from pippi_core import RobustImageSpider
+
+
+def cancel_later(token, delay=0.1):
+    timer = threading.Timer(delay, token.cancel)
+    timer.start()
+    return timer
+
+
+def test_sleep_wakes_on_cancel():
+    token = CancelToken()
+    cancel_later(token)
+    started = time.monotonic()
+    with pytest.raises(DownloadCancelled):
+        token.sleep(10)
+    assert time.monotonic() - started < 1
+    with pytest.raises(DownloadCancelled):
+        token.check()
+
+
+def test_callbacks_run_once():
+    token = CancelToken()
+    called = []
+    token.register(lambda: called.append("a"))
+    handle = token.register(lambda: called.append("b"))
+    token.unregister(handle)
+    token.cancel()
+    token.cancel()
+    assert called == ["a"]
+    # 已取消时注册的函数立即调用
+    assert token.register(lambda: called.append("c")) is None
+    assert called == ["a", "c"]
+
+
+def test_running_clears_only_outermost():
+    token = CancelToken()
+    token.cancel()
+    with token.running():
+        assert not token.cancelled
+        token.cancel()
+        with token.running():
+            # 嵌套的运行不吞掉正在进行的停止
+            assert token.cancelled
+    with token.running():
+        assert not token.cancelled
+
+
+def test_abort_response_wakes_blocked_read():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+
+    def serve():
+        conn, _ = server.accept()
+        conn.recv(4096)
+        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 1000000\r\n\r\nabc")
+        time.sleep(5)
+        conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    port = server.getsockname()[1]
+    r = requests.get(f"http://127.0.0.1:{port}/", stream=True, timeout=30)
+    threading.Timer(0.2, abort_response, args=(r,)).start()
+    started = time.monotonic()
+    with pytest.raises(Exception):
+        for _ in r.iter_content(8192):
+            pass
+    assert time.monotonic() - started < 2
+    server.close()
+
+
+def test_spider_can_crawl_again_after_stop(tmp_path):
+    spider = RobustImageSpider(tmp_path, use_journal=False)
+    attempts = []
+
+    def attempt(url, index, group=None, filename=None):
+        attempts.append(url)
+        return "done", None
+
+    spider._attempt_download = attempt
+    spider.stop()
+    spider.crawl("http://a.com/1.jpg")
+    assert attempts == ["http://a.com/1.jpg"]
+    assert not spider.cancel_token.cancelled
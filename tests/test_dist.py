@@ -0,0 +1,25 @@
+from pippi_core import RobustImageSpider
+from pippi_dist import DistributedWorker, submit_targets
+from pippi_queue import open_queue
+
+
+def test_colliding_names_are_planned(tmp_path):
+    spider = RobustImageSpider(tmp_path / "images", use_journal=False)
+    stem = "x" * 60
+    images = [f"http://a.com/1/{stem}.jpg", f"http://a.com/2/{stem}.jpg"]
+    spider._load_job_images = lambda url: images
+    downloads = {}
+
+    def attempt(url, index, group=None, filename=None):
+        downloads[url] = filename
+        return "done", None
+
+    spider._attempt_download = attempt
+    work_queue = open_queue("memory://")
+    submit_targets(work_queue, ["http://a.com/page"])
+    DistributedWorker(spider, work_queue).run()
+
+    names = [downloads[url] for url in images]
+    assert names[0] == (stem[:50], ".jpg")
+    assert names[1][0] != names[0][0]
+    assert work_queue.is_drained()
@@ -0,0 +1,91 @@
+import pytest
+
+from pippi_core import RobustImageSpider
+from pippi_frontier import CrawlFrontier, canonicalize_url
+from pippi_journal import CrawlJournal
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("HTTP://Example.COM:80/a/", "http://example.com/a"),
+        ("https://example.com:443", "https://example.com/"),
+        ("https://example.com:8443/a", "https://example.com:8443/a"),
+        ("https://example.com/a?b=2&a=1#top", "https://example.com/a?a=1&b=2"),
+        ("https://example.com/a?utm_source=x&p=2&spm=1", "https://example.com/a?p=2"),
+        ("  https://example.com/a?empty=  ", "https://example.com/a?empty="),
+    ],
+)
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url) == expected
+
+
+def test_frontier_deduplicates_equivalent_urls():
+    frontier = CrawlFrontier()
+    assert frontier.add("https://example.com/g?page=2")
+    assert not frontier.add("https://EXAMPLE.com/g/?page=2#c&utm_medium=x")
+    assert not frontier.add("https://example.com/g?page=2&utm_source=feed")
+    assert frontier.add("https://example.com/g?page=3", depth=1)
+    assert len(frontier) == 2
+    assert frontier.pop() == ("https://example.com/g?page=2", 0)
+    assert frontier.pop() == ("https://example.com/g?page=3", 1)
+    assert frontier.pop() is None
+    # 已取出的页面仍然算作见过
+    assert not frontier.add("https://example.com/g?page=2")
+
+
+def test_frontier_limits():
+    frontier = CrawlFrontier(max_pages=2, max_depth=1)
+    assert not frontier.add("https://example.com/deep", depth=2)
+    assert frontier.add("https://example.com/1")
+    assert frontier.add("https://example.com/2", depth=1)
+    assert not frontier.add("https://example.com/3")
+
+
+def test_gallery_reuses_finished_pages(tmp_path):
+    page = "http://a.com/page"
+    journal = CrawlJournal(tmp_path / ".pippi_journal.db")
+    journal.record_links(page, ["http://a.com/page2"])
+    journal.record_images(page, ["http://a.com/1.jpg"])
+    journal.mark_image(page, 1, CrawlJournal.DONE)
+    assert journal.finish_job(page)
+    journal.close()
+
+    spider = RobustImageSpider(tmp_path)
+    fetched = []
+    spider.get_page = lambda url: fetched.append(url)
+    assert spider._load_page_job(page) == (
+        ["http://a.com/1.jpg"],
+        ["http://a.com/page2"],
+    )
+    assert fetched == []
+    # refresh 时重新获取页面
+    spider._load_page_job(page, refresh=True)
+    assert fetched == [page]
+
+
+def test_gallery_fetches_each_page_once(tmp_path):
+    pages = {
+        "http://a.com/g": '<img src="/1.jpg"><a href="/g?p=2">下一页</a>',
+        "http://a.com/g?p=2": '<img src="/2.jpg"><a href="/g?p=3&utm_source=x">下一页</a>'
+        '<a href="/g#top">下一页</a>',
+        "http://a.com/g?p=3&utm_source=x": '<img src="/3.jpg"><a href="/g?p=2">下一页</a>',
+    }
+    spider = RobustImageSpider(tmp_path, use_journal=False)
+    fetched = []
+
+    def get_page(url):
+        fetched.append(url)
+        return f"<html><body>{pages[url]}</body></html>"
+
+    downloaded = []
+
+    def attempt(url, index, group=None, filename=None):
+        downloaded.append(url)
+        return "done", None
+
+    spider.get_page = get_page
+    spider._attempt_download = attempt
+    spider.crawl_gallery("http://a.com/g")
+    assert fetched == list(pages)
+    assert sorted(downloaded) == [f"http://a.com/{n}.jpg" for n in (1, 2, 3)]
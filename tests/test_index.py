@@ -0,0 +1,64 @@
+import pytest
+
+from pippi_core import RobustImageSpider
+from pippi_index import CompactStringSet
+
+
+def test_add_and_contains():
+    items = CompactStringSet(["a", "b"])
+    items.add("a")
+    items.update(["c"])
+    assert len(items) == 3
+    assert "a" in items and "c" in items
+    assert "d" not in items
+
+
+def test_grows_without_losing_items():
+    items = CompactStringSet()
+    names = [f"img_{i:06d}" for i in range(20000)]
+    items.update(names)
+    assert len(items) == len(names)
+    assert all(name in items for name in names)
+    assert "img_999999" not in items
+    assert items.memory_bytes() >= len(names) * 8
+
+
+def test_max_bytes_requires_fallback():
+    with pytest.raises(ValueError):
+        CompactStringSet(max_bytes=1024)
+
+
+def test_hits_are_confirmed_by_fallback():
+    on_disk = {"a"}
+    items = CompactStringSet(["a", "b"], fallback=on_disk.__contains__)
+    assert "a" in items
+    # 哈希命中但磁盘上已没有（被删除或哈希误判）
+    assert "b" not in items
+    # 未命中且表未满时不查磁盘
+    on_disk.add("c")
+    assert "c" not in items
+
+
+def test_saturated_set_stays_bounded_and_exact():
+    on_disk = set()
+    items = CompactStringSet(max_bytes=16 * 1024, fallback=on_disk.__contains__)
+    names = [f"img_{i:06d}" for i in range(10000)]
+    for name in names:
+        on_disk.add(name)
+        items.add(name)
+    assert items.saturated
+    assert items.memory_bytes() <= 16 * 1024
+    # 表满后新元素只记在磁盘上，查询交给 fallback，不会漏判
+    assert all(name in items for name in names)
+    assert "img_missing" not in items
+
+
+def test_spider_index_confirms_on_disk(tmp_path):
+    (tmp_path / "a.jpg").write_bytes(b"x")
+    spider = RobustImageSpider(tmp_path, use_journal=False)
+    assert spider._is_exists("a")
+    (tmp_path / "a.jpg").unlink()
+    assert not spider._is_exists("a")
+    # 启动后其他任务保存的文件不在索引中，也能查到
+    (tmp_path / "b.png").write_bytes(b"x")
+    assert spider._is_exists("b")
@@ -0,0 +1,101 @@
+from pippi_core import RobustImageSpider
+from pippi_journal import CrawlJournal
+from pippi_retry import FATAL
+
+JOB = "http://a.com/page"
+
+
+def test_load_unfinished_job(tmp_path):
+    journal = CrawlJournal(tmp_path / "j.db")
+    assert journal.load_images(JOB) is None
+    journal.record_images(JOB, ["u1", "u2"])
+    assert journal.load_images(JOB) == ["u1", "u2"]
+    assert journal.image_states(JOB) == {
+        1: (CrawlJournal.PENDING, 0),
+        2: (CrawlJournal.PENDING, 0),
+    }
+
+
+def test_record_merges_by_url(tmp_path):
+    journal = CrawlJournal(tmp_path / "j.db")
+    journal.record_images(JOB, ["u1", "u2", "u3"])
+    journal.mark_image(JOB, 1, CrawlJournal.DONE)
+    journal.mark_image(JOB, 3, CrawlJournal.FAILED, "404")
+
+    # 页面上新增了一张图片，u2 被删除，其余图片的序号变化
+    journal.record_images(JOB, ["u0", "u1", "u3"])
+    assert journal.load_images(JOB) == ["u0", "u1", "u3"]
+    assert journal.image_states(JOB) == {
+        1: (CrawlJournal.PENDING, 0),
+        2: (CrawlJournal.DONE, 1),
+        3: (CrawlJournal.FAILED, 1),
+    }
+    assert journal.failed_images(JOB) == [(JOB, 3, "u3", 1, "404")]
+
+
+def test_record_same_list_keeps_states(tmp_path):
+    journal = CrawlJournal(tmp_path / "j.db")
+    journal.record_images(JOB, ["u1", "u2"])
+    journal.mark_image(JOB, 2, CrawlJournal.DONE)
+    journal.record_images(JOB, ["u1", "u2"])
+    assert journal.image_states(JOB)[2] == (CrawlJournal.DONE, 1)
+
+
+def test_finish_job_waits_for_failures(tmp_path):
+    journal = CrawlJournal(tmp_path / "j.db")
+    journal.record_images(JOB, ["u1", "u2"])
+    journal.mark_images(JOB, [1], CrawlJournal.DONE)
+    journal.mark_image(JOB, 2, CrawlJournal.FAILED, "503")
+    assert not journal.finish_job(JOB)
+    assert journal.load_images(JOB) == ["u1", "u2"]
+
+    journal.mark_image(JOB, 2, CrawlJournal.DONE)
+    assert journal.finish_job(JOB)
+    assert journal.load_images(JOB) is None
+    assert journal.load_images(JOB, include_done=True) == ["u1", "u2"]
+
+
+def test_links_and_sizes(tmp_path):
+    journal = CrawlJournal(tmp_path / "j.db")
+    journal.record_links(JOB, ["p2", "p3"])
+    journal.record_links(JOB, ["p2"])
+    assert journal.load_links(JOB) == ["p2"]
+    journal.record_sizes({"u1": 100})
+    assert journal.load_sizes(["u1", "u2"]) == {"u1": 100}
+
+
+def spider_without_network(folder, results):
+    spider = RobustImageSpider(folder)
+    attempts = []
+
+    def get_page(url):
+        raise AssertionError("应从任务日志恢复，不应获取页面")
+
+    def attempt(url, index, group=None, filename=None):
+        attempts.append(index)
+        result = results.get(index, "done")
+        return result, ValueError("404") if result == FATAL else None
+
+    spider.get_page = get_page
+    spider._attempt_download = attempt
+    return spider, attempts
+
+
+def test_crawl_resumes_from_journal(tmp_path):
+    journal = CrawlJournal(tmp_path / ".pippi_journal.db")
+    images = [f"http://a.com/{n}.jpg" for n in range(1, 4)]
+    journal.record_images(JOB, images)
+    journal.mark_image(JOB, 1, CrawlJournal.DONE)
+    journal.close()
+
+    spider, attempts = spider_without_network(tmp_path, {3: FATAL})
+    spider.crawl(JOB)
+    assert attempts == [2, 3]
+    assert spider.journal.failed_images(JOB)[0][1] == 3
+    spider.journal.close()
+
+    # 失败的图片使任务保持未完成，下次只重试失败的图片
+    spider, attempts = spider_without_network(tmp_path, {})
+    spider.crawl(JOB)
+    assert attempts == [3]
+    assert spider.journal.load_images(JOB) is None
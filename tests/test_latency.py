@@ -0,0 +1,176 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import pippi_latency
+from pippi_core import RobustImageSpider
+from pippi_latency import LatencyTracker, StallDetector, StalledError, percentile
+from pippi_retry import RETRY
+
+DATA = bytes(range(256)) * 400
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    第一个请求先发 8 KB，停顿 pause 秒后发完；
+    之后的请求（备用请求）每 interval 秒发 1000 字节
+    """
+
+    requests = 0
+    pause = 0.5
+    interval = 0.03
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        Handler.requests += 1
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(DATA) - 1}/{len(DATA)}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(DATA) - start))
+        self.end_headers()
+        try:
+            if Handler.requests == 1:
+                self.wfile.write(DATA[:8192])
+                self.wfile.flush()
+                time.sleep(Handler.pause)
+                self.wfile.write(DATA[8192:])
+            else:
+                for i in range(start, len(DATA), 1000):
+                    self.wfile.write(DATA[i : i + 1000])
+                    self.wfile.flush()
+                    time.sleep(Handler.interval)
+        except OSError:
+            pass
+
+
+@pytest.fixture
+def server():
+    Handler.requests = 0
+    Handler.pause, Handler.interval = 0.5, 0.03
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def hedging_spider(folder):
+    spider = RobustImageSpider(folder, use_journal=False)
+    spider._sleep = lambda seconds: None
+    spider.hedge_percentile = 50
+    for _ in range(spider.latency.min_samples):
+        spider.latency.record(0.05)
+    return spider
+
+
+def test_losing_hedge_bytes_not_counted(tmp_path, server):
+    spider = hedging_spider(tmp_path)
+    result, error = spider._attempt_download(f"{server}/a.jpg", 1)
+    assert (result, error) == ("done", None)
+    assert spider.latency.hedged == 1
+    assert spider.latency.hedge_wins == 0
+    assert (tmp_path / "a.jpg").read_bytes() == DATA
+    assert spider.bytes_downloaded == len(DATA)
+
+
+def test_winning_hedge_counts_file_once(tmp_path, server):
+    Handler.pause, Handler.interval = 5, 0
+    spider = hedging_spider(tmp_path)
+    started = time.monotonic()
+    result, error = spider._attempt_download(f"{server}/a.jpg", 1)
+    assert (result, error) == ("done", None)
+    assert time.monotonic() - started < 3
+    assert spider.latency.hedge_wins == 1
+    assert (tmp_path / "a.jpg").read_bytes() == DATA
+    assert spider.bytes_downloaded == len(DATA)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pippi_latency.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_stall_detector_checks_each_window(clock):
+    stall = StallDetector(min_speed=1000, window=10)
+    clock[0] += 5
+    assert not stall.poll()
+    stall.update(20000)
+    clock[0] += 5
+    assert not stall.poll()
+    # 每个窗口单独计算速度，之前收到的数据不算在内
+    stall.update(5000)
+    clock[0] += 10
+    assert stall.poll()
+    with pytest.raises(StalledError):
+        stall.update(1)
+
+
+def test_stall_detector_total_timeout(clock):
+    stall = StallDetector(total=30)
+    clock[0] += 29
+    assert not stall.poll()
+    clock[0] += 2
+    assert stall.poll()
+    assert isinstance(stall.error, StalledError)
+
+
+def test_stall_detector_excludes_throttle_time(clock):
+    stall = StallDetector(min_speed=1000, window=10, total=30)
+    stall.pause()
+    clock[0] += 60
+    # 限速等待期间不算卡顿，也不计入总时限
+    assert not stall.poll()
+    stall.resume()
+    clock[0] += 5
+    stall.update(10000)
+    clock[0] += 5
+    assert not stall.poll()
+    clock[0] += 21
+    assert stall.poll()
+
+
+def test_percentile():
+    values = list(range(1, 11))
+    assert percentile(values, 50) == 5
+    assert percentile(values, 90) == 9
+    assert percentile(values, 100) == 10
+    assert percentile(values, 0) == 1
+
+
+def test_hedge_delay_needs_samples():
+    tracker = LatencyTracker(recent=10, min_samples=5)
+    for seconds in (4, 1, 3, 2):
+        tracker.record(seconds)
+    assert tracker.hedge_delay(50) is None
+    tracker.record(5)
+    assert tracker.hedge_delay(50) == 3
+    # 只参考最近的 recent 张
+    for _ in range(10):
+        tracker.record(10)
+    assert tracker.hedge_delay(50) == 10
+    assert "p50" in tracker.summary()
+
+
+def test_stalled_transfer_is_retried(tmp_path, server):
+    Handler.pause = 5
+    spider = RobustImageSpider(tmp_path, use_journal=False)
+    spider._sleep = lambda seconds: None
+    spider.stall_window = 1
+    started = time.monotonic()
+    result, error = spider._attempt_download(f"{server}/a.jpg", 1)
+    assert time.monotonic() - started < 4
+    assert result == RETRY
+    assert isinstance(error, StalledError)
+    assert spider.latency.stalls == 1
+    assert not (tmp_path / "a.jpg").exists()
@@ -0,0 +1,103 @@
+import tarfile
+
+from pippi_pack import PackStore
+
+
+def write(store, group, name, data):
+    entry = store.open_entry(group, name)
+    entry.write(data)
+    entry.commit()
+
+
+def test_round_trip(tmp_path):
+    store = PackStore(tmp_path / "packs")
+    group = PackStore.group_key("https://example.com/gallery/123.html")
+    images = {f"img_{i}.jpg": bytes([i]) * (1000 + i * 700) for i in range(5)}
+    for name, data in images.items():
+        write(store, group, name, data)
+
+    for name, data in images.items():
+        assert store.read(name) == data
+    assert store.read("missing.jpg") is None
+    assert store.contains("img_0")
+    assert not store.contains("img_9")
+    assert store.contains_many(["img_1", "img_3", "img_9"]) == {"img_1", "img_3"}
+    store.close()
+
+    # 分包是标准 tar 文件
+    shards = sorted((tmp_path / "packs").glob("*.tar"))
+    assert len(shards) == 1
+    with tarfile.open(shards[0]) as tar:
+        assert sorted(tar.getnames()) == sorted(images)
+        for name, data in images.items():
+            assert tar.extractfile(name).read() == data
+
+
+def test_reopen_and_append(tmp_path):
+    store = PackStore(tmp_path)
+    write(store, "g", "a.jpg", b"a" * 600)
+    store.close()
+
+    store = PackStore(tmp_path)
+    assert store.read("a.jpg") == b"a" * 600
+    write(store, "g", "b.jpg", b"b" * 600)
+    assert sorted(store.stems()) == ["a", "b"]
+    store.close()
+    with tarfile.open(next(tmp_path.glob("*.tar"))) as tar:
+        assert sorted(tar.getnames()) == ["a.jpg", "b.jpg"]
+
+
+def test_shard_size_limit(tmp_path):
+    # 每张占 3584 字节（tar 头 + 数据 + 补齐），分包达到上限后才换新的分包
+    store = PackStore(tmp_path, max_shard_bytes=4096)
+    for i in range(4):
+        write(store, "g", f"{i}.jpg", b"x" * 3000)
+    shards = sorted(p.name for p in tmp_path.glob("*.tar"))
+    assert shards == ["g-0001.tar", "g-0002.tar"]
+    for i in range(4):
+        assert store.read(f"{i}.jpg") == b"x" * 3000
+    store.close()
+
+
+def test_abort_discards_entry(tmp_path):
+    store = PackStore(tmp_path)
+    write(store, "g", "a.jpg", b"a" * 100)
+    entry = store.open_entry("g", "b.jpg")
+    entry.write(b"partial")
+    entry.abort()
+    write(store, "g", "c.jpg", b"c" * 100)
+    assert not store.contains("b")
+    store.close()
+    with tarfile.open(next(tmp_path.glob("*.tar"))) as tar:
+        assert tar.getnames() == ["a.jpg", "c.jpg"]
+
+
+def test_export(tmp_path):
+    store = PackStore(tmp_path / "packs")
+    write(store, "g1", "a.jpg", b"a" * 10)
+    write(store, "g2", "b.jpg", b"b" * 10)
+    assert store.export(tmp_path / "out", group="g1") == 1
+    assert (tmp_path / "out" / "a.jpg").read_bytes() == b"a" * 10
+    assert not (tmp_path / "out" / "b.jpg").exists()
+    assert store.export(tmp_path / "all") == 2
+    store.close()
+
+
+def test_long_name_is_shortened(tmp_path):
+    store = PackStore(tmp_path)
+    stem = "测" * 40
+    name = f"{stem}.jpg"
+    write(store, "g", name, b"data")
+    # 索引保留原文件名，只有 tar 中的文件名缩短
+    assert store.contains(stem)
+    assert store.contains_many([stem]) == {stem}
+    assert store.stems() == [stem]
+    assert store.read(name) == b"data"
+    assert store.export(tmp_path / "out") == 1
+    assert (tmp_path / "out" / name).read_bytes() == b"data"
+    store.close()
+
+    with tarfile.open(next(tmp_path.glob("*.tar"))) as tar:
+        (member,) = tar.getmembers()
+        assert len(member.name.encode()) <= 100
+        assert tar.extractfile(member).read() == b"data"
@@ -0,0 +1,64 @@
+from pippi_plan import EXISTS, NEW, DownloadPlan, PlanItem, resolve_collisions
+
+
+def test_unique_names_unchanged():
+    names = [(1, "http://a/1", "x", ".jpg"), (2, "http://a/2", "y", ".jpg")]
+    resolved, renamed = resolve_collisions(names)
+    assert resolved == {1: ("x", ".jpg"), 2: ("y", ".jpg")}
+    assert renamed == set()
+
+
+def test_collision_renames_later_urls():
+    names = [
+        (1, "http://a/1", "same", ".jpg"),
+        (2, "http://a/2", "same", ".jpg"),
+        (3, "http://a/3", "same", ".png"),
+    ]
+    resolved, renamed = resolve_collisions(names)
+    assert resolved[1] == ("same", ".jpg")
+    assert renamed == {2, 3}
+    stems = {stem for stem, _ in resolved.values()}
+    assert len(stems) == 3
+    assert all(stem.startswith("same_") for stem, _ in (resolved[2], resolved[3]))
+
+
+def test_same_url_keeps_name():
+    # 同一链接出现两次不算重名
+    names = [(1, "http://a/1", "same", ".jpg"), (2, "http://a/1", "same", ".jpg")]
+    resolved, renamed = resolve_collisions(names)
+    assert resolved[2] == ("same", ".jpg")
+    assert renamed == set()
+
+
+def test_renamed_stem_stays_short():
+    stem = "x" * 50
+    names = [(1, "http://a/1", stem, ".jpg"), (2, "http://a/2", stem, ".jpg")]
+    resolved, _ = resolve_collisions(names)
+    assert len(resolved[2][0]) == 50
+
+
+def test_renamed_name_does_not_collide_with_later_original():
+    first, _ = resolve_collisions(
+        [(1, "http://a/1", "same", ".jpg"), (2, "http://a/2", "same", ".jpg")]
+    )
+    renamed_stem = first[2][0]
+    names = [
+        (1, "http://a/1", "same", ".jpg"),
+        (2, "http://a/2", "same", ".jpg"),
+        (3, "http://a/3", renamed_stem, ".jpg"),
+    ]
+    resolved, renamed = resolve_collisions(names)
+    assert resolved[3] != resolved[2]
+    assert 3 in renamed
+
+
+def test_plan_estimate():
+    plan = DownloadPlan(
+        "http://a/",
+        [
+            PlanItem(1, "u1", "a", ".jpg", NEW, 100),
+            PlanItem(2, "u2", "b", ".jpg", NEW),
+            PlanItem(3, "u3", "c", ".jpg", EXISTS, 1000),
+        ],
+    )
+    assert plan.estimated_bytes() == (200, 1)
@@ -0,0 +1,131 @@
+import pytest
+
+from pippi_queue import (
+    DONE,
+    FAILED,
+    IMAGE,
+    LEASED,
+    PAGE,
+    PENDING,
+    LocalRedis,
+    RedisWorkQueue,
+    open_queue,
+)
+
+
+@pytest.fixture(params=["sqlite", "memory", "local_redis"])
+def work_queue(request, tmp_path):
+    if request.param == "sqlite":
+        q = open_queue(f"sqlite://{tmp_path / 'queue.db'}")
+    elif request.param == "memory":
+        q = open_queue("memory://")
+    else:
+        q = RedisWorkQueue(LocalRedis(), prefix="test")
+    yield q
+    q.close()
+
+
+def test_submit_deduplicates(work_queue):
+    assert work_queue.submit(IMAGE, "http://a.com/1.jpg", job="j", idx=1)
+    assert not work_queue.submit(IMAGE, "http://a.com/1.jpg", job="j", idx=1)
+    assert work_queue.submit(IMAGE, "http://a.com/1.jpg", job="j", idx=2)
+    assert work_queue.stats()[PENDING] == 2
+
+
+def test_page_limit_per_group(work_queue):
+    for n in range(5):
+        work_queue.submit(PAGE, f"http://a.com/p{n}", group="g", max_pages=3)
+    assert work_queue.stats()[PENDING] == 3
+
+
+def test_claim_in_submit_order(work_queue):
+    for n in range(3):
+        work_queue.submit(IMAGE, f"http://a.com/{n}.jpg", job="j", idx=n)
+    claimed = [work_queue.claim("w")["idx"] for _ in range(3)]
+    assert claimed == [0, 1, 2]
+    assert work_queue.claim("w") is None
+    assert work_queue.stats()[LEASED] == 3
+
+
+def test_active_lease_is_not_claimed_twice(work_queue):
+    work_queue.submit(IMAGE, "http://a.com/1.jpg", job="j", idx=1)
+    task = work_queue.claim("w1", lease=60)
+    assert work_queue.claim("w2", lease=60) is None
+    assert work_queue.renew(task, "w1", lease=60)
+    assert not work_queue.renew(task, "w2", lease=60)
+
+
+def test_expired_lease_is_requeued(work_queue):
+    work_queue.submit(IMAGE, "http://a.com/1.jpg", job="j", idx=1)
+    # 租约已经到期，模拟节点崩溃
+    lost = work_queue.claim("w1", lease=-1)
+    task = work_queue.claim("w2", lease=60)
+    assert task["id"] == lost["id"]
+
+    # 原来的节点失去了租约，续约和报告结果都不生效
+    assert not work_queue.renew(lost, "w1")
+    work_queue.complete(lost, "w1")
+    assert work_queue.stats()[LEASED] == 1
+
+    work_queue.complete(task, "w2")
+    counts = work_queue.stats()
+    assert counts[DONE] == 1
+    assert work_queue.is_drained()
+
+
+def test_fail_with_delay_requeues(work_queue):
+    work_queue.submit(IMAGE, "http://a.com/1.jpg", job="j", idx=1)
+    task = work_queue.claim("w")
+    work_queue.fail(task, "w", "503", retry_delay=60)
+    assert work_queue.claim("w") is None
+    assert work_queue.stats()[PENDING] == 1
+
+    work_queue.submit(IMAGE, "http://a.com/2.jpg", job="j", idx=2)
+    task = work_queue.claim("w")
+    work_queue.fail(task, "w", "503", retry_delay=0)
+    task = work_queue.claim("w")
+    assert task["idx"] == 2
+    assert task["attempts"] == 1
+
+
+def test_final_failure_is_reported(work_queue):
+    work_queue.submit(IMAGE, "http://a.com/1.jpg", job="j", idx=1)
+    task = work_queue.claim("w")
+    work_queue.fail(task, "w", "404")
+    assert work_queue.stats()[FAILED] == 1
+    assert work_queue.failed_tasks() == [("j", 1, "http://a.com/1.jpg", 1, "404")]
+    assert work_queue.is_drained()
+
+
+def test_release_returns_task_immediately(work_queue):
+    work_queue.submit(IMAGE, "http://a.com/1.jpg", job="j", idx=1)
+    task = work_queue.claim("w1")
+    work_queue.release(task, "w1")
+    again = work_queue.claim("w2")
+    assert again["id"] == task["id"]
+    assert again["attempts"] == 0
+
+
+def test_shared_index(work_queue):
+    assert not work_queue.index_contains("a")
+    work_queue.index_add("a")
+    assert work_queue.index_contains("a")
+
+
+def test_claim_script_records_owner_and_lease():
+    client = LocalRedis()
+    q = RedisWorkQueue(client, prefix="p")
+    q.submit(IMAGE, "http://a.com/1.jpg", job="j", idx=1)
+    task = q.claim("w1", lease=60)
+    assert client.hget("p:task:1", "owner") == "w1"
+    assert client.zscore("p:leases", task["id"]) is not None
+    assert client.llen("p:pending") == 0
+
+
+def test_planned_name_round_trip(work_queue):
+    work_queue.submit(IMAGE, "http://a.com/1.jpg", job="j", idx=1, stem="x", ext=".png")
+    work_queue.submit(PAGE, "http://a.com/page")
+    image = work_queue.claim("w")
+    page = work_queue.claim("w")
+    assert (image["stem"], image["ext"]) == ("x", ".png")
+    assert (page["stem"], page["ext"]) == ("", "")
@@ -0,0 +1,140 @@
+import time
+
+import pytest
+import requests
+
+from pippi_core import RobustImageSpider
+from pippi_retry import (
+    FATAL,
+    RETRY,
+    CircuitBreaker,
+    backoff_delay,
+    classify_error,
+    retry_after,
+)
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"{status}", response=response)
+
+
+@pytest.mark.parametrize(
+    "exc, kind",
+    [
+        (requests.Timeout(), RETRY),
+        (requests.ConnectionError(), RETRY),
+        (http_error(429), RETRY),
+        (http_error(503), RETRY),
+        (http_error(520), RETRY),
+        (http_error(404), FATAL),
+        (http_error(403), FATAL),
+        (PermissionError("磁盘"), FATAL),
+        (ValueError("解析"), RETRY),
+    ],
+)
+def test_classify_error(exc, kind):
+    assert classify_error(exc) == kind
+
+
+def test_retry_after():
+    assert retry_after(http_error(503, {"Retry-After": "5"})) == 5.0
+    assert retry_after(http_error(503)) is None
+    assert retry_after(http_error(503, {"Retry-After": "Wed, 21 Oct 2015"})) is None
+    assert retry_after(requests.Timeout()) is None
+
+
+def test_backoff_delay():
+    assert 1 <= backoff_delay(0) <= 2
+    assert 8 <= backoff_delay(3) <= 9
+    assert backoff_delay(20) <= 301
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(threshold=3, cooldown=10, max_cooldown=15)
+    assert breaker.failure("a.com") == 0
+    assert breaker.failure("a.com") == 0
+    assert breaker.failure("a.com") == 10
+    assert 9 < breaker.remaining("a.com") <= 10
+    assert breaker.remaining("b.com") == 0
+    # 暂停期间的失败不重复熔断
+    assert breaker.failure("a.com") == 0
+
+    # 暂停结束后半开，再失败一次就重新熔断，暂停时间翻倍（不超过上限）
+    breaker.open_until["a.com"] = 0
+    assert breaker.failure("a.com") == 15
+
+    breaker.success("a.com")
+    breaker.open_until["a.com"] = 0
+    assert breaker.failure("a.com") == 0
+    assert breaker.failure("a.com") == 0
+    assert breaker.failure("a.com") == 10
+
+
+def scripted_spider(folder, script):
+    """script 为 {序号: [结果, ...]}，每次尝试依次返回"""
+    spider = RobustImageSpider(folder, use_journal=False)
+    attempts = []
+
+    def attempt(url, index, group=None, filename=None):
+        attempts.append(index)
+        result = script.get(index, ["done"]).pop(0)
+        if result == "done":
+            return result, None
+        return result, http_error(503) if result == RETRY else http_error(404)
+
+    spider._attempt_download = attempt
+    return spider, attempts
+
+
+def test_retryable_failure_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr("pippi_core.backoff_delay", lambda attempt: 0.01)
+    spider, attempts = scripted_spider(tmp_path, {1: [RETRY, RETRY, "done"]})
+    spider._run_tasks("http://a.com/", [(1, "http://a.com/1.jpg")])
+    assert attempts == [1, 1, 1]
+    assert spider.failed_count == 0
+
+
+def test_failures_are_exported_and_cleared(tmp_path, monkeypatch):
+    monkeypatch.setattr("pippi_core.backoff_delay", lambda attempt: 0.01)
+    spider, attempts = scripted_spider(tmp_path, {1: [FATAL], 2: [RETRY] * 3})
+    tasks = [(1, "http://a.com/1.jpg"), (2, "http://a.com/2.jpg")]
+    spider._run_tasks("http://a.com/", tasks)
+    assert sorted(attempts) == [1, 2, 2, 2]
+    assert spider.failed_count == 2
+
+    path = spider.export_failed()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [line.split("\t")[:4] for line in sorted(lines)] == [
+        ["http://a.com/", "1", "http://a.com/1.jpg", "1"],
+        ["http://a.com/", "2", "http://a.com/2.jpg", "3"],
+    ]
+
+    # 重新下载成功后删除失败列表
+    spider, attempts = scripted_spider(tmp_path, {})
+    spider.replay_failed()
+    assert sorted(attempts) == [1, 2]
+    assert not path.exists()
+
+
+def test_open_breaker_holds_new_scheduler(tmp_path):
+    spider = RobustImageSpider(tmp_path, use_journal=False)
+    attempts = []
+
+    def attempt(url, index, group=None, filename=None):
+        attempts.append(time.time())
+        return "done", None
+
+    spider._attempt_download = attempt
+    spider.breaker.open_until["h.com"] = time.time() + 0.5
+    started = time.time()
+    spider._run_tasks("http://h.com/", [(1, "http://h.com/1.jpg")])
+    assert len(attempts) == 1
+    assert attempts[0] - started >= 0.4
+
+
+def test_replay_without_failed_list(tmp_path):
+    spider = RobustImageSpider(tmp_path, use_journal=False)
+    assert spider.replay_failed() == 0
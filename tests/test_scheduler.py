@@ -0,0 +1,160 @@
+import threading
+import time
+
+from pippi_cancel import CancelToken
+from pippi_scheduler import HostScheduler, HostSlots
+
+
+def drain(scheduler):
+    order = []
+    while True:
+        task = scheduler.get(timeout=1)
+        if task is None:
+            return order
+        assert task is not False
+        order.append(task[1])
+        scheduler.done(task[1])
+
+
+def test_fifo_within_host():
+    scheduler = HostScheduler()
+    for i in range(3):
+        scheduler.put(i, f"http://a.com/{i}.jpg")
+    scheduler.close()
+    assert drain(scheduler) == [f"http://a.com/{i}.jpg" for i in range(3)]
+
+
+def test_hosts_take_turns():
+    scheduler = HostScheduler()
+    for url in ("http://a.com/1", "http://a.com/2", "http://b.com/1"):
+        scheduler.put(0, url)
+    scheduler.close()
+    assert drain(scheduler) == ["http://a.com/1", "http://b.com/1", "http://a.com/2"]
+
+
+def test_original_priority():
+    scheduler = HostScheduler(priority="original")
+    scheduler.put(1, "http://a.com/thumb/1.jpg")
+    scheduler.put(2, "http://a.com/full/2.jpg")
+    scheduler.close()
+    assert drain(scheduler) == ["http://a.com/full/2.jpg", "http://a.com/thumb/1.jpg"]
+
+
+def test_weights():
+    scheduler = HostScheduler(weights={"a.com": 2})
+    for url in ("http://a.com/1", "http://a.com/2", "http://a.com/3"):
+        scheduler.put(0, url)
+    scheduler.put(0, "http://b.com/1")
+    scheduler.close()
+    assert drain(scheduler) == [
+        "http://a.com/1",
+        "http://a.com/2",
+        "http://b.com/1",
+        "http://a.com/3",
+    ]
+
+
+def test_per_host_limit():
+    scheduler = HostScheduler(per_host_limit=1)
+    scheduler.put(1, "http://a.com/1")
+    scheduler.put(2, "http://a.com/2")
+    scheduler.put(3, "http://b.com/1")
+    first = scheduler.get(timeout=0.1)
+    assert first == (1, "http://a.com/1")
+    # a.com 的名额已用完，只能取 b.com
+    assert scheduler.get(timeout=0.1) == (3, "http://b.com/1")
+    assert scheduler.get(timeout=0.1) is False
+    scheduler.done("http://a.com/1")
+    assert scheduler.get(timeout=0.1) == (2, "http://a.com/2")
+
+
+def test_per_host_limit_two():
+    scheduler = HostScheduler(per_host_limit=2)
+    for i in range(3):
+        scheduler.put(i, f"http://a.com/{i}")
+    assert scheduler.get(timeout=0.1)
+    assert scheduler.get(timeout=0.1)
+    assert scheduler.get(timeout=0.1) is False
+
+
+def test_delayed_task():
+    scheduler = HostScheduler()
+    scheduler.put(1, "http://a.com/1", delay=0.3)
+    assert scheduler.pending() == 1
+    assert scheduler.get(timeout=0.05) is False
+    assert scheduler.get(timeout=1) == (1, "http://a.com/1")
+
+
+def test_hold_pauses_host_only():
+    scheduler = HostScheduler()
+    scheduler.put(1, "http://a.com/1")
+    scheduler.put(2, "http://b.com/1")
+    scheduler.hold("a.com", 0.3)
+    assert scheduler.get(timeout=0.05) == (2, "http://b.com/1")
+    scheduler.done("http://b.com/1")
+    assert scheduler.get(timeout=0.05) is False
+    started = time.time()
+    assert scheduler.get(timeout=1) == (1, "http://a.com/1")
+    assert time.time() - started >= 0.2
+
+
+def test_close_waits_for_active_tasks():
+    scheduler = HostScheduler()
+    scheduler.put(1, "http://a.com/1")
+    scheduler.close()
+    task = scheduler.get()
+    # 正在下载的任务可能失败后重新排队，所以还不能结束
+    assert scheduler.get(timeout=0.05) is False
+    scheduler.done(task[1])
+    assert scheduler.get(timeout=0.05) is None
+
+
+def test_cancel_wakes_waiting_get():
+    scheduler = HostScheduler()
+    scheduler.put(1, "http://a.com/1", delay=60)
+    result = []
+    t = threading.Thread(target=lambda: result.append(scheduler.get()))
+    t.start()
+    scheduler.cancel()
+    t.join(1)
+    assert result == [None]
+
+
+def test_host_slots_limit_across_threads():
+    slots = HostSlots(per_host_limit=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        for _ in range(5):
+            slots.acquire("a.com")
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.pop()
+            slots.release("a.com")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(peak) == 2
+    assert slots.active == {}
+
+
+def test_host_slots_hold_and_cancel():
+    slots = HostSlots()
+    slots.hold("a.com", 0.3)
+    started = time.time()
+    assert slots.acquire("a.com")
+    assert time.time() - started >= 0.2
+    slots.release("a.com")
+
+    slots.acquire("a.com")
+    token = CancelToken()
+    token.cancel()
+    assert not slots.acquire("a.com", token)
@@ -0,0 +1,158 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pippi_core import RobustImageSpider
+from pippi_retry import FATAL
+from pippi_watch import Watcher, Watchlist, parse_interval
+
+
+class Handler(BaseHTTPRequestHandler):
+    """返回 images 组成的页面，带 ETag 时支持条件请求"""
+
+    images = []
+    etag = None
+    status = 200
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        Handler.requests.append(dict(self.headers))
+        if Handler.etag and self.headers.get("If-None-Match") == Handler.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        if Handler.status != 200:
+            self.send_error(Handler.status)
+            return
+        body = "".join(f'<img src="/{name}">' for name in Handler.images)
+        body = f"<html><body>{body}</body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        if Handler.etag:
+            self.send_header("ETag", Handler.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    Handler.images, Handler.etag, Handler.requests = [], None, []
+    Handler.status = 200
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def watch(tmp_path, server):
+    """返回 (检查函数, 关注列表, 下载过的图片文件名)，fail 中的图片第一次下载失败"""
+    spider = RobustImageSpider(tmp_path, use_journal=False)
+    watchlist = Watchlist(tmp_path / ".pippi_watch.db")
+    watchlist.add(server + "/page")
+    watcher = Watcher(spider, watchlist)
+    downloaded = []
+    fail = set()
+
+    def attempt(url, index, group=None, filename=None):
+        name = url.rsplit("/", 1)[1]
+        downloaded.append(name)
+        if name in fail:
+            fail.discard(name)
+            return FATAL, ValueError("404")
+        return "done", None
+
+    spider._attempt_download = attempt
+
+    def check():
+        watcher.check(watchlist.sources()[0])
+        return watchlist.sources()[0]
+
+    yield check, watchlist, downloaded, fail
+    watchlist.close()
+
+
+def test_parse_interval():
+    assert parse_interval("90") == 90
+    assert parse_interval("30m") == 1800
+    assert parse_interval("2h") == 7200
+    assert parse_interval("1d") == 86400
+
+
+def test_only_new_images_downloaded(watch):
+    check, _, downloaded, _ = watch
+    Handler.images = ["1.jpg", "2.jpg"]
+    source = check()
+    assert sorted(downloaded) == ["1.jpg", "2.jpg"]
+    assert source["new_total"] == 2
+    assert source["next_check"] > source["last_checked"]
+
+    Handler.images = ["3.jpg", "1.jpg", "2.jpg"]
+    downloaded.clear()
+    source = check()
+    assert downloaded == ["3.jpg"]
+    assert source["new_total"] == 3
+
+
+def test_not_modified_skips_parsing(watch):
+    check, _, downloaded, _ = watch
+    Handler.images, Handler.etag = ["1.jpg"], '"v1"'
+    source = check()
+    assert source["etag"] == '"v1"'
+
+    downloaded.clear()
+    source = check()
+    assert Handler.requests[-1]["If-None-Match"] == '"v1"'
+    assert downloaded == []
+    assert source["etag"] == '"v1"'
+    assert source["failures"] == 0
+
+
+def test_same_fingerprint_skips_seen_lookup(watch):
+    check, watchlist, _, _ = watch
+    Handler.images = ["1.jpg", "2.jpg"]
+    fingerprint = check()["fingerprint"]
+
+    def unseen(source, images):
+        raise AssertionError("图片列表没有变化时不应查询已见过的图片")
+
+    watchlist.unseen = unseen
+    # 顺序变化不影响指纹
+    Handler.images = ["2.jpg", "1.jpg"]
+    assert check()["fingerprint"] == fingerprint
+
+
+def test_failed_images_retried_next_check(watch):
+    check, watchlist, downloaded, fail = watch
+    Handler.images, Handler.etag = ["1.jpg", "2.jpg"], '"v1"'
+    fail.add("2.jpg")
+    source = check()
+    assert sorted(downloaded) == ["1.jpg", "2.jpg"]
+    assert source["new_total"] == 1
+    # 有失败时不保存条件请求和指纹，下次完整检查
+    assert source["etag"] is None and source["fingerprint"] is None
+    base = source["url"].rsplit("/", 1)[0]
+    images = [f"{base}/{name}" for name in Handler.images]
+    assert watchlist.unseen(source["url"], images) == images[1:]
+
+    downloaded.clear()
+    source = check()
+    assert "If-None-Match" not in Handler.requests[-1]
+    assert downloaded == ["2.jpg"]
+    assert source["new_total"] == 2
+    assert source["etag"] == '"v1"'
+
+
+def test_fetch_error_backs_off(watch):
+    check, _, _, _ = watch
+    Handler.status = 500
+    source = check()
+    assert source["failures"] == 1
+    assert "500" in source["last_error"]
+    # 出错时较快重试
+    assert source["next_check"] - source["last_checked"] == pytest.approx(300)